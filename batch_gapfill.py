@@ -0,0 +1,422 @@
+from __future__ import print_function
+import argparse
+import multiprocessing
+import os
+import sys
+import model_seed_cache
+from gapfill_journal import GapfillJournal
+from likelihood_gapfill import build_draft_model
+from lp_backends import DEFAULT_BACKEND, parse_backend
+from parallel_gapfill import gapfill_media_condition
+from role_reaction_index import get_role_reaction_index
+from shared_universe import publish_reaction_universe
+from sparse_stoichiometry import get_reaction_universe, use_reaction_universe
+from worker_pool import run_tasks
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Columns of the genome manifest, in order
+MANIFEST_COLUMNS = ('genome', 'assigned_functions', 'close_roles',
+                    'genus_roles', 'probabilities', 'media')
+
+# Per-process gap-filling state, populated once in each worker by
+# _init_worker()
+_worker_state = {}
+
+
+
+
+def read_manifest(manifest_file):
+    """
+    Read the genome manifest.  The manifest is a tab-separated file with
+    one genome per line and the columns:
+        genome              a name for the genome, used for its output directory
+        assigned_functions  the RAST assigned functions file
+        close_roles         the roles present in RAST close genomes
+        genus_roles         the roles present in genomes from the same genus
+        probabilities       the reaction probabilities file
+        media               a file listing the media conditions to gap-fill on
+    Blank lines, lines starting with # and a header line starting with
+    "genome" are skipped.
+
+    :param manifest_file: Filepath to the manifest
+    :type manifest_file: string
+    :return: A list of dictionaries, one per genome, keyed by column name
+    :rtype: list
+    """
+    genomes = []
+    names = set()
+    with open(manifest_file, 'r') as fin:
+        for i, line in enumerate(fin):
+            line = line.strip()
+            if not line or line.startswith('#') or line.startswith('genome\t'):
+                continue
+            fields = line.split('\t')
+            if len(fields) != len(MANIFEST_COLUMNS):
+                raise ValueError("Line {} of {} has {} columns, expected {}"
+                                 .format(i + 1, manifest_file, len(fields),
+                                         len(MANIFEST_COLUMNS)))
+            genome = dict(zip(MANIFEST_COLUMNS, fields))
+            if genome['genome'] in names:
+                raise ValueError("Genome {} is in {} more than once"
+                                 .format(genome['genome'], manifest_file))
+            names.add(genome['genome'])
+            genomes.append(genome)
+    return genomes
+
+
+
+
+def read_media_list(media_file):
+    """
+    Read a list of media conditions, one per line.  Blank lines and lines
+    starting with # are skipped.
+
+    :param media_file: Filepath to the media list
+    :type media_file: string
+    :return: The media conditions
+    :rtype: set
+    """
+    media_conditions = set()
+    with open(media_file, 'r') as fin:
+        for line in fin:
+            if line.strip() and not line.startswith('#'):
+                media_conditions.add(line.strip())
+    if not media_conditions:
+        raise ValueError("{} does not list any media conditions".format(media_file))
+    return media_conditions
+
+
+
+
+def _init_worker(database, orgtype, universe, biomass_equation,
+                 essential_reactions, media_dir, minimal_stages, backend,
+                 verbose):
+    """
+    Initialize a gap-filling worker process with the Model SEED database.
+    Without a database, the worker loads the snapshot of the organism
+    type's database from disk and uses the reaction universe the parent
+    published in shared memory.  The draft model of each genome is built
+    by the worker from the genome's assigned functions.
+    """
+    if database is None:
+        compounds, reactions, enzymes =\
+            model_seed_cache.compounds_reactions_enzymes(orgtype, verbose=verbose)
+    else:
+        compounds, reactions = database
+    if universe is not None:
+        use_reaction_universe(reactions, universe)
+    _worker_state['compounds'] = compounds
+    _worker_state['reactions'] = reactions
+    _worker_state['orgtype'] = orgtype
+    _worker_state['role_index'] = get_role_reaction_index(orgtype)
+    _worker_state['drafts'] = {}
+    _worker_state['biomass_equation'] = biomass_equation
+    _worker_state['essential_reactions'] = essential_reactions
+    _worker_state['media_dir'] = media_dir
+    _worker_state['minimal_stages'] = minimal_stages
+    _worker_state['backend'] = backend
+    _worker_state['verbose'] = verbose
+
+
+
+
+def _genome_draft(name, genome):
+    """
+    The draft roles and reactions of a genome, built the first time one of
+    its media conditions is gap-filled in the current worker process.
+    """
+    drafts = _worker_state['drafts']
+    if name not in drafts:
+        drafts[name] = build_draft_model(genome['assigned_functions'],
+                                         _worker_state['orgtype'],
+                                         verbose=_worker_state['verbose'],
+                                         reactions=_worker_state['reactions'])
+    return drafts[name]
+
+
+
+
+def _gapfill_worker(task):
+    """
+    Gap-fill one genome on one media condition using the state of the
+    current worker process.  The genome's draft reactions are returned with
+    the result, so the parent can write them out with its results.
+    """
+    name, media_condition, genome = task
+    draft_roles, draft_reactions = _genome_draft(name, genome)
+    result = gapfill_media_condition(media_condition,
+                                     _worker_state['compounds'],
+                                     _worker_state['reactions'],
+                                     draft_reactions,
+                                     draft_roles,
+                                     _worker_state['biomass_equation'],
+                                     _worker_state['essential_reactions'],
+                                     genome['close_roles'],
+                                     genome['genus_roles'],
+                                     genome['probabilities'],
+                                     _worker_state['media_dir'],
+                                     profile_dir=genome['profile_dir'],
+                                     minimal_stages=_worker_state['minimal_stages'],
+                                     role_index=_worker_state['role_index'],
+                                     backend=_worker_state['backend'],
+                                     verbose=_worker_state['verbose'])
+    return (name, draft_reactions) + result
+
+
+
+
+def write_genome_results(genome_dir, draft_reactions, media_added_rxns):
+    """
+    Write the gap-filling results for one genome: the draft reactions, the
+    reactions added on each media condition, and every added reaction with
+    the media conditions it was added on.
+
+    :param genome_dir: The output directory for the genome
+    :type genome_dir: string
+    :param draft_reactions: The set of reaction ids from the draft model
+    :type draft_reactions: set
+    :param media_added_rxns: A dictionary of media condition to the set of
+        reactions added in gap-filling on that media
+    :type media_added_rxns: dict
+    """
+    with open(os.path.join(genome_dir, "draft_reactions.txt"), "w") as fout:
+        for rxn in sorted(draft_reactions):
+            fout.write(rxn + "\n")
+
+    gapfill_media_source = {}
+    for media_condition in sorted(media_added_rxns):
+        with open(os.path.join(genome_dir, "gapfill_reactions_" +
+                               media_condition + ".txt"), "w") as fout:
+            for rxn in sorted(media_added_rxns[media_condition]):
+                fout.write(rxn + "\n")
+                gapfill_media_source.setdefault(rxn, []).append(media_condition)
+
+    with open(os.path.join(genome_dir, "gapfill_added_reactions.txt"), "w") as fout:
+        for rxn in sorted(gapfill_media_source):
+            fout.write("{}\t{}\n".format(rxn, ",".join(gapfill_media_source[rxn])))
+
+
+
+
+def open_genomes(manifest_file, output_dir, profile=False, resume=False,
+                 overwrite=False):
+    """
+    Read the genome manifest and the media list of each genome, and open
+    the journal in each genome's directory in the output directory.
+
+    :param manifest_file: Filepath to the genome manifest (see read_manifest())
+    :type manifest_file: string
+    :param output_dir: Directory to write the per-genome results to
+    :type output_dir: string
+    :param profile: Profile each genome in the profile directory in its
+        directory
+    :type profile: bool
+    :param resume: Keep the media conditions already in each genome's journal
+    :type resume: bool
+    :param overwrite: Empty the journals that already have entries when not
+        resuming
+    :type overwrite: bool
+    :return: A dictionary of genome name to a dictionary with the manifest
+        columns, the set of media conditions ('media'), the profile
+        directory, the journal and the results of the media conditions
+        already in the journal ('results')
+    :rtype: dict
+    """
+    genomes = {}
+    for row in read_manifest(manifest_file):
+        name = row['genome']
+        genome_dir = os.path.join(output_dir, name)
+        if not os.path.isdir(genome_dir):
+            os.makedirs(genome_dir)
+        genome = dict(row)
+        genome['media'] = read_media_list(row['media'])
+        genome['profile_dir'] = os.path.join(genome_dir, "profile")\
+            if profile else None
+        genome['journal'] = GapfillJournal(os.path.join(genome_dir, "journal.jsonl"),
+                                           resume=resume, overwrite=overwrite)
+        genome['results'] = dict((m, rxns) for m, rxns in
+                                 genome['journal'].completed().items()
+                                 if m in genome['media'])
+        genomes[name] = genome
+    return genomes
+
+
+
+
+def gapfill_genomes(manifest_file, output_dir, media_dir, orgtype='gramnegative',
+                    processes=None, profile=False, minimal_stages=False,
+                    backend=None, resume=False, overwrite=False, verbose=False):
+    """
+    Gap-fill every genome in a manifest on each of its media conditions.
+
+    The Model SEED database is loaded once here and once in each of a
+    bounded pool of worker processes, from the snapshot on disk, and its
+    reaction universe is shared by the workers in shared memory.  Each work
+    unit is one genome on one media condition and carries the paths of that
+    genome's input files, so the pool stays busy regardless of how many
+    media each genome has.  The draft model of each genome is built from
+    its assigned functions, and its reaction probabilities are loaded, by
+    the workers that gap-fill it rather than by this process before any
+    worker starts.
+
+    Each genome gets a directory in the output directory with a journal of
+    the media conditions that have completed, so a resumed batch run picks
+    up where it stopped.  Without resuming, a journal that already has
+    entries is only emptied when overwriting, as the results in it may be
+    from different inputs.  When all of a genome's media conditions are
+    done its results are written by write_genome_results().
+
+    :param manifest_file: Filepath to the genome manifest (see
+        read_manifest()), or the genomes already opened by open_genomes()
+        for the same output directory, which are used as they are
+    :type manifest_file: string or dict
+    :param output_dir: Directory to write the per-genome results to
+    :type output_dir: string
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param processes: Number of worker processes (defaults to the number of CPUs)
+    :type processes: int
+    :param profile: Write a JSON profile of each genome and media condition
+        to the profile directory in the genome's directory
+    :type profile: bool
+    :param minimal_stages: Only suggest the reactions of the suggestion
+        stages that are needed for the model to grow
+    :type minimal_stages: bool
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param resume: Skip the media conditions already in each genome's journal
+    :type resume: bool
+    :param overwrite: Empty the journals that already have entries when not
+        resuming
+    :type overwrite: bool
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: A dictionary of genome name to a dictionary of media condition
+        to the set of reactions added in gap-filling
+    :rtype: dict
+    """
+    # The media lists are read and the journals opened before any work is
+    # done, so a journal that cannot be reused stops the run straight away
+    if isinstance(manifest_file, dict):
+        genomes = manifest_file
+    else:
+        genomes = open_genomes(manifest_file, output_dir, profile=profile,
+                               resume=resume, overwrite=overwrite)
+    print("{} genomes to gap-fill".format(len(genomes)))
+    results = dict((name, genome['results']) for name, genome in genomes.items())
+
+    # Load the Model SEED database once for all of the genomes
+    compounds, reactions, enzymes =\
+        model_seed_cache.compounds_reactions_enzymes(orgtype)
+    essential_reactions = PyFBA.gapfill.suggest_essential_reactions()
+    biomass_equation = PyFBA.metabolism.biomass_equation(orgtype)
+
+    tasks = []
+    for name, genome in genomes.items():
+        genome_dir = os.path.join(output_dir, name)
+        remaining = sorted(genome['media'] - set(results[name]))
+        # The results of a completed genome were written when its last
+        # media condition finished, unless the run stopped just before
+        if not remaining and not os.path.exists(
+                os.path.join(genome_dir, "gapfill_added_reactions.txt")):
+            draft_roles, draft_reactions =\
+                build_draft_model(genome['assigned_functions'], orgtype,
+                                  verbose=verbose, reactions=reactions)
+            write_genome_results(genome_dir, draft_reactions, results[name])
+        # Only the parts of the genome the workers need are sent with its tasks
+        task_genome = dict((k, genome[k]) for k in
+                           ('assigned_functions', 'close_roles', 'genus_roles',
+                            'probabilities', 'profile_dir'))
+        tasks.extend((name, m, task_genome) for m in remaining)
+    print("{} genome and media conditions to gap-fill".format(len(tasks)))
+    if not tasks:
+        return results
+
+    def record(name, draft_reactions, media_condition, added_reactions,
+               added_rxn_fluxes):
+        genomes[name]['journal'].record(media_condition, added_reactions,
+                                        added_rxn_fluxes)
+        results[name][media_condition] = added_reactions
+        print("{} reactions were added in gap-filling {} on {} media. ({}/{})"
+              .format(len(added_reactions), name, media_condition,
+                      len(results[name]), len(genomes[name]['media'])))
+        if len(results[name]) == len(genomes[name]['media']):
+            write_genome_results(os.path.join(output_dir, name),
+                                 draft_reactions, results[name])
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(tasks)))
+
+    worker_args = (biomass_equation, essential_reactions, media_dir,
+                   minimal_stages, backend, verbose)
+    if processes == 1:
+        for result in run_tasks(_gapfill_worker, tasks, _init_worker,
+                                ((compounds, reactions), orgtype, None) +
+                                worker_args, finalizer=_worker_state.clear):
+            record(*result)
+    else:
+        with publish_reaction_universe(get_reaction_universe(reactions)) as shared:
+            for result in run_tasks(_gapfill_worker, tasks, _init_worker,
+                                    (None, orgtype, shared) + worker_args,
+                                    processes, ordered=False):
+                record(*result)
+
+    return results
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run likelihood-based '
+                                     'gap-filling on every genome in a manifest')
+    parser.add_argument('manifest', help='Tab-separated genome manifest with the '
+                        'columns: ' + ', '.join(MANIFEST_COLUMNS))
+    parser.add_argument('output', help='Directory to write the per-genome results to')
+    parser.add_argument('media_dir', help='Directory containing the media files')
+    parser.add_argument('-o', '--orgtype', default='gramnegative',
+                        help='Organism type (default: gramnegative)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--profile', action='store_true',
+                        help='Write a JSON profile of the gap-filling stages on '
+                        'each media condition to <output>/<genome>/profile/')
+    parser.add_argument('--minimal-stages', action='store_true',
+                        help='Only use the reactions of the suggestion stages '
+                        'that are needed for growth in the likelihood '
+                        'optimization')
+    parser.add_argument('--backend', type=parse_backend, default=DEFAULT_BACKEND,
+                        help='LP backend and options for the growth tests, '
+                        'e.g. highs:threads=2, or auto for the fastest backend '
+                        'calibrated by benchmark_gapfill.py --calibrate; the '
+                        'likelihood LP is always solved by PyFBA '
+                        '(default: {})'.format(DEFAULT_BACKEND))
+    parser.add_argument('-r', '--resume', action='store_true',
+                        help='Skip the media conditions already in each '
+                        "genome's journal instead of starting new journals")
+    parser.add_argument('--overwrite', action='store_true',
+                        help='Empty the journals that already have entries '
+                        'when not resuming')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Verbose output')
+    args = parser.parse_args()
+
+    try:
+        genomes = open_genomes(args.manifest, args.output, profile=args.profile,
+                               resume=args.resume, overwrite=args.overwrite)
+    except ValueError as e:
+        parser.error(str(e))
+
+    gapfill_genomes(genomes, args.output, args.media_dir.rstrip('/') + '/',
+                    orgtype=args.orgtype, processes=args.processes,
+                    minimal_stages=args.minimal_stages, backend=args.backend,
+                    verbose=args.verbose)
+
+
+if __name__ == '__main__':
+    main()
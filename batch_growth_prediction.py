@@ -0,0 +1,156 @@
+from __future__ import print_function
+import multiprocessing
+import sys
+from incremental_fba import IncrementalFBA
+from shared_universe import publish_reaction_universe
+from sparse_stoichiometry import get_reaction_universe
+from worker_pool import run_tasks
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Per-process FBA model, built once in each worker by _init_worker()
+_worker_state = {}
+
+
+
+
+def _init_worker(compounds, reactions, reactions_to_run, biomass_equation,
+                 media_dir, universe=None, backend=None):
+    """
+    Build the FBA model for the reactions to run once in a worker process.
+    Without a reactions dictionary the model is built from the universe
+    alone.
+    """
+    if universe is None:
+        universe = get_reaction_universe(reactions)
+    fba = IncrementalFBA(compounds, reactions, set(), biomass_equation,
+                         universe=universe, backend=backend,
+                         n_reactions=len(reactions_to_run))
+    fba.add_reactions(reactions_to_run)
+    _worker_state['fba'] = fba
+    _worker_state['media_dir'] = media_dir
+
+
+
+
+def _close_worker():
+    """
+    Free the FBA model of an inline run.
+    """
+    _worker_state.pop('fba').close()
+    _worker_state.clear()
+
+
+
+
+def _predict_worker(media_condition):
+    """
+    Predict growth on a single media condition with the worker's model.
+    """
+    media = PyFBA.parse.read_media_file(_worker_state['media_dir'] +
+                                        media_condition + '.txt')
+    fba = _worker_state['fba']
+    fba.set_media(media)
+    status, value, growth = fba.solve()
+    return media_condition, value, growth
+
+
+
+
+def predict_growth(compounds, reactions, reactions_to_run, biomass_equation,
+                   media_conditions, media_dir, processes=1, backend=None,
+                   verbose=True):
+    """
+    Predict growth of a model on each of the media conditions.
+
+    The FBA model for the reactions to run is built once (once per worker
+    process when more than one process is used) and only the bounds of the
+    exchange and transport reactions, which depend on the media, are
+    changed from one media condition to the next.
+    Worker processes build their models from a copy of the stoichiometric
+    matrix in shared memory, so the reactions dictionary is never sent to
+    them.
+
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param reactions_to_run: The set of reaction ids in the model
+    :type reactions_to_run: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param media_conditions: The media conditions to predict growth on
+    :type media_conditions: set
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param processes: Number of worker processes
+    :type processes: int
+    :param backend: The LP backend, by name or as a (name, options) pair
+        (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: A dictionary of media condition to predicted growth (1 or 0)
+    :rtype: dict
+    """
+    media_conditions = sorted(media_conditions)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(media_conditions)))
+
+    chunksize = max(1, len(media_conditions) // (4 * processes))
+    if processes == 1:
+        results = list(run_tasks(_predict_worker, media_conditions, _init_worker,
+                                 (compounds, reactions, reactions_to_run,
+                                  biomass_equation, media_dir, None, backend),
+                                 finalizer=_close_worker))
+    else:
+        with publish_reaction_universe(get_reaction_universe(reactions)) as shared:
+            results = list(run_tasks(_predict_worker, media_conditions, _init_worker,
+                                     (None, None, reactions_to_run,
+                                      biomass_equation, media_dir, shared,
+                                      backend),
+                                     processes, chunksize))
+
+    fba_growth_results = {}
+    for media_condition, value, growth in results:
+        if verbose:
+            print("FBA run on {} media has a biomass flux value"
+                  " of {} --> Growth: {}".format(media_condition, value, growth))
+        fba_growth_results[media_condition] = int(growth)
+    return fba_growth_results
+
+
+
+
+def score_predictions(fba_growth_results, exp_growth_results):
+    """
+    Compare predicted growth to the experimental phenotypic growth data.
+
+    :param fba_growth_results: A dictionary of media condition to predicted
+        growth (1 or 0)
+    :type fba_growth_results: dict
+    :param exp_growth_results: A dictionary of media condition to observed
+        growth (1 or 0)
+    :type exp_growth_results: dict
+    :return: A dictionary with lists of the media that are true positives
+        ('tp'), true negatives ('tn'), false positives ('fp') and false
+        negatives ('fn')
+    :rtype: dict
+    """
+    results = {'tp': [], 'tn': [], 'fp': [], 'fn': []}
+    for media in sorted(fba_growth_results):
+        # Results in agrement (tp and tn)
+        if fba_growth_results[media] == exp_growth_results[media]:
+            if exp_growth_results[media] == 1:
+                results['tp'].append(media)
+            else:
+                results['tn'].append(media)
+        # Results that don't agree (fp and fn)
+        else:
+            if exp_growth_results[media] == 0:
+                results['fp'].append(media)
+            else:
+                results['fn'].append(media)
+    return results
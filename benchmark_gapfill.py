@@ -0,0 +1,425 @@
+from __future__ import print_function
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+from batch_growth_prediction import predict_growth
+from incremental_fba import calibrate_backends
+from kmer_role_scoring import write_reaction_probabilities
+from likelihood_gapfill import SuggestionStage, likelihood_gapfill_optimization,\
+    suggest_additional_reactions
+from lp_backends import DEFAULT_BACKEND, parse_backend
+from reaction_probabilities import load_reaction_probabilities
+from role_reaction_index import RoleReactionIndex
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# The benchmark steps, in the order they are run
+STEPS = ('suggest', 'likelihood', 'predict')
+
+# Default network sizes (number of reactions in the organism's network)
+DEFAULT_SCALES = (250, 1000, 4000)
+
+
+
+
+class SyntheticNetwork(object):
+    """
+    A random metabolic network with gaps, standing in for the Model SEED
+    database and a draft model.
+
+    The organism's network takes up nutrients through transport reactions
+    and builds every intracellular metabolite from a nutrient or from an
+    earlier metabolite, so the complete network always grows.  The biomass
+    reaction consumes a random set of precursor metabolites and, like
+    PyFBA's biomass equation, makes the Biomass compound.  The reactions
+    database also holds foreign reactions that the organism does not have.
+    The draft model is the organism's network with some of the reactions on
+    the paths to the biomass precursors, and some transporters, deleted.
+    """
+
+    def __init__(self, n_reactions, n_nutrients=10, n_precursors=20,
+                 n_deleted=None, reversible=0.3, seed=0):
+        """
+        :param n_reactions: Number of reactions in the organism's network
+        :type n_reactions: int
+        :param n_nutrients: Number of extracellular nutrients
+        :type n_nutrients: int
+        :param n_precursors: Number of metabolites consumed by the biomass reaction
+        :type n_precursors: int
+        :param n_deleted: Number of reactions deleted from the draft model
+            (defaults to 2% of the reactions)
+        :type n_deleted: int
+        :param reversible: Fraction of the reactions that are reversible
+        :type reversible: float
+        :param seed: Seed for the random number generator
+        :type seed: int
+        """
+        self.rng = random.Random(seed)
+        self.reversible = reversible
+        self.compounds = {}
+        self.reactions = {}
+        # The reaction each metabolite is built by, and its substrate
+        self.parent = {}
+
+        self.nutrients = [self._compound('nut{}'.format(i), 'e')
+                          for i in range(n_nutrients)]
+        # The transporter of each nutrient
+        self.transporters = {}
+        metabolites = []
+        for nutrient in self.nutrients:
+            inside = self._compound(nutrient.name, 'c')
+            self.transporters[nutrient.name] = self._reaction([nutrient], [inside],
+                                                              '>', transport=True)
+            metabolites.append(inside)
+
+        # The organism's network: every metabolite is built from an earlier
+        # one, and half of the reactions are cross links between metabolites
+        n_core = max(n_precursors, (n_reactions - n_nutrients) // 2)
+        for i in range(n_core):
+            metabolite = self._compound('met{}'.format(i), 'c')
+            substrate = self.rng.choice(metabolites)
+            self.parent[metabolite.name] = (self._reaction([substrate], [metabolite]),
+                                            substrate)
+            metabolites.append(metabolite)
+        self.organism = set(self.reactions)
+        while len(self.organism) < n_reactions:
+            self.organism.add(self._random_reaction(metabolites, metabolites))
+
+        # Foreign reactions, as many as the organism has
+        foreign = [self._compound('for{}'.format(i), 'c')
+                   for i in range(max(1, n_reactions // 4))]
+        for i in range(n_reactions):
+            self._random_reaction(metabolites + foreign, foreign + metabolites)
+
+        precursors = self.rng.sample(metabolites[n_nutrients:], n_precursors)
+        self.biomass_equation = PyFBA.metabolism.Reaction('BIOMASS_EQN')
+        self.biomass_equation.set_direction('>')
+        self.biomass_equation.add_left_compounds(set(precursors))
+        for c in precursors:
+            self.biomass_equation.set_left_compound_abundance(c, 1)
+        biomass = self._compound('Biomass', 'c')
+        self.biomass_equation.add_right_compounds(set([biomass]))
+        self.biomass_equation.set_right_compound_abundance(biomass, 1)
+
+        # Delete reactions on the paths to the precursors, and a few
+        # transporters, from the draft model
+        paths = set()
+        for c in precursors:
+            while c.name in self.parent:
+                rxn, c = self.parent[c.name]
+                paths.add(rxn)
+        if n_deleted is None:
+            n_deleted = max(1, n_reactions // 50)
+        self.deleted = set(self.rng.sample(sorted(paths), min(n_deleted,
+                                                              len(paths))))
+        self.deleted.update(self.rng.sample(sorted(self.transporters.values()),
+                                            max(1, n_nutrients // 5)))
+        self.draft_reactions = self.organism - self.deleted
+
+        # Every reaction gets a role of its own
+        self.role_index = RoleReactionIndex(dict(
+            (rxn, set(['Role of ' + rxn])) for rxn in self.reactions))
+        self.draft_roles = self.role_index.roles_for_reactions(self.draft_reactions)
+
+        # Reactions that were deleted from the organism are more likely
+        # than foreign reactions
+        self.probabilities = {}
+        for rxn in sorted(self.reactions):
+            if rxn in self.organism:
+                self.probabilities[rxn] = self.rng.uniform(0.5, 1.0)
+            else:
+                self.probabilities[rxn] = self.rng.uniform(0.0, 0.6)
+
+    def _compound(self, name, location):
+        compound = PyFBA.metabolism.Compound(name, location)
+        self.compounds['{}_{}'.format(name, location)] = compound
+        return compound
+
+    def _random_reaction(self, substrates, products):
+        left = self.rng.sample(substrates, 1 + (self.rng.random() < 0.3))
+        right = self.rng.choice(products)
+        while right in left:
+            right = self.rng.choice(products)
+        return self._reaction(left, [right])
+
+    def _reaction(self, left, right, direction=None, transport=False):
+        rxn = 'rxn{:05d}'.format(len(self.reactions))
+        if direction is None:
+            direction = '=' if self.rng.random() < self.reversible else '>'
+        reaction = PyFBA.metabolism.Reaction(rxn)
+        reaction.set_direction(direction)
+        reaction.add_left_compounds(set(left))
+        for c in left:
+            reaction.set_left_compound_abundance(c, 1)
+        reaction.add_right_compounds(set(right))
+        for c in right:
+            reaction.set_right_compound_abundance(c, 1)
+        reaction.is_transport = transport
+        self.reactions[rxn] = reaction
+        return rxn
+
+    def media(self, n_media):
+        """
+        Random media conditions, each with most of the nutrients.
+
+        :param n_media: Number of media conditions
+        :type n_media: int
+        :return: A dictionary of media condition to set of compounds
+        :rtype: dict
+        """
+        media = {}
+        for i in range(n_media):
+            k = self.rng.randint((3 * len(self.nutrients)) // 4, len(self.nutrients))
+            media['media{}'.format(i)] = set(self.rng.sample(self.nutrients, k))
+        return media
+
+    def suggestion_stages(self, n_decoys=None):
+        """
+        Suggestion stages that stand in for the PyFBA suggestion functions:
+        transporters for the media, then half of the deleted reactions, then
+        the rest of them.  Each of the last two stages also suggests decoy
+        reactions that the organism does not have.
+
+        :param n_decoys: Number of decoy reactions per stage (defaults to
+            five times the number of deleted reactions)
+        :type n_decoys: int
+        :return: The stages
+        :rtype: list of SuggestionStage
+        """
+        if n_decoys is None:
+            n_decoys = 5 * len(self.deleted)
+        foreign = sorted(set(self.reactions) - self.organism)
+        deleted = sorted(self.deleted - set(self.transporters.values()))
+        close = set(deleted[:len(deleted) // 2]) |\
+            set(self.rng.sample(foreign, min(n_decoys, len(foreign))))
+        genus = set(deleted) | set(self.rng.sample(foreign, min(n_decoys,
+                                                                len(foreign))))
+        transporters = self.transporters
+
+        def media_stage(compounds, reactions, reactions_to_run, media,
+                        close_roles_file, genus_roles_file):
+            return set(transporters[c.name] for c in media
+                       if transporters[c.name] not in reactions_to_run)
+
+        def close_stage(compounds, reactions, reactions_to_run, media,
+                        close_roles_file, genus_roles_file):
+            return close - reactions_to_run
+
+        def genus_stage(compounds, reactions, reactions_to_run, media,
+                        close_roles_file, genus_roles_file):
+            return genus - reactions_to_run
+
+        return [SuggestionStage('media', 'media', 'media_reactions',
+                                'reactions from media', media_stage),
+                SuggestionStage('close_genomes', 'close genomes', 'close_genomes',
+                                'reactions from close genomes', close_stage),
+                SuggestionStage('genus', 'genus_reactions', 'genus_reactions',
+                                'reactions from the same genus', genus_stage)]
+
+
+
+
+def write_media_file(media, filepath):
+    """
+    Write a media condition in the format read by PyFBA.parse.read_media_file().
+
+    :param media: A set of compounds
+    :type media: set
+    :param filepath: Filepath to write the media to
+    :type filepath: string
+    """
+    with open(filepath, 'w') as fout:
+        fout.write("Compound ID\tName\tFormula\tCharge\n")
+        for c in sorted(media, key=lambda c: c.name):
+            fout.write("{0}\t{0}\t\t0\n".format(c.name))
+
+
+
+
+def _timed(function, *args, **kwargs):
+    """Call a function and return its result and wall time"""
+    start = time.time()
+    result = function(*args, **kwargs)
+    return result, time.time() - start
+
+
+
+
+def benchmark_scale(n_reactions, work_dir, n_media=10, steps=STEPS, seed=0,
+                    minimal_stages=False, backend=None, calibrate=False,
+                    verbose=False):
+    """
+    Build a synthetic network and time the gap-filling steps on it.
+
+    :param n_reactions: Number of reactions in the organism's network
+    :type n_reactions: int
+    :param work_dir: Directory for the probabilities, media and cache files
+    :type work_dir: string
+    :param n_media: Number of media conditions to predict growth on
+    :type n_media: int
+    :param steps: The steps to time
+    :type steps: tuple
+    :param seed: Seed for the random number generator
+    :type seed: int
+    :param minimal_stages: Only suggest the reactions of the stages that
+        are needed for growth
+    :type minimal_stages: bool
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param calibrate: Also time each of the installed LP backends on the
+        gap-filled model, and record the fastest for the auto backend (see
+        incremental_fba.calibrate_backends())
+    :type calibrate: bool
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The sizes of the network and the wall time of each step
+    :rtype: dict
+    """
+    network, seconds = _timed(SyntheticNetwork, n_reactions, seed=seed)
+    result = {'scale': n_reactions,
+              'database_reactions': len(network.reactions),
+              'draft_reactions': len(network.draft_reactions),
+              'deleted_reactions': len(network.deleted),
+              'build_seconds': seconds}
+
+    media_dir = os.path.join(work_dir, 'media_{}'.format(n_reactions)) + '/'
+    if not os.path.isdir(media_dir):
+        os.makedirs(media_dir)
+    media = network.media(n_media)
+    for media_condition in media:
+        write_media_file(media[media_condition],
+                         media_dir + media_condition + '.txt')
+    # Gap-fill on a media condition with every nutrient
+    gapfill_media = set(network.nutrients)
+
+    suggested = network.deleted
+    if 'suggest' in steps:
+        (suggested, roles, source), seconds =\
+            _timed(suggest_additional_reactions, network.compounds,
+                   network.reactions, network.draft_reactions,
+                   network.draft_roles, gapfill_media,
+                   network.biomass_equation, None, None, verbose=verbose,
+                   stages=network.suggestion_stages(),
+                   role_index=network.role_index,
+                   minimal_stages=minimal_stages, backend=backend)
+        result['suggested_reactions'] = len(suggested)
+        result['suggest_seconds'] = seconds
+
+    added = network.deleted
+    if 'likelihood' in steps:
+        probabilities_file = os.path.join(work_dir, 'probabilities_{}.txt'
+                                          .format(n_reactions))
+        write_reaction_probabilities(network.probabilities, probabilities_file)
+        rxn_probs = load_reaction_probabilities(probabilities_file,
+                                                cache_dir=work_dir)
+        (added, fluxes), seconds =\
+            _timed(likelihood_gapfill_optimization, network.compounds,
+                   network.reactions, network.draft_reactions, suggested,
+                   network.biomass_equation, gapfill_media, rxn_probs, set(),
+                   verbose=verbose)
+        result['added_reactions'] = len(added)
+        result['likelihood_seconds'] = seconds
+
+    if 'predict' in steps:
+        growth, seconds =\
+            _timed(predict_growth, network.compounds, network.reactions,
+                   network.draft_reactions | set(added),
+                   network.biomass_equation, set(media), media_dir,
+                   backend=backend, verbose=verbose)
+        result['media'] = len(media)
+        result['growth_media'] = sum(growth.values())
+        result['predict_seconds'] = seconds
+
+    if calibrate:
+        timings = calibrate_backends(network.compounds, network.reactions,
+                                     network.draft_reactions | set(added),
+                                     network.biomass_equation,
+                                     [media[m] for m in sorted(media)])
+        for timing in timings:
+            del timing['growth']
+        result['calibration'] = timings
+
+    return result
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Time the gap-filling pipeline '
+                                     'on synthetic metabolic networks')
+    parser.add_argument('-s', '--scales', default=','.join(str(s) for s in DEFAULT_SCALES),
+                        help='Comma-separated network sizes in reactions '
+                        '(default: %(default)s)')
+    parser.add_argument('-m', '--media', type=int, default=10,
+                        help='Number of media conditions to predict growth on '
+                        '(default: %(default)s)')
+    parser.add_argument('--steps', default=','.join(STEPS),
+                        help='Comma-separated steps to time (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='Random seed (default: %(default)s)')
+    parser.add_argument('--minimal-stages', action='store_true',
+                        help='Only suggest the reactions of the stages that are '
+                        'needed for growth')
+    parser.add_argument('--backend', type=parse_backend, default=DEFAULT_BACKEND,
+                        help='LP backend and options for the growth tests, '
+                        'e.g. highs:threads=2, or auto for the fastest backend '
+                        'calibrated by benchmark_gapfill.py --calibrate; the '
+                        'likelihood LP is always solved by PyFBA '
+                        '(default: {})'.format(DEFAULT_BACKEND))
+    parser.add_argument('--calibrate', action='store_true',
+                        help='Also time each of the installed LP backends '
+                        'solving growth tests on the gap-filled model at each '
+                        'scale, and keep the fastest for --backend auto')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the results as JSON to this file')
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Verbose output')
+    args = parser.parse_args()
+
+    steps = tuple(s for s in args.steps.split(',') if s)
+    for step in steps:
+        if step not in STEPS:
+            parser.error("Unknown step {}; choose from {}".format(step,
+                                                                  ', '.join(STEPS)))
+
+    # Keep the probability stores and media files out of the user's cache
+    work_dir = tempfile.mkdtemp(prefix='gapfill_benchmark_')
+    results = []
+    try:
+        for scale in args.scales.split(','):
+            result = benchmark_scale(int(scale), work_dir, n_media=args.media,
+                                     steps=steps, seed=args.seed,
+                                     minimal_stages=args.minimal_stages,
+                                     backend=args.backend,
+                                     calibrate=args.calibrate,
+                                     verbose=args.verbose)
+            results.append(result)
+            print("{} reactions ({} in the database, {} deleted): ".format(
+                result['scale'], result['database_reactions'],
+                result['deleted_reactions']) +
+                ", ".join("{} {:.3f}s".format(step, result[step + '_seconds'])
+                          for step in steps))
+            for timing in result.get('calibration', []):
+                print("    {} {}: build {:.3f}s, solve {:.3f}s, {} iterations"
+                      .format(timing['backend'],
+                              ",".join("{}={}".format(k, v) for k, v in
+                                       sorted(timing['options'].items())),
+                              timing['build_seconds'], timing['solve_seconds'],
+                              timing['iterations']))
+    finally:
+        shutil.rmtree(work_dir)
+
+    if args.output is not None:
+        with open(args.output, 'w') as fout:
+            json.dump(results, fout, indent=1, sort_keys=True)
+
+
+if __name__ == '__main__':
+    main()
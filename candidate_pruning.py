@@ -0,0 +1,222 @@
+from __future__ import print_function
+from incremental_fba import media_compound_keys, reaction_flux_bounds, reaction_stoichiometry
+
+
+
+
+def _flux_signs(bounds):
+    """The signs of the fluxes allowed by the bounds of a reaction"""
+    signs = set()
+    if bounds[1] > 0:
+        signs.add(1)
+    if bounds[0] < 0:
+        signs.add(-1)
+    return signs
+
+
+
+
+def _canonical(stoichiometry, signs):
+    """
+    The orientation-independent form of a reaction: its stoichiometry
+    scaled so that the first compound has a positive coefficient, and the
+    flux signs it allows in that orientation.
+    """
+    items = sorted(stoichiometry.items())
+    if not items:
+        return (), frozenset(signs)
+    flip = -1 if items[0][1] < 0 else 1
+    return (tuple((k, flip * v) for k, v in items),
+            frozenset(flip * s for s in signs))
+
+
+
+
+def _remove_duplicates(reactions, original_reactions, candidates, media,
+                       rxn_probs, protected, split_from):
+    """
+    Remove candidates with the same stoichiometry as an original reaction or
+    as a better candidate, when that reaction already allows every direction
+    the candidate allows on the media.  Among candidates, the one with the
+    highest probability is preferred.
+    """
+    covered = {}
+    for rxn in original_reactions:
+        if rxn not in reactions:
+            continue
+        stoichiometry, signs = _canonical(
+            reaction_stoichiometry(reactions[rxn]),
+            _flux_signs(reaction_flux_bounds(reactions[rxn], media)))
+        covered.setdefault(stoichiometry, set()).update(signs)
+
+    def preference(rxn):
+        p = rxn_probs[rxn] if rxn_probs is not None and rxn in rxn_probs else 0.0
+        return (split_from.get(rxn, rxn) not in protected, -p, rxn)
+
+    kept = set()
+    duplicates = set()
+    for rxn in sorted(candidates, key=preference):
+        stoichiometry, signs = _canonical(
+            reaction_stoichiometry(reactions[rxn]),
+            _flux_signs(reaction_flux_bounds(reactions[rxn], media)))
+        have = covered.setdefault(stoichiometry, set())
+        if split_from.get(rxn, rxn) not in protected and signs <= have:
+            duplicates.add(rxn)
+            continue
+        have.update(signs)
+        kept.add(rxn)
+    return kept, duplicates
+
+
+
+
+def _remove_blocked(reactions, original_reactions, candidates, media,
+                    biomass_equation, protected, split_from):
+    """
+    Repeatedly remove candidates that use a dead-end compound: a compound
+    that no remaining reaction can produce, or that no remaining reaction
+    can consume.  Extracellular compounds can always be secreted, and
+    compounds in the media can always be taken up.  The two halves of a
+    split reaction count as one reaction, since together they can only
+    run as a futile cycle.
+    """
+    network = {}
+    for rxn in set(original_reactions) | set(candidates):
+        if rxn in reactions:
+            network[rxn] = (reaction_stoichiometry(reactions[rxn]),
+                            _flux_signs(reaction_flux_bounds(reactions[rxn], media)))
+    biomass = reaction_stoichiometry(biomass_equation)
+
+    # The reactions that can produce or consume each compound
+    producers = {}
+    consumers = {}
+    for rxn, (stoichiometry, signs) in network.items():
+        for key, coeff in stoichiometry.items():
+            for s in signs:
+                if coeff * s > 0:
+                    producers.setdefault(key, set()).add(rxn)
+                else:
+                    consumers.setdefault(key, set()).add(rxn)
+
+    def dead_end(key):
+        if key[1] == 'e':
+            # Exchange reactions secrete any extracellular compound and take
+            # up the compounds in the media
+            return key not in media and not producers.get(key)
+        p = producers.get(key, set())
+        c = consumers.get(key, set())
+        if key in biomass:
+            # The biomass reaction consumes its compounds and produces its
+            # products, and it is never removed
+            if biomass[key] < 0:
+                return not p
+            return not c
+        # A compound that is only produced and consumed by one reversible
+        # reaction cannot carry flux either
+        return not p or not c or\
+            len(set(split_from.get(r, r) for r in p | c)) < 2
+
+    blocked = set()
+    to_check = set(k for stoichiometry, signs in network.values()
+                   for k in stoichiometry)
+    while to_check:
+        newly_blocked = set()
+        for key in to_check:
+            if not dead_end(key):
+                continue
+            for rxn in producers.get(key, set()) | consumers.get(key, set()):
+                if rxn in candidates and rxn not in blocked and\
+                   split_from.get(rxn, rxn) not in protected:
+                    newly_blocked.add(rxn)
+        to_check = set()
+        for rxn in newly_blocked:
+            blocked.add(rxn)
+            for key in network[rxn][0]:
+                producers.get(key, set()).discard(rxn)
+                consumers.get(key, set()).discard(rxn)
+                to_check.add(key)
+    return set(candidates) - blocked, blocked
+
+
+
+
+def prune_candidates(reactions, original_reactions, candidate_reactions,
+                     media, biomass_equation, rxn_probs=None, protected=None,
+                     split_from=None, verbose=True):
+    """
+    Remove candidate gap-filling reactions that cannot contribute to a
+    gap-filling solution before the likelihood LP is built.
+
+    The candidates are expected to be the columns of the likelihood LP:
+    oriented to run left to right, with bidirectional reactions split into
+    two halves, and with the bounds the LP gives them.  The flux directions
+    every test below relies on come from those oriented reactions, so
+    pruning never removes a column the LP could use in a solution.
+
+    Candidates are removed when they:
+        - are not in the reactions dictionary
+        - duplicate an original reaction or a more probable candidate
+          (the same stoichiometry in either orientation, with no new
+          direction of flux)
+        - are blocked because they use a dead-end compound, i.e. a compound
+          that cannot be both produced and consumed by the original and
+          remaining candidate reactions, the exchange reactions and the
+          biomass reaction.  Removing a blocked reaction can create new dead
+          ends, so this is repeated until nothing changes.
+
+    The original reactions themselves are never removed.
+
+    :param reactions: The reactions the likelihood LP is built from, e.g.
+        the ReactionOverlay holding the oriented candidates
+    :type reactions: dict
+    :param original_reactions: The set of reaction ids from the draft model
+    :type original_reactions: set
+    :param candidate_reactions: The set of candidate gap-filling reaction ids
+    :type candidate_reactions: set
+    :param media: A set of compounds present in the media
+    :type media: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param rxn_probs: Reaction probabilities used to choose between duplicates
+    :type rxn_probs: dict
+    :param protected: Reactions that must not be removed (including both
+        halves of a protected reaction that was split)
+    :type protected: set
+    :param split_from: A dictionary of the halves of split reactions to the
+        reaction they were split from
+    :type split_from: dict
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The set of candidates that were kept, and a report of how many
+        candidates were removed
+    :rtype: (set, dict)
+    """
+    if protected is None:
+        protected = set()
+    if split_from is None:
+        split_from = {}
+    candidates = set(r for r in candidate_reactions
+                     if r not in original_reactions)
+    unknown = set(r for r in candidates if r not in reactions)
+    candidates -= unknown
+
+    media = media_compound_keys(media)
+    candidates, duplicates = _remove_duplicates(reactions, original_reactions,
+                                                candidates, media, rxn_probs,
+                                                protected, split_from)
+    candidates, blocked = _remove_blocked(reactions, original_reactions,
+                                          candidates, media, biomass_equation,
+                                          protected, split_from)
+
+    report = {'candidates': len(candidate_reactions),
+              'unknown': len(unknown),
+              'duplicates': len(duplicates),
+              'blocked': len(blocked),
+              'kept': len(candidates)}
+    if verbose:
+        print("Pruned {} of {} candidate columns ({} duplicated, {} blocked, "
+              "{} unknown) from the likelihood LP."
+              .format(report['candidates'] - report['kept'],
+                      report['candidates'], report['duplicates'],
+                      report['blocked'], report['unknown']))
+    return candidates, report
@@ -0,0 +1,197 @@
+from __future__ import print_function
+import numpy as np
+from incremental_fba import BIOMASS_REACTION, UPTAKE_SECRETION_PREFIX
+from reaction_overlay import ReactionView
+
+
+
+
+class FluxResult(object):
+    """
+    The fluxes of an FBA solution as a vector, with what each column is.
+
+    Every column has the index of the reaction it belongs to in base_ids,
+    the sign of its direction relative to that reaction (-1 for a reversed
+    reaction or the reverse half of a split reaction), and whether it is an
+    exchange reaction.  The biomass and exchange columns have no base
+    reaction (index -1).  Filtering the columns that carry flux and
+    collapsing split reactions back to their base reactions are then array
+    operations, and no reaction ids have to be parsed.
+    """
+
+    def __init__(self, names, fluxes, base_ids, base, sign, exchange):
+        """
+        :param names: The column names
+        :type names: list
+        :param fluxes: The flux of each column
+        :type fluxes: numpy.ndarray
+        :param base_ids: The reaction ids the columns belong to
+        :type base_ids: list
+        :param base: For each column, the index of its reaction in base_ids,
+            or -1 for the biomass and exchange columns
+        :type base: numpy.ndarray
+        :param sign: For each column, 1 if it runs in the direction of its
+            reaction and -1 if it runs in reverse
+        :type sign: numpy.ndarray
+        :param exchange: For each column, whether it is an exchange reaction
+        :type exchange: numpy.ndarray
+        """
+        self.names = list(names)
+        self.fluxes = np.asarray(fluxes, dtype=np.float64)
+        self.base_ids = np.array(base_ids, dtype=object)
+        self.base = np.asarray(base, dtype=np.int64)
+        self.sign = np.asarray(sign, dtype=np.int8)
+        self.exchange = np.asarray(exchange, dtype=bool)
+        self.biomass = self.names.index(BIOMASS_REACTION)\
+            if BIOMASS_REACTION in self.names else -1
+
+    @classmethod
+    def from_columns(cls, names, fluxes, reactions):
+        """
+        Describe the columns of a solution.  Columns whose reactions are
+        ReactionViews (reversed or split reactions in a ReactionOverlay) are
+        mapped back to the reactions they were made from.
+
+        :param names: The column names
+        :type names: list
+        :param fluxes: The flux of each column
+        :type fluxes: numpy.ndarray
+        :param reactions: The reactions dictionary the model was built from
+        :type reactions: dict
+        :rtype: FluxResult
+        """
+        base_ids = []
+        index = {}
+        base = np.full(len(names), -1, dtype=np.int64)
+        sign = np.ones(len(names), dtype=np.int8)
+        exchange = np.zeros(len(names), dtype=bool)
+        for j, name in enumerate(names):
+            if name == BIOMASS_REACTION:
+                continue
+            if name.startswith(UPTAKE_SECRETION_PREFIX):
+                exchange[j] = True
+                continue
+            reaction = reactions[name] if reactions is not None and\
+                name in reactions else None
+            if isinstance(reaction, ReactionView):
+                rxn = reaction.base.name
+                sign[j] = reaction.sign
+            else:
+                rxn = name
+            if rxn not in index:
+                index[rxn] = len(base_ids)
+                base_ids.append(rxn)
+            base[j] = index[rxn]
+        return cls(names, fluxes, base_ids, base, sign, exchange)
+
+    @classmethod
+    def from_fluxes(cls, reaction_flux, reactions):
+        """
+        Describe a dictionary of fluxes, e.g. from PyFBA.fba.reaction_fluxes().
+
+        :param reaction_flux: A dictionary of column name to flux
+        :type reaction_flux: dict
+        :param reactions: The reactions dictionary the model was built from
+        :type reactions: dict
+        :rtype: FluxResult
+        """
+        names = list(reaction_flux)
+        return cls.from_columns(names, np.array([reaction_flux[n] for n in names],
+                                                dtype=np.float64), reactions)
+
+    @property
+    def biomass_flux(self):
+        if self.biomass < 0:
+            return 0.0
+        return float(self.fluxes[self.biomass])
+
+    def active(self):
+        """
+        The reaction columns that carry flux, excluding the biomass and
+        exchange columns.
+
+        :return: A mask over the columns
+        :rtype: numpy.ndarray
+        """
+        return (self.fluxes != 0.0) & (self.base >= 0)
+
+    def in_reactions(self, reaction_ids):
+        """
+        The columns that belong to any of the reactions.
+
+        :param reaction_ids: The reaction ids
+        :type reaction_ids: set
+        :return: A mask over the columns
+        :rtype: numpy.ndarray
+        """
+        member = np.array([rxn in reaction_ids for rxn in self.base_ids],
+                          dtype=bool)
+        # Index -1 (no base reaction) picks the False appended at the end
+        return (self.base >= 0) & np.append(member, False)[self.base]
+
+    def _net_fluxes(self, mask):
+        """
+        The flux of each reaction in base_ids from its columns in the mask,
+        and a mask of the reactions that have a column in the mask.
+        """
+        mask = mask & (self.base >= 0)
+        n = len(self.base_ids)
+        # The net flux in the direction of the base reaction
+        flux = np.bincount(self.base[mask],
+                           weights=self.sign[mask] * self.fluxes[mask],
+                           minlength=n)
+        # A reaction whose only column is reversed reports its flux in the
+        # direction it was made to run
+        columns = self.base >= 0
+        forward = np.bincount(self.base[columns],
+                              weights=self.sign[columns] > 0, minlength=n) > 0
+        flux[~forward] = -flux[~forward]
+        present = np.bincount(self.base[mask], minlength=n) > 0
+        return flux, present
+
+    def reaction_fluxes(self, mask=None):
+        """
+        The flux of each reaction with a column in the mask.  A reversed
+        reaction reports its flux in the direction it was made to run, so
+        its flux has the same sign as its column.  The two halves of a split
+        reaction are collapsed into their net flux in the direction of the
+        reaction they were split from: the flux of the forward half minus
+        the flux of the reverse half.
+
+        :param mask: A mask over the columns (defaults to active())
+        :type mask: numpy.ndarray
+        :return: A dictionary of reaction id to flux
+        :rtype: dict
+        """
+        if mask is None:
+            mask = self.active()
+        flux, present = self._net_fluxes(mask)
+        return dict((self.base_ids[i], float(flux[i])) for i in np.flatnonzero(present))
+
+    def summarize(self, reaction_source, mask=None):
+        """
+        The number of reactions and the total absolute flux from each
+        source, with the fluxes of the reactions as in reaction_fluxes().
+
+        :param reaction_source: A dictionary of reaction id to source, e.g.
+            from suggest_additional_reactions().  Reactions without a source
+            are counted under 'other'.
+        :type reaction_source: dict
+        :param mask: A mask over the columns (defaults to active())
+        :type mask: numpy.ndarray
+        :return: A dictionary of source to a dictionary with the number of
+            reactions and their total absolute flux
+        :rtype: dict
+        """
+        if mask is None:
+            mask = self.active()
+        labels = sorted(set(reaction_source.get(r, 'other') for r in self.base_ids))
+        label_index = dict((s, i) for i, s in enumerate(labels))
+        base_label = np.array([label_index[reaction_source.get(r, 'other')]
+                               for r in self.base_ids], dtype=np.int64)
+        reaction_flux, used = self._net_fluxes(mask)
+        flux = np.bincount(base_label[used], weights=np.abs(reaction_flux[used]),
+                           minlength=len(labels))
+        count = np.bincount(base_label[used], minlength=len(labels))
+        return dict((s, {'reactions': int(count[i]), 'flux': float(flux[i])})
+                    for i, s in enumerate(labels) if count[i])
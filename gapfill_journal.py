@@ -0,0 +1,98 @@
+from __future__ import print_function
+import json
+import os
+import sys
+
+
+
+
+class GapfillJournal(object):
+    """
+    An append-only journal of per-media gap-filling results.
+
+    Each completed media condition is written as one JSON line and flushed
+    to disk straight away, so a run that is interrupted loses at most the
+    media conditions that were in progress.  A resumed run reads the
+    journal back to skip the media conditions that are already done and to
+    rebuild the aggregate results.
+    """
+
+    def __init__(self, path, resume=True, overwrite=False):
+        """
+        :param path: Filepath of the journal
+        :type path: string
+        :param resume: Keep the entries already in the journal
+        :type resume: bool
+        :param overwrite: Empty an existing journal when not resuming.  A
+            journal that already has entries is otherwise never emptied.
+        :type overwrite: bool
+        """
+        self.path = path
+        exists = os.path.exists(path) and os.path.getsize(path) > 0
+        if not resume and exists:
+            if not overwrite:
+                raise ValueError("Journal {} already has entries; resume it "
+                                 "or overwrite it explicitly".format(path))
+            open(path, 'w').close()
+        elif exists:
+            # Start a new line after a line that was only partly written
+            with open(path, 'rb+') as f:
+                f.seek(-1, os.SEEK_END)
+                if f.read(1) != b'\n':
+                    f.write(b'\n')
+
+    def record(self, media_condition, added_reactions, added_rxn_fluxes):
+        """
+        Append the result for a media condition to the journal.
+
+        :param media_condition: The media condition
+        :type media_condition: string
+        :param added_reactions: The set of reactions added in gap-filling
+        :type added_reactions: set
+        :param added_rxn_fluxes: A dictionary of fluxes for the added reactions
+        :type added_rxn_fluxes: dict
+        """
+        line = json.dumps({'media': media_condition,
+                           'added_reactions': sorted(added_reactions),
+                           'fluxes': added_rxn_fluxes}, sort_keys=True)
+        with open(self.path, 'a') as fout:
+            fout.write(line + '\n')
+            fout.flush()
+            os.fsync(fout.fileno())
+
+    def entries(self):
+        """
+        Stream the entries in the journal.  A final line that was only
+        partly written when a run was interrupted is ignored.
+
+        :return: A generator of (media condition, set of added reactions,
+            dictionary of fluxes) tuples
+        :rtype: generator
+        """
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r') as fin:
+            for i, line in enumerate(fin):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    print("Ignoring incomplete line {} of journal {}"
+                          .format(i + 1, self.path), file=sys.stderr)
+                    continue
+                yield (entry['media'], set(entry['added_reactions']),
+                       entry['fluxes'])
+
+    def completed(self):
+        """
+        The results of the media conditions already in the journal.  If a
+        media condition is in the journal more than once the last entry is
+        used.
+
+        :return: A dictionary of media condition to the set of reactions
+            added in gap-filling
+        :rtype: dict
+        """
+        return dict((media_condition, added_reactions) for
+                    media_condition, added_reactions, fluxes in self.entries())
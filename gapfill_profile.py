@@ -0,0 +1,111 @@
+from __future__ import print_function
+import contextlib
+import json
+import os
+import tempfile
+import time
+from incremental_fba import reaction_stoichiometry
+
+
+
+
+class GapfillProfile(object):
+    """
+    Timing and solver records for the stages of a gap-filling run.
+
+    Each stage adds one record: a dictionary with the name of the stage, its
+    wall time in seconds and whatever counts the stage reports, for example
+    the number of candidate reactions, the size of the LP and the number of
+    simplex iterations.  The records are written as JSON so the profiles of
+    many media conditions can be compared.
+    """
+
+    def __init__(self, **context):
+        """
+        :param context: Fields describing the run, e.g. the media condition,
+            that are written with the records
+        """
+        self.context = context
+        self.records = []
+        self.start = time.time()
+
+    @contextlib.contextmanager
+    def stage(self, name, **fields):
+        """
+        Time a stage.  The record is yielded so the stage can add its counts
+        to it, and it is added to the profile when the stage finishes.
+
+        :param name: The name of the stage
+        :type name: string
+        :param fields: Fields known at the start of the stage
+        """
+        record = {'stage': name}
+        record.update(fields)
+        start = time.time()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.time() - start
+            self.records.append(record)
+
+    def as_dict(self):
+        """
+        The profile as a dictionary that can be written as JSON.
+
+        :rtype: dict
+        """
+        profile = dict(self.context)
+        profile['seconds'] = time.time() - self.start
+        profile['stages'] = self.records
+        return profile
+
+    def write(self, path):
+        """
+        Write the profile to a JSON file.  The file is written to a temporary
+        file first and moved into place, so it is never left half written.
+
+        :param path: Filepath of the profile
+        :type path: string
+        """
+        directory = os.path.dirname(path) or '.'
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        fd, tmp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as fout:
+                json.dump(self.as_dict(), fout, indent=1, sort_keys=True)
+            os.replace(tmp, path)
+        except:
+            os.remove(tmp)
+            raise
+
+
+
+
+def lp_size(reactions, reactions_to_run, biomass_equation):
+    """
+    The size of the FBA linear program PyFBA builds for a set of reactions:
+    one row per compound, and one column per reaction, per extracellular
+    compound (the exchange reactions) and for the biomass reaction.
+
+    :param reactions: The dictionary of reactions
+    :type reactions: dict
+    :param reactions_to_run: The set of reaction ids in the model
+    :type reactions_to_run: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :return: A dictionary with the number of rows, columns and nonzeros
+    :rtype: dict
+    """
+    keys = set()
+    nonzeros = 0
+    columns = 0
+    for stoichiometry in [reaction_stoichiometry(reactions[r])
+                          for r in reactions_to_run if r in reactions] +\
+            [reaction_stoichiometry(biomass_equation)]:
+        keys.update(stoichiometry)
+        nonzeros += len(stoichiometry)
+        columns += 1
+    exchanges = sum(1 for k in keys if k[1] == 'e')
+    return {'rows': len(keys), 'columns': columns + exchanges,
+            'nonzeros': nonzeros + exchanges}
@@ -0,0 +1,612 @@
+from __future__ import print_function
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import parse_qs, urlparse
+except ImportError:
+    from BaseHTTPServer import BaseHTTPRequestHandler
+    from BaseHTTPServer import HTTPServer as ThreadingHTTPServer
+    from urlparse import parse_qs, urlparse
+import model_seed_cache
+from incremental_fba import IncrementalFBA
+from likelihood_gapfill import build_draft_model
+from lp_backends import DEFAULT_BACKEND, parse_backend
+from parallel_gapfill import gapfill_media_condition
+from reaction_probabilities import load_reaction_probabilities
+from role_reaction_index import get_role_reaction_index
+from sparse_stoichiometry import get_reaction_universe
+from suggestion_cache import cached_suggest_additional_reactions
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Per-process service state, populated once in each worker by
+# _init_worker() so jobs never reload the Model SEED database
+_worker_state = {}
+
+
+
+
+def _init_worker(compounds, reactions, biomass_equation, essential_reactions,
+                 defaults, data_dirs, backend, started, started_lock):
+    """
+    Initialize a service worker process with the warm Model SEED database.
+    Jobs report on the started connection when they begin to run.
+    """
+    _worker_state['compounds'] = compounds
+    _worker_state['reactions'] = reactions
+    _worker_state['biomass_equation'] = biomass_equation
+    _worker_state['essential_reactions'] = essential_reactions
+    _worker_state['defaults'] = defaults
+    _worker_state['data_dirs'] = [os.path.realpath(d) for d in data_dirs]
+    _worker_state['backend'] = backend
+    _worker_state['started'] = started
+    _worker_state['started_lock'] = started_lock
+    # The last model predicted on, reused while the reactions do not change
+    _worker_state['model'] = (None, None)
+
+
+
+
+def _param(params, name):
+    """A job parameter, falling back to the service default"""
+    value = params.get(name)
+    if value is None:
+        value = _worker_state['defaults'].get(name)
+    if value is None:
+        raise ValueError("The job needs a {} parameter".format(name))
+    return value
+
+
+
+
+def _data_file(params, name):
+    """
+    A file parameter of a job.  The service defaults are used as they are,
+    but a file named by the job must be inside one of the service's data
+    directories, so jobs cannot read arbitrary files.
+    """
+    if params.get(name) is None:
+        return _param(params, name)
+    path = os.path.realpath(params[name])
+    for data_dir in _worker_state['data_dirs']:
+        if os.path.commonpath([path, data_dir]) == data_dir:
+            return path
+    raise ValueError("The {} file {} is not in a data directory of the service"
+                     .format(name, params[name]))
+
+
+
+
+def _media_condition(media_condition):
+    """
+    Check a media condition names a file in the media directory rather than
+    a path outside it.
+    """
+    if not media_condition or '..' in media_condition or\
+            os.sep in media_condition or\
+            (os.altsep and os.altsep in media_condition):
+        raise ValueError("Invalid media condition {}".format(media_condition))
+    return media_condition
+
+
+
+
+def _role_index(params):
+    """The role/reaction index for the organism type of a job"""
+    return get_role_reaction_index(_param(params, 'orgtype'))
+
+
+
+
+def _draft_model(params):
+    """
+    The draft reactions and roles of a job: given as lists, or built from
+    an assigned functions file.
+    """
+    if params.get('assigned_functions') is not None:
+        return build_draft_model(_data_file(params, 'assigned_functions'),
+                                 _param(params, 'orgtype'), verbose=False,
+                                 reactions=_worker_state['reactions'])
+    roles = set(params.get('draft_roles', []))
+    if not roles:
+        roles = _role_index(params).roles_for_reactions(
+            params.get('draft_reactions', []))
+    return roles, set(_param(params, 'draft_reactions'))
+
+
+
+
+def _read_media(media_condition):
+    return PyFBA.parse.read_media_file(_param({}, 'media_dir') +
+                                       _media_condition(media_condition) + '.txt')
+
+
+
+
+def _suggest_job(params):
+    """
+    Suggest reactions for a draft model on a media condition.
+
+    Parameters: media, draft_reactions (and optionally draft_roles) or
+    assigned_functions, and optionally close_roles and genus_roles.
+    """
+    draft_roles, draft_reactions = _draft_model(params)
+    suggested_rxns, suggested_roles, source =\
+        cached_suggest_additional_reactions(_worker_state['compounds'],
+                                            _worker_state['reactions'],
+                                            draft_reactions, draft_roles,
+                                            _read_media(_param(params, 'media')),
+                                            _worker_state['biomass_equation'],
+                                            _data_file(params, 'close_roles'),
+                                            _data_file(params, 'genus_roles'),
+                                            verbose=False,
+                                            minimal_stages=bool(params.get('minimal_stages')),
+                                            role_index=_role_index(params),
+                                            backend=_worker_state['backend'])
+    return {'reactions': sorted(suggested_rxns),
+            'roles': sorted(suggested_roles),
+            'source': source}
+
+
+
+
+def _gapfill_job(params):
+    """
+    Run suggestion and likelihood gap-filling on a media condition.
+
+    Parameters: media, draft_reactions (and optionally draft_roles) or
+    assigned_functions, and optionally close_roles, genus_roles and
+    probabilities.
+    """
+    draft_roles, draft_reactions = _draft_model(params)
+    media_condition, added_reactions, added_rxn_fluxes =\
+        gapfill_media_condition(_media_condition(_param(params, 'media')),
+                                _worker_state['compounds'],
+                                _worker_state['reactions'],
+                                draft_reactions, draft_roles,
+                                _worker_state['biomass_equation'],
+                                _worker_state['essential_reactions'],
+                                _data_file(params, 'close_roles'),
+                                _data_file(params, 'genus_roles'),
+                                _data_file(params, 'probabilities'),
+                                _param({}, 'media_dir'),
+                                minimal_stages=bool(params.get('minimal_stages')),
+                                role_index=_role_index(params),
+                                backend=_worker_state['backend'], verbose=False)
+    return {'media': media_condition,
+            'added_reactions': sorted(added_reactions),
+            'fluxes': added_rxn_fluxes}
+
+
+
+
+def _predict_job(params):
+    """
+    Predict growth of a model on media conditions.  The worker keeps the
+    last model it built, so repeated queries on the same reactions only
+    change the media.
+
+    Parameters: reactions and media (a list of media conditions).
+    """
+    reactions_to_run = frozenset(_param(params, 'reactions'))
+    key, fba = _worker_state['model']
+    if key != reactions_to_run:
+        # Forget the old model before closing it, so a failure below never
+        # leaves a closed model to be reused by the next job
+        _worker_state['model'] = (None, None)
+        if fba is not None:
+            fba.close()
+        fba = IncrementalFBA(_worker_state['compounds'],
+                             _worker_state['reactions'], set(),
+                             _worker_state['biomass_equation'],
+                             universe=get_reaction_universe(_worker_state['reactions']),
+                             backend=_worker_state['backend'],
+                             n_reactions=len(reactions_to_run))
+        fba.add_reactions(reactions_to_run)
+        _worker_state['model'] = (reactions_to_run, fba)
+
+    growth = {}
+    media_conditions = _param(params, 'media')
+    if not isinstance(media_conditions, list):
+        media_conditions = [media_conditions]
+    for media_condition in media_conditions:
+        fba.set_media(_read_media(media_condition))
+        status, value, grows = fba.solve()
+        growth[media_condition] = {'status': status, 'biomass_flux': value,
+                                   'growth': int(grows)}
+    return {'growth': growth}
+
+
+
+
+# The jobs the service runs, by type
+JOB_TYPES = {'suggest': _suggest_job,
+             'gapfill': _gapfill_job,
+             'predict': _predict_job}
+
+
+
+
+def _run_job(job_id, job_type, params):
+    """
+    Run a job in a worker process.  Errors are returned rather than raised
+    so one bad job does not affect the others.
+    """
+    # Sent straight to the pipe, so the message is not lost if the job
+    # kills the worker
+    with _worker_state['started_lock']:
+        _worker_state['started'].send((job_id, os.getpid()))
+    start = time.time()
+    try:
+        result = JOB_TYPES[job_type](params)
+        return 'done', result, None, time.time() - start
+    except Exception as e:
+        return 'failed', None, "{}: {}".format(type(e).__name__, e),\
+            time.time() - start
+
+
+
+
+class JobQueue(object):
+    """
+    The jobs submitted to the service, run on a pool of worker processes
+    that hold the warm Model SEED database.
+
+    Jobs are submitted without waiting for them to finish.  Each job has an
+    id that is used to poll for its status and result, optionally waiting
+    up to a timeout for it to finish.  A job is 'queued' until a worker
+    picks it up, 'running' while the worker runs it, and then 'done' or
+    'failed'.  A job whose worker process exits while running it is failed.
+    """
+
+    def __init__(self, compounds, reactions, biomass_equation,
+                 essential_reactions, defaults, data_dirs=(), processes=None,
+                 backend=None):
+        """
+        :param compounds: The dictionary of compounds from the Model SEED database
+        :type compounds: dict
+        :param reactions: The dictionary of reactions from the Model SEED database
+        :type reactions: dict
+        :param biomass_equation: The biomass equation as a Reaction object
+        :type biomass_equation: metabolism.Reaction object
+        :param essential_reactions: The set of essential reactions
+        :type essential_reactions: set
+        :param defaults: Default job parameters, e.g. the media directory
+            and role files
+        :type defaults: dict
+        :param data_dirs: The directories jobs may name their own assigned
+            functions, role and probabilities files in; without any, jobs
+            can only use the defaults
+        :type data_dirs: list
+        :param processes: Number of worker processes (defaults to the number of CPUs)
+        :type processes: int
+        :param backend: The LP backend, by name or as a (name, options) pair
+            (see lp_backends.make_backend())
+        :type backend: string or tuple
+        """
+        if processes is None:
+            processes = multiprocessing.cpu_count()
+        self.started, started = multiprocessing.Pipe(duplex=False)
+        self.pool = multiprocessing.Pool(processes, initializer=_init_worker,
+                                         initargs=(compounds, reactions,
+                                                   biomass_equation,
+                                                   essential_reactions,
+                                                   defaults, list(data_dirs),
+                                                   backend, started,
+                                                   multiprocessing.Lock()))
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.finished = threading.Condition()
+        self.closing = threading.Event()
+        self.monitor = threading.Thread(target=self._monitor)
+        self.monitor.daemon = True
+        self.monitor.start()
+
+    def _monitor(self):
+        """
+        Mark jobs running as the workers start them, and fail the running
+        jobs whose worker process has exited, since the pool never returns
+        a result for them.
+        """
+        while not self.closing.is_set():
+            message = self.started.recv() if self.started.poll(1) else None
+            with self.finished:
+                if message is not None:
+                    job_id, pid = message
+                    job = self.jobs.get(job_id)
+                    # The job may already have finished if its result
+                    # arrived first
+                    if job is not None and job['status'] == 'queued':
+                        job.update({'status': 'running', 'started': time.time(),
+                                    'worker': pid})
+                        self.finished.notify_all()
+                alive = set(p.pid for p in multiprocessing.active_children())
+                for job in self.jobs.values():
+                    if job['status'] == 'running' and job['worker'] not in alive:
+                        job.update({'status': 'failed', 'result': None,
+                                    'error': 'The worker process running the '
+                                    'job exited',
+                                    'seconds': time.time() - job['started']})
+                        self.finished.notify_all()
+
+    def submit(self, job_type, params):
+        """
+        Queue a job.
+
+        :param job_type: The type of job, one of JOB_TYPES
+        :type job_type: string
+        :param params: The job parameters
+        :type params: dict
+        :return: The job id
+        :rtype: string
+        """
+        if job_type not in JOB_TYPES:
+            raise ValueError("Unknown job type {}, expected one of {}".format(
+                job_type, ", ".join(sorted(JOB_TYPES))))
+        with self.finished:
+            job_id = str(next(self.ids))
+            self.jobs[job_id] = {'id': job_id, 'type': job_type,
+                                 'status': 'queued', 'submitted': time.time()}
+
+        def done(outcome):
+            status, result, error, seconds = outcome
+            with self.finished:
+                self.jobs[job_id].update({'status': status, 'result': result,
+                                          'error': error, 'seconds': seconds})
+                self.finished.notify_all()
+
+        def failed(e):
+            # The job could not be sent to a worker or its result could not
+            # be sent back
+            with self.finished:
+                job = self.jobs[job_id]
+                job.update({'status': 'failed', 'result': None,
+                            'error': "{}: {}".format(type(e).__name__, e),
+                            'seconds': time.time() - job.get('started',
+                                                             job['submitted'])})
+                self.finished.notify_all()
+
+        self.pool.apply_async(_run_job, (job_id, job_type, params),
+                              callback=done, error_callback=failed)
+        return job_id
+
+    def get(self, job_id, wait=0):
+        """
+        The status of a job, and its result or error once it has finished.
+
+        :param job_id: The job id
+        :type job_id: string
+        :param wait: Seconds to wait for the job to finish
+        :type wait: float
+        :return: The job, or None if there is no job with the id
+        :rtype: dict
+        """
+        deadline = time.time() + wait
+        with self.finished:
+            while job_id in self.jobs and\
+                    self.jobs[job_id]['status'] in ('queued', 'running') and\
+                    time.time() < deadline:
+                self.finished.wait(deadline - time.time())
+            job = self.jobs.get(job_id)
+            return dict(job) if job is not None else None
+
+    def remove(self, job_id):
+        """
+        Forget a finished job.
+
+        :param job_id: The job id
+        :type job_id: string
+        :return: Whether the job was removed
+        :rtype: bool
+        """
+        with self.finished:
+            if job_id in self.jobs and\
+                    self.jobs[job_id]['status'] not in ('queued', 'running'):
+                del self.jobs[job_id]
+                return True
+            return False
+
+    def summary(self):
+        """The number of jobs in each state"""
+        with self.finished:
+            counts = {}
+            for job in self.jobs.values():
+                counts[job['status']] = counts.get(job['status'], 0) + 1
+            return counts
+
+    def close(self):
+        """Stop the worker processes"""
+        self.closing.set()
+        self.monitor.join()
+        self.pool.terminate()
+        self.pool.join()
+        self.started.close()
+
+
+
+
+class GapfillRequestHandler(BaseHTTPRequestHandler):
+    """
+    The HTTP interface to a JobQueue:
+        POST   /jobs           submit {"type": ..., "params": {...}}, returns the job id
+        GET    /jobs/<id>      the job; ?wait=<seconds> waits for it to finish
+        DELETE /jobs/<id>      forget a finished job
+        GET    /status         the number of jobs in each state
+    """
+
+    def _send(self, code, body):
+        data = json.dumps(body, sort_keys=True).encode('utf-8')
+        self.send_response(code)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _job_id(self, path):
+        parts = path.strip('/').split('/')
+        if len(parts) == 2 and parts[0] == 'jobs':
+            return parts[1]
+        return None
+
+    def do_POST(self):
+        if urlparse(self.path).path.rstrip('/') != '/jobs':
+            return self._send(404, {'error': 'Not found'})
+        try:
+            length = int(self.headers.get('Content-Length', 0))
+            request = json.loads(self.rfile.read(length).decode('utf-8'))
+            job_id = self.server.queue.submit(request.get('type'),
+                                              request.get('params', {}))
+        except ValueError as e:
+            return self._send(400, {'error': str(e)})
+        self._send(202, {'id': job_id})
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        if url.path.rstrip('/') == '/status':
+            return self._send(200, self.server.queue.summary())
+        job_id = self._job_id(url.path)
+        if job_id is None:
+            return self._send(404, {'error': 'Not found'})
+        try:
+            wait = float(parse_qs(url.query).get('wait', [0])[0])
+        except ValueError:
+            return self._send(400, {'error': 'wait must be a number of seconds'})
+        job = self.server.queue.get(job_id, wait=wait)
+        if job is None:
+            return self._send(404, {'error': 'No job {}'.format(job_id)})
+        self._send(200, job)
+
+    def do_DELETE(self):
+        job_id = self._job_id(urlparse(self.path).path)
+        if job_id is None or not self.server.queue.remove(job_id):
+            return self._send(404, {'error': 'No finished job {}'.format(job_id)})
+        self._send(200, {'id': job_id})
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            BaseHTTPRequestHandler.log_message(self, format, *args)
+
+
+
+
+def serve(host, port, orgtype='gramnegative', defaults=None, data_dirs=(),
+          processes=None, backend=None, verbose=False):
+    """
+    Load the Model SEED database once and serve gap-filling, suggestion and
+    growth prediction jobs over HTTP until interrupted.
+
+    :param host: The address to listen on; keep this on localhost, the
+        service has no authentication
+    :type host: string
+    :param port: The port to listen on
+    :type port: int
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param defaults: Default job parameters, e.g. the media directory and
+        role files
+    :type defaults: dict
+    :param data_dirs: The directories jobs may name their own assigned
+        functions, role and probabilities files in
+    :type data_dirs: list
+    :param processes: Number of worker processes (defaults to the number of CPUs)
+    :type processes: int
+    :param backend: The LP backend, by name or as a (name, options) pair
+        (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param verbose: Log every request
+    :type verbose: bool
+    """
+    defaults = dict(defaults or {})
+    defaults.setdefault('orgtype', orgtype)
+
+    # Load everything the jobs need before the workers are started, so the
+    # workers start warm
+    start = time.time()
+    compounds, reactions, enzymes =\
+        model_seed_cache.compounds_reactions_enzymes(orgtype)
+    essential_reactions = PyFBA.gapfill.suggest_essential_reactions()
+    biomass_equation = PyFBA.metabolism.biomass_equation(orgtype)
+    get_reaction_universe(reactions)
+    get_role_reaction_index(orgtype)
+    if defaults.get('probabilities') is not None:
+        defaults['probabilities'] =\
+            load_reaction_probabilities(defaults['probabilities'])
+    print("Loaded the Model SEED database in {:.1f}s".format(time.time() - start))
+
+    queue = JobQueue(compounds, reactions, biomass_equation,
+                     essential_reactions, defaults, data_dirs=data_dirs,
+                     processes=processes, backend=backend)
+    server = ThreadingHTTPServer((host, port), GapfillRequestHandler)
+    server.queue = queue
+    server.verbose = verbose
+    print("Serving gap-filling jobs on http://{}:{}/".format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        queue.close()
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve gap-filling, suggestion '
+                                     'and growth prediction jobs from a warm '
+                                     'Model SEED database')
+    parser.add_argument('--host', default='127.0.0.1',
+                        help='Address to listen on (default: 127.0.0.1)')
+    parser.add_argument('--port', type=int, default=8765,
+                        help='Port to listen on (default: 8765)')
+    parser.add_argument('-o', '--orgtype', default='gramnegative',
+                        help='Organism type (default: gramnegative)')
+    parser.add_argument('-m', '--media-dir',
+                        default='/Users/Taylor/gapfilling_metabolic_networks/PyFBA/media/',
+                        help='Directory containing the media files')
+    parser.add_argument('--close-roles',
+                        default='/Users/Taylor/gapfilling_metabolic_networks/PyFBA/'
+                        'example_data/Citrobacter/ungapfilled_model/closest.genomes.roles',
+                        help='Default roles present in RAST close genomes')
+    parser.add_argument('--genus-roles',
+                        default='/Users/Taylor/gapfilling_metabolic_networks/PyFBA/'
+                        'example_data/Citrobacter/ungapfilled_model/citrobacter.roles',
+                        help='Default roles present in genomes from the same genus')
+    parser.add_argument('--probabilities',
+                        default='/Users/Taylor/anthill_backup/backup_archive/'
+                        'genome_reaction_probabilities.txt',
+                        help='Default reaction probabilities file')
+    parser.add_argument('-d', '--data-dir', action='append', default=[],
+                        help='Directory jobs may name their own assigned '
+                        'functions, role and probabilities files in (may be '
+                        'repeated; without it jobs can only use the defaults)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('--backend', type=parse_backend, default=DEFAULT_BACKEND,
+                        help='LP backend and options for the growth tests, '
+                        'e.g. highs:threads=2, or auto for the fastest backend '
+                        'calibrated by benchmark_gapfill.py --calibrate; the '
+                        'likelihood LP is always solved by PyFBA '
+                        '(default: {})'.format(DEFAULT_BACKEND))
+    parser.add_argument('-v', '--verbose', action='store_true',
+                        help='Log every request')
+    args = parser.parse_args()
+
+    serve(args.host, args.port, orgtype=args.orgtype,
+          defaults={'media_dir': args.media_dir.rstrip('/') + '/',
+                    'close_roles': args.close_roles,
+                    'genus_roles': args.genus_roles,
+                    'probabilities': args.probabilities},
+          data_dirs=args.data_dir, processes=args.processes, backend=args.backend, verbose=args.verbose)
+
+
+if __name__ == '__main__':
+    main()
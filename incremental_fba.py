@@ -0,0 +1,521 @@
+from __future__ import print_function
+import sys
+import time
+from lp_backends import available_backends, make_backend, record_calibration,\
+    resolve_backend
+
+
+# Name of the biomass objective column and prefix of the exchange columns,
+# following the naming used by PyFBA.fba.run_fba
+BIOMASS_REACTION = 'BIOMASS_EQN'
+UPTAKE_SECRETION_PREFIX = 'UPTAKE_SECRETION_REACTION'
+
+# The compound produced by the biomass equation, which PyFBA secretes with
+# its own exchange reaction
+BIOMASS_COMPOUND = 'Biomass'
+
+# Flux bounds used by PyFBA.fba.reaction_bounds
+LOWER_BOUND = -1000.0
+MID_BOUND = 0.0
+UPPER_BOUND = 1000.0
+
+# The biomass flux above which the model is said to grow
+GROWTH_THRESHOLD = 1.0
+
+
+
+
+def compound_key(compound):
+    """
+    Key used to identify a compound (a metabolite in a compartment) in the
+    stoichiometric matrix.
+
+    :param compound: The compound
+    :type compound: metabolism.Compound object
+    :return: The compound name and location
+    :rtype: (string, string)
+    """
+    return compound.name, compound.location
+
+
+
+
+def reaction_stoichiometry(reaction):
+    """
+    The stoichiometric coefficients of a reaction.  Compounds consumed from
+    the left side have negative coefficients and compounds produced on the
+    right side have positive coefficients.
+
+    :param reaction: The reaction
+    :type reaction: metabolism.Reaction object
+    :return: A dictionary of compound key to stoichiometric coefficient
+    :rtype: dict
+    """
+    stoichiometry = {}
+    for c in reaction.left_compounds:
+        key = compound_key(c)
+        stoichiometry[key] = stoichiometry.get(key, 0.0) -\
+            float(reaction.get_left_compound_abundance(c))
+    for c in reaction.right_compounds:
+        key = compound_key(c)
+        stoichiometry[key] = stoichiometry.get(key, 0.0) +\
+            float(reaction.get_right_compound_abundance(c))
+    # Compounds that appear on both sides in the same amount do not take
+    # part in the mass balance
+    return dict((k, v) for k, v in stoichiometry.items() if v != 0.0)
+
+
+
+
+def is_media_dependent(reaction):
+    """
+    Whether the flux bounds of a reaction depend on the media.  As in
+    PyFBA.fba.reaction_bounds, these are the uptake and secretion and the
+    transport reactions whose bounds were not set explicitly.
+
+    :param reaction: The reaction
+    :type reaction: metabolism.Reaction object
+    :rtype: bool
+    """
+    if getattr(reaction, 'lower_bound', None) is not None and\
+       getattr(reaction, 'upper_bound', None) is not None:
+        return False
+    return bool(getattr(reaction, 'is_uptake_secretion', False) or
+                reaction.is_transport)
+
+
+
+
+def uptake_compound_keys(reaction):
+    """
+    The compound keys of the extracellular compounds on the left side of a
+    reaction, whose presence in the media decides the bounds of a
+    media-dependent reaction.
+
+    :param reaction: The reaction
+    :type reaction: metabolism.Reaction object
+    :return: The sorted compound keys
+    :rtype: tuple
+    """
+    return tuple(sorted(compound_key(c) for c in reaction.left_compounds
+                        if c.location == 'e'))
+
+
+
+
+def media_flux_bounds(uptake_keys, media):
+    """
+    The flux bounds of a media-dependent reaction, as set by
+    PyFBA.fba.reaction_bounds.  The reaction is reversible when all of its
+    extracellular left compounds (and at least one) are in the media, and
+    otherwise it can only run forwards.
+
+    :param uptake_keys: The keys of the extracellular left compounds
+    :type uptake_keys: tuple
+    :param media: The compound keys of the media
+    :type media: set
+    :return: The lower and upper flux bounds
+    :rtype: (float, float)
+    """
+    if uptake_keys and all(k in media for k in uptake_keys):
+        return LOWER_BOUND, UPPER_BOUND
+    return MID_BOUND, UPPER_BOUND
+
+
+
+
+def reaction_flux_bounds(reaction, media=frozenset()):
+    """
+    The flux bounds of a reaction, as set by PyFBA.fba.reaction_bounds.
+    Bounds that were set explicitly on the reaction take precedence, then
+    the bounds of media-dependent reactions are set by media_flux_bounds(),
+    and the bounds of any other reaction by its direction.  Reactions that
+    run right to left are left reversible, as PyFBA does.
+
+    :param reaction: The reaction
+    :type reaction: metabolism.Reaction object
+    :param media: The compound keys of the media (see media_compound_keys())
+    :type media: set
+    :return: The lower and upper flux bounds
+    :rtype: (float, float)
+    """
+    lower = getattr(reaction, 'lower_bound', None)
+    upper = getattr(reaction, 'upper_bound', None)
+    if lower is not None and upper is not None:
+        return float(lower), float(upper)
+    if is_media_dependent(reaction):
+        return media_flux_bounds(uptake_compound_keys(reaction), media)
+    if reaction.direction in ('=', '<'):
+        return LOWER_BOUND, UPPER_BOUND
+    return MID_BOUND, UPPER_BOUND
+
+
+
+
+def media_compound_keys(media):
+    """
+    The compound keys of the compounds in a media.
+
+    :param media: A set of compounds present in the media
+    :type media: set
+    :return: The set of compound keys
+    :rtype: set
+    """
+    return set(compound_key(c) for c in media)
+
+
+
+
+class IncrementalFBA(object):
+    """
+    An FBA model that is built once and grown in place.
+
+    PyFBA.fba.run_fba() builds the stoichiometric matrix and the linear
+    program from scratch on every call.  An IncrementalFBA session instead
+    keeps the linear program between solves: new reactions are appended as
+    columns (with rows for any new compounds and exchange columns for any
+    new extracellular compounds and for the biomass compound), and each
+    solve restarts the simplex from the basis of the previous solve.  The
+    LP is held by one of the backends in lp_backends, GLPK unless another
+    is chosen.  Growth is tested in the same way as run_fba(): the biomass
+    flux is maximized with the exchange reactions for the media compounds
+    open for uptake, all other exchange reactions only allowed to secrete,
+    and the transport reactions bounded by the media as
+    PyFBA.fba.reaction_bounds does.
+    """
+
+    def __init__(self, compounds, reactions, media, biomass_equation,
+                 universe=None, backend=None, n_reactions=None, verbose=False):
+        """
+        :param compounds: The dictionary of compounds from the Model SEED database
+        :type compounds: dict
+        :param reactions: The dictionary of reactions from the Model SEED
+            database.  This can be None when a universe is given, in which
+            case every reaction is taken from the universe.
+        :type reactions: dict
+        :param media: A set of compounds present in the media
+        :type media: set
+        :param biomass_equation: The biomass equation as a Reaction object
+        :type biomass_equation: metabolism.Reaction object
+        :param universe: The stoichiometric matrix of the reactions, used to
+            add reactions by column instead of from their Reaction objects
+        :type universe: sparse_stoichiometry.ReactionUniverse
+        :param backend: The LP backend, by name or as a (name, options)
+            pair (see lp_backends.make_backend()), or 'auto'
+        :type backend: string or tuple
+        :param n_reactions: The number of reactions the model will hold,
+            used to pick the fastest calibrated backend when the backend is
+            'auto' (see lp_backends.resolve_backend())
+        :type n_reactions: int
+        :param verbose: Verbose output
+        :type verbose: bool
+        """
+        self.compounds = compounds
+        self.reactions = reactions
+        self.universe = universe
+        self.media = media_compound_keys(media)
+        self.verbose = verbose
+
+        # Row and column indices are 1-based, as in the LP backends
+        self.row_index = {}
+        self.col_index = {}
+        self.col_names = [None]
+        self.col_bounds = [None]
+        self.disabled = set()
+        self.exchange_index = {}
+        self.missing = set()
+        # The extracellular left compounds of each media-dependent column,
+        # and the media-dependent columns of each compound
+        self.uptake_keys = {}
+        self.media_columns = {}
+
+        self.lp = make_backend(resolve_backend(backend, n_reactions))
+
+        self._add_columns([(BIOMASS_REACTION,
+                            reaction_stoichiometry(biomass_equation),
+                            (MID_BOUND, UPPER_BOUND), None)])
+        self.lp.set_objective(self.col_index[BIOMASS_REACTION], 1.0)
+
+    def __contains__(self, rxn):
+        return rxn in self.col_index
+
+    def __len__(self):
+        """The number of reaction columns, excluding biomass and exchanges"""
+        return len(self.col_index) - len(self.exchange_index) - 1
+
+    @property
+    def iterations(self):
+        """The number of simplex iterations of all of the solves"""
+        return self.lp.iterations
+
+    def size(self):
+        """
+        The size of the linear program.
+
+        :return: A dictionary with the number of rows, columns and nonzeros
+        :rtype: dict
+        """
+        return self.lp.size()
+
+    def _add_rows(self, keys):
+        """Add a steady-state row for each of the new compound keys"""
+        keys = [k for k in keys if k not in self.row_index]
+        if not keys:
+            return []
+        first = self.lp.add_rows(len(keys))
+        for i, key in enumerate(keys):
+            self.row_index[key] = first + i
+        return keys
+
+    def _add_columns(self, columns):
+        """
+        Add columns given as (name, stoichiometry, bounds, uptake keys)
+        tuples, adding rows and exchange columns for compounds that are new
+        to the model.  The uptake keys are None unless the bounds of the
+        column depend on the media.
+        """
+        new_keys = set()
+        for name, stoichiometry, bounds, uptake in columns:
+            new_keys.update(k for k in stoichiometry if k not in self.row_index)
+        new_keys = self._add_rows(sorted(new_keys))
+
+        exchanges = []
+        for key in new_keys:
+            if key[0] == BIOMASS_COMPOUND and key not in self.exchange_index:
+                # The biomass compound is only ever secreted
+                exchanges.append(('{} {}'.format(UPTAKE_SECRETION_PREFIX, key[0]),
+                                  {key: -1.0}, (MID_BOUND, UPPER_BOUND), None, key))
+            elif key[1] == 'e' and key not in self.exchange_index:
+                exchanges.append(('{} {}'.format(UPTAKE_SECRETION_PREFIX, key[0]),
+                                  {key: -1.0}, media_flux_bounds((key,), self.media),
+                                  (key,), key))
+
+        all_columns = [c + (None,) for c in columns] + exchanges
+        if not all_columns:
+            return
+        first = self.lp.add_columns(
+            [(dict((self.row_index[key], coeff) for key, coeff in
+                   stoichiometry.items()), float(bounds[0]), float(bounds[1]))
+             for name, stoichiometry, bounds, uptake, exchange in all_columns])
+        for i, (name, stoichiometry, bounds, uptake, exchange) in\
+                enumerate(all_columns):
+            j = first + i
+            self.col_index[name] = j
+            self.col_names.append(name)
+            self.col_bounds.append(bounds)
+            if exchange is not None:
+                self.exchange_index[exchange] = j
+            if uptake:
+                self.uptake_keys[j] = uptake
+                for key in uptake:
+                    self.media_columns.setdefault(key, set()).add(j)
+
+    def _set_col_bounds(self, j, bounds):
+        self.lp.set_col_bounds(j, float(bounds[0]), float(bounds[1]))
+
+    def add_reactions(self, reactions_to_add):
+        """
+        Add reactions to the model.  Reactions that are already in the model
+        are ignored, as are reactions that are not in the reactions
+        dictionary.
+
+        :param reactions_to_add: The reaction ids to add
+        :type reactions_to_add: set
+        :return: The set of reaction ids that were added to the model
+        :rtype: set
+        """
+        known = self.reactions if self.reactions is not None else\
+            self.universe.index
+        columns = []
+        for rxn in sorted(reactions_to_add):
+            if rxn in self.col_index:
+                continue
+            if rxn not in known:
+                if rxn not in self.missing and self.verbose:
+                    print("Reaction ID {}".format(rxn),
+                          "is not in our reactions list. Skipped", file=sys.stderr)
+                self.missing.add(rxn)
+                continue
+            if self.universe is not None and\
+               self.universe.is_current(rxn, self.reactions):
+                j = self.universe.index[rxn]
+                uptake = self.universe.uptake_keys(j)\
+                    if self.universe.media_dependent[j] else None
+                columns.append((rxn, self.universe.column(j),
+                                self.universe.flux_bounds(j, self.media), uptake))
+            else:
+                reaction = self.reactions[rxn]
+                uptake = uptake_compound_keys(reaction)\
+                    if is_media_dependent(reaction) else None
+                columns.append((rxn, reaction_stoichiometry(reaction),
+                                reaction_flux_bounds(reaction, self.media), uptake))
+        self._add_columns(columns)
+        return set(c[0] for c in columns)
+
+    def set_media(self, media):
+        """
+        Change the media the model is grown on.  Only the bounds of the
+        exchange columns and of the other media-dependent columns (the
+        transport reactions) change, so the matrix and the basis are kept.
+
+        :param media: A set of compounds present in the media
+        :type media: set
+        """
+        old_media = self.media
+        self.media = media_compound_keys(media)
+        changed = set()
+        for key in old_media.symmetric_difference(self.media):
+            changed.update(self.media_columns.get(key, ()))
+        for j in sorted(changed):
+            bounds = media_flux_bounds(self.uptake_keys[j], self.media)
+            if bounds == self.col_bounds[j]:
+                continue
+            self.col_bounds[j] = bounds
+            # A disabled reaction gets its new bounds when it is enabled
+            if self.col_names[j] not in self.disabled:
+                self._set_col_bounds(j, bounds)
+
+    def disable_reactions(self, reaction_ids):
+        """
+        Switch reactions off by fixing their flux at zero.  The columns stay
+        in the model, so they can be switched back on with
+        enable_reactions() without rebuilding anything.
+
+        :param reaction_ids: The reaction ids to disable
+        :type reaction_ids: set
+        """
+        for rxn in reaction_ids:
+            if rxn in self.col_index and rxn not in self.disabled:
+                self.disabled.add(rxn)
+                self._set_col_bounds(self.col_index[rxn], (0.0, 0.0))
+
+    def enable_reactions(self, reaction_ids):
+        """
+        Switch reactions that were disabled back on with their own bounds.
+
+        :param reaction_ids: The reaction ids to enable
+        :type reaction_ids: set
+        """
+        for rxn in reaction_ids:
+            if rxn in self.disabled:
+                self.disabled.discard(rxn)
+                j = self.col_index[rxn]
+                self._set_col_bounds(j, self.col_bounds[j])
+
+    def solve(self):
+        """
+        Maximize the biomass flux, starting from the basis of the previous
+        solve when there is one.
+
+        :return: The status of the solve, the biomass flux, and whether the
+            model grows
+        :rtype: (string, float, bool)
+        """
+        status = self.lp.solve()
+        if status != 'optimal':
+            return status, 0.0, False
+        value = self.lp.objective_value()
+        return status, value, value > GROWTH_THRESHOLD
+
+    def reaction_fluxes(self):
+        """
+        The fluxes of all of the columns from the last solve.
+
+        :return: A dictionary of reaction id to flux
+        :rtype: dict
+        """
+        values = self.lp.column_values()
+        return dict((self.col_names[j], float(values[j - 1]))
+                    for j in range(1, len(self.col_names)))
+
+    def close(self):
+        """Free the LP"""
+        if self.lp is not None:
+            self.lp.close()
+            self.lp = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+
+# The backend configurations tried by calibrate_backends()
+CALIBRATION_BACKENDS = [('glpk', {'method': 'dual'}),
+                        ('glpk', {'method': 'primal'}),
+                        ('highs', {'method': 'dual'}),
+                        ('highs', {'method': 'primal'}),
+                        ('highs', {'method': 'ipm'})]
+
+
+
+
+def calibrate_backends(compounds, reactions, reactions_to_run, biomass_equation,
+                       media_conditions, backends=None, universe=None,
+                       record=True, cache_dir=None):
+    """
+    Time the LP backends on a model: build an IncrementalFBA session for the
+    reactions with each backend and solve it on each of the media, as
+    predicting growth does.  The fastest backend for a model of this size
+    is the first one returned, and is recorded for the 'auto' backend to
+    use on models of a similar size (see lp_backends.resolve_backend()).  Only the growth tests run on these
+    backends: the likelihood LP is built and solved by PyFBA.fba.run_fba
+    whichever backend is chosen, so it is not timed here.
+
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param reactions_to_run: The set of reaction ids in the model
+    :type reactions_to_run: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param media_conditions: The media to solve on, as sets of compounds
+    :type media_conditions: list
+    :param backends: The backends to try, as (name, options) pairs
+        (defaults to the installed backends in CALIBRATION_BACKENDS)
+    :type backends: list
+    :param universe: The stoichiometric matrix of the reactions
+    :type universe: sparse_stoichiometry.ReactionUniverse
+    :param record: Record the fastest backend for this size of model
+    :type record: bool
+    :param cache_dir: The cache directory the calibration is recorded in
+        (defaults to model_seed_cache.cache_directory())
+    :type cache_dir: string
+    :return: A list of dictionaries with the backend, its options, the
+        build and solve times, the simplex iterations, the size of the LP
+        and the growth on each media, fastest first
+    :rtype: list
+    """
+    if backends is None:
+        installed = available_backends()
+        backends = [b for b in CALIBRATION_BACKENDS if b[0] in installed]
+    timings = []
+    for name, options in backends:
+        start = time.time()
+        with IncrementalFBA(compounds, reactions, set(), biomass_equation,
+                            universe=universe, backend=(name, options)) as fba:
+            fba.add_reactions(reactions_to_run)
+            build_seconds = time.time() - start
+            start = time.time()
+            growth = []
+            for media in media_conditions:
+                fba.set_media(media)
+                growth.append(fba.solve()[2])
+            timing = {'backend': name, 'options': options,
+                      'build_seconds': build_seconds,
+                      'solve_seconds': time.time() - start,
+                      'iterations': fba.iterations,
+                      'growth': growth}
+            timing.update(fba.size())
+        timing['seconds'] = timing['build_seconds'] + timing['solve_seconds']
+        timings.append(timing)
+    timings.sort(key=lambda t: t['seconds'])
+    if record and timings:
+        record_calibration(len(reactions_to_run),
+                           (timings[0]['backend'], timings[0]['options']),
+                           cache_dir)
+    return timings
@@ -0,0 +1,345 @@
+from __future__ import print_function
+import argparse
+import itertools
+import json
+import os
+import sys
+import numpy as np
+
+
+# Version of the on-disk layout written by build_kmer_database()
+FORMAT_VERSION = 1
+
+# Amino acid alphabet.  Each residue is packed into 5 bits, so k-mers of up
+# to 12 residues fit in a uint64.  Residues that are not in the alphabet get
+# the INVALID code and any k-mer containing one is never looked up.
+ALPHABET = 'ACDEFGHIKLMNPQRSTVWYBZUO'
+BITS_PER_RESIDUE = 5
+MAX_K = 64 // BITS_PER_RESIDUE
+INVALID = (1 << BITS_PER_RESIDUE) - 1
+
+# Number of lines of the tab-separated database encoded at a time by
+# build_kmer_database()
+CHUNK_LINES = 1 << 20
+
+# Lookup table from ASCII byte to residue code
+_CODES = np.full(256, INVALID, dtype=np.uint64)
+for _i, _aa in enumerate(ALPHABET):
+    _CODES[ord(_aa)] = _i
+    _CODES[ord(_aa.lower())] = _i
+
+
+
+
+def load_role_kmers(kmer_file, verbose=True):
+    """
+    Load a SEED functional role k-mer database.
+
+    The database is a tab-separated file with a k-mer and the functional
+    role it is a signature of on each line.  All of the k-mers must have the
+    same length.  A k-mer listed for more than one role is not a signature
+    of either of them and is dropped.
+
+    :param kmer_file: Filepath to the role k-mer database
+    :type kmer_file: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The k-mer length, the list of roles, and a dictionary of
+        k-mer to the index of its role in the list of roles
+    :rtype: (int, list, dict)
+    """
+    k = None
+    roles = []
+    role_index = {}
+    kmers = {}
+    ambiguous = set()
+    with open(kmer_file, 'r') as fin:
+        for i, line in enumerate(fin):
+            if not line.strip() or line.startswith('#'):
+                continue
+            kmer, role = line.rstrip('\n').split('\t')
+            kmer = kmer.upper()
+            if k is None:
+                k = len(kmer)
+            elif len(kmer) != k:
+                raise ValueError("k-mer {} on line {} of {} is not {} residues long"
+                                 .format(kmer, i + 1, kmer_file, k))
+            if role not in role_index:
+                role_index[role] = len(roles)
+                roles.append(role)
+            r = role_index[role]
+            if kmer in kmers and kmers[kmer] != r:
+                ambiguous.add(kmer)
+            kmers[kmer] = r
+    for kmer in ambiguous:
+        del kmers[kmer]
+    if ambiguous and verbose:
+        print("{} k-mers shared by more than one role were dropped"
+              .format(len(ambiguous)), file=sys.stderr)
+    return k, roles, kmers
+
+
+
+
+def encode_kmers(seq, k):
+    """
+    Encode every k-mer of a protein sequence as a packed integer.
+
+    :param seq: The protein sequence
+    :type seq: string
+    :param k: The k-mer length
+    :type k: int
+    :return: The packed k-mers, in sequence order, and a mask that is False
+        for k-mers containing a residue outside the alphabet
+    :rtype: (numpy.ndarray, numpy.ndarray)
+    """
+    codes = _CODES[np.frombuffer(seq.encode('ascii', 'replace'), dtype=np.uint8)]
+    n = len(codes) - k + 1
+    if n <= 0:
+        return np.empty(0, dtype=np.uint64), np.empty(0, dtype=bool)
+    return _pack([codes[i:i + n] for i in range(k)])
+
+
+
+
+def _pack(columns):
+    """Pack the residue codes of each position of a set of k-mers"""
+    packed = np.zeros(len(columns[0]), dtype=np.uint64)
+    valid = np.ones(len(columns[0]), dtype=bool)
+    shift = np.uint64(BITS_PER_RESIDUE)
+    for column in columns:
+        packed = (packed << shift) | column
+        valid &= column != INVALID
+    return packed, valid
+
+
+
+
+def _read_chunks(kmer_file, chunk_lines):
+    """
+    Read a tab-separated role k-mer database a chunk of lines at a time.
+
+    :return: A generator of (list of k-mers as bytes, list of roles) for
+        each chunk
+    :rtype: generator
+    """
+    with open(kmer_file, 'rb') as fin:
+        while True:
+            lines = list(itertools.islice(fin, chunk_lines))
+            if not lines:
+                return
+            fields = [line.rstrip(b'\n').split(b'\t') for line in lines
+                      if line.strip() and not line.startswith(b'#')]
+            for f in fields:
+                if len(f) != 2:
+                    raise ValueError("{} has a line that is not a k-mer and a role: {}"
+                                     .format(kmer_file, b'\t'.join(f).decode('utf-8')))
+            if fields:
+                yield [f[0] for f in fields], [f[1].decode('utf-8') for f in fields]
+
+
+
+
+class KmerDatabase(object):
+    """
+    A role k-mer database stored as sorted packed k-mers.
+
+    The database directory holds the sorted uint64 k-mers (kmers.npy), the
+    index of the role each k-mer is a signature of (roles.npy), the role
+    names (roles.txt), and the k-mer length (meta.json).  The arrays are
+    memory-mapped rather than read, so opening the database costs almost
+    nothing and every process that opens it on a node shares the same pages
+    in the operating system's page cache.
+    """
+
+    def __init__(self, path):
+        """
+        :param path: The database directory written by build_kmer_database()
+        :type path: string
+        """
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), 'r') as fin:
+            meta = json.load(fin)
+        if meta.get('version') != FORMAT_VERSION:
+            raise ValueError("{} is not a version {} k-mer database"
+                             .format(path, FORMAT_VERSION))
+        self.k = meta['k']
+        with open(os.path.join(path, 'roles.txt'), 'r') as fin:
+            self.roles = [line.rstrip('\n') for line in fin]
+        self.kmers = np.load(os.path.join(path, 'kmers.npy'), mmap_mode='r')
+        self.role_ids = np.load(os.path.join(path, 'roles.npy'), mmap_mode='r')
+
+    def __len__(self):
+        return int(self.kmers.size)
+
+    def __reduce__(self):
+        # Other processes reopen the memory-mapped files instead of
+        # receiving a copy of the arrays
+        return (KmerDatabase, (self.path,))
+
+    def lookup(self, packed):
+        """
+        Find the roles of packed k-mers.
+
+        :param packed: Packed k-mers
+        :type packed: numpy.ndarray
+        :return: The role index of each k-mer, or -1 for k-mers that are not
+            in the database
+        :rtype: numpy.ndarray
+        """
+        role_ids = np.full(len(packed), -1, dtype=np.int64)
+        if not self.kmers.size or not len(packed):
+            return role_ids
+        idx = np.searchsorted(self.kmers, packed)
+        idx[idx == self.kmers.size] = 0
+        found = self.kmers[idx] == packed
+        role_ids[found] = self.role_ids[idx[found]]
+        return role_ids
+
+    def contains(self, packed):
+        """
+        Test whether packed k-mers are in the database.
+
+        :param packed: Packed k-mers
+        :type packed: numpy.ndarray
+        :return: A boolean mask of the k-mers found in the database
+        :rtype: numpy.ndarray
+        """
+        return self.lookup(packed) >= 0
+
+    def sequence_roles(self, seq):
+        """
+        Find the roles of every k-mer of a protein sequence.
+
+        :param seq: The protein sequence
+        :type seq: string
+        :return: The role index of each k-mer, or -1 for k-mers that are not
+            in the database
+        :rtype: numpy.ndarray
+        """
+        packed, valid = encode_kmers(seq, self.k)
+        role_ids = self.lookup(packed)
+        role_ids[~valid] = -1
+        return role_ids
+
+
+
+
+def build_kmer_database(kmer_file, path, chunk_lines=CHUNK_LINES, verbose=True):
+    """
+    Convert a tab-separated role k-mer database into the packed format read
+    by KmerDatabase.
+
+    The file is streamed a chunk of lines at a time.  The k-mers of each
+    chunk are encoded in one pass over a block of fixed-width k-mers and
+    sorted, so only the packed k-mers and their role ids are held in
+    memory.  The sorted runs are then merged, and k-mers listed for more
+    than one role are found as adjacent rows with the same k-mer and
+    different roles, and dropped.
+
+    :param kmer_file: Filepath to the tab-separated role k-mer database
+    :type kmer_file: string
+    :param path: The database directory to write
+    :type path: string
+    :param chunk_lines: The number of lines to encode at a time
+    :type chunk_lines: int
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The packed database
+    :rtype: KmerDatabase
+    """
+    k = None
+    roles = []
+    role_index = {}
+    runs = []
+    skipped = 0
+    for kmers, chunk_roles in _read_chunks(kmer_file, chunk_lines):
+        block = np.array(kmers, dtype=bytes)
+        if k is None:
+            k = len(kmers[0])
+            if k > MAX_K:
+                raise ValueError("{}-mers do not fit in {} bits per residue; the "
+                                 "maximum k is {}".format(k, BITS_PER_RESIDUE, MAX_K))
+        wrong = np.flatnonzero(np.char.str_len(block) != k)
+        if len(wrong):
+            raise ValueError("k-mer {} in {} is not {} residues long"
+                             .format(kmers[wrong[0]].decode('ascii', 'replace'),
+                                     kmer_file, k))
+        codes = _CODES[block.view(np.uint8).reshape(-1, k)]
+        packed, valid = _pack([codes[:, i] for i in range(k)])
+
+        for role in dict.fromkeys(chunk_roles):
+            if role not in role_index:
+                role_index[role] = len(roles)
+                roles.append(role)
+        role_ids = np.fromiter((role_index[role] for role in chunk_roles),
+                               dtype=np.uint32, count=len(chunk_roles))
+
+        skipped += int((~valid).sum())
+        packed, role_ids = packed[valid], role_ids[valid]
+        order = np.lexsort((role_ids, packed))
+        packed, role_ids = packed[order], role_ids[order]
+        # Drop the rows that repeat the previous k-mer and role
+        keep = np.ones(len(packed), dtype=bool)
+        keep[1:] = (packed[1:] != packed[:-1]) | (role_ids[1:] != role_ids[:-1])
+        runs.append((packed[keep], role_ids[keep]))
+    if k is None:
+        raise ValueError("{} does not contain any k-mers".format(kmer_file))
+
+    # A stable sort of the concatenated runs merges them, and keeps the
+    # rows of each k-mer next to each other
+    packed = np.concatenate([run[0] for run in runs])
+    role_ids = np.concatenate([run[1] for run in runs])
+    del runs
+    order = np.argsort(packed, kind='stable')
+    packed, role_ids = packed[order], role_ids[order]
+    del order
+
+    # A k-mer with different roles in adjacent rows is not a signature of
+    # any of them
+    same = packed[1:] == packed[:-1]
+    ambiguous = np.unique(packed[1:][same & (role_ids[1:] != role_ids[:-1])])
+    keep = np.ones(len(packed), dtype=bool)
+    keep[1:] = ~same
+    keep &= ~np.isin(packed, ambiguous)
+    packed, role_ids = packed[keep], role_ids[keep]
+    n = len(packed)
+    if len(ambiguous) and verbose:
+        print("{} k-mers shared by more than one role were dropped"
+              .format(len(ambiguous)), file=sys.stderr)
+    if skipped and verbose:
+        print("{} k-mers with residues outside the alphabet were skipped"
+              .format(skipped), file=sys.stderr)
+
+    if not os.path.isdir(path):
+        os.makedirs(path)
+    np.save(os.path.join(path, 'kmers.npy'), packed)
+    np.save(os.path.join(path, 'roles.npy'), role_ids)
+    with open(os.path.join(path, 'roles.txt'), 'w') as fout:
+        for role in roles:
+            fout.write(role + '\n')
+    # The metadata is written last, so a database that was only partly
+    # written cannot be opened
+    with open(os.path.join(path, 'meta.json'), 'w') as fout:
+        json.dump({'version': FORMAT_VERSION, 'k': k,
+                   'alphabet': ALPHABET,
+                   'bits_per_residue': BITS_PER_RESIDUE}, fout)
+    if verbose:
+        print("Wrote {} {}-mers for {} roles to {}"
+              .format(n, k, len(roles), path))
+    return KmerDatabase(path)
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Pack a tab-separated role '
+                                     'k-mer database into sorted uint64 arrays')
+    parser.add_argument('kmers', help='Tab-separated role k-mer database')
+    parser.add_argument('output', help='Database directory to write')
+    args = parser.parse_args()
+    build_kmer_database(args.kmers, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+from __future__ import print_function
+import argparse
+import multiprocessing
+import os
+import numpy as np
+from kmer_database import KmerDatabase, encode_kmers, load_role_kmers
+from role_reaction_index import get_role_reaction_index
+from worker_pool import run_tasks
+
+
+# Minimum number of role k-mers a protein must contain to be scored
+MIN_HITS = 3
+
+# Number of proteins sent to a worker at a time
+CHUNK_SIZE = 500
+
+# Per-process role k-mer index, loaded once in each worker by _init_worker()
+_worker_state = {}
+
+
+
+
+def read_fasta(fasta_file):
+    """
+    Stream the sequences in a FASTA file.
+
+    :param fasta_file: Filepath to the FASTA file
+    :type fasta_file: string
+    :return: A generator of (sequence id, sequence) tuples
+    :rtype: generator
+    """
+    seqid = None
+    seq = []
+    with open(fasta_file, 'r') as fin:
+        for line in fin:
+            line = line.strip()
+            if line.startswith('>'):
+                if seqid is not None:
+                    yield seqid, ''.join(seq)
+                seqid = line[1:].split()[0] if len(line) > 1 else ''
+                seq = []
+            elif line:
+                seq.append(line.upper())
+    if seqid is not None:
+        yield seqid, ''.join(seq)
+
+
+
+
+def score_proteins(proteins, k, kmers, min_hits=MIN_HITS):
+    """
+    Score proteins against a role k-mer index.
+
+    Each protein is assigned the role whose signature k-mers it contains
+    most often.  The score of the assignment is the fraction of the
+    protein's k-mers that are signatures of that role, and the score of a
+    role is the best score of any protein assigned to it.
+
+    :param proteins: The (sequence id, sequence) tuples to score
+    :type proteins: list
+    :param k: The k-mer length
+    :type k: int
+    :param kmers: Dictionary of k-mer to role index
+    :type kmers: dict
+    :param min_hits: Minimum number of role k-mers for a protein to be scored
+    :type min_hits: int
+    :return: A dictionary of role index to role score
+    :rtype: dict
+    """
+    role_scores = {}
+    for seqid, seq in proteins:
+        n = len(seq) - k + 1
+        if n <= 0:
+            continue
+        hits = {}
+        for i in range(n):
+            r = kmers.get(seq[i:i + k])
+            if r is not None:
+                hits[r] = hits.get(r, 0) + 1
+        if not hits:
+            continue
+        best = max(hits, key=lambda r: (hits[r], -r))
+        if hits[best] < min_hits:
+            continue
+        score = float(hits[best]) / n
+        if score > role_scores.get(best, 0.0):
+            role_scores[best] = score
+    return role_scores
+
+
+
+
+def score_proteins_packed(proteins, database, min_hits=MIN_HITS):
+    """
+    Score proteins against a packed role k-mer database.  Proteins are
+    scored in the same way as score_proteins(), but the k-mers of all of the
+    proteins are looked up in the database with a single vectorized search.
+
+    :param proteins: The (sequence id, sequence) tuples to score
+    :type proteins: list
+    :param database: The packed role k-mer database
+    :type database: KmerDatabase
+    :param min_hits: Minimum number of role k-mers for a protein to be scored
+    :type min_hits: int
+    :return: A dictionary of role index to role score
+    :rtype: dict
+    """
+    role_scores = {}
+    encoded = [encode_kmers(seq, database.k) for seqid, seq in proteins]
+    encoded = [(packed, valid) for packed, valid in encoded if len(packed)]
+    if not encoded:
+        return role_scores
+    lengths = [len(packed) for packed, valid in encoded]
+    role_ids = database.lookup(np.concatenate([e[0] for e in encoded]))
+    role_ids[~np.concatenate([e[1] for e in encoded])] = -1
+
+    for n, hits in zip(lengths, np.split(role_ids, np.cumsum(lengths)[:-1])):
+        hits = hits[hits >= 0]
+        if not hits.size:
+            continue
+        # np.unique sorts the roles, so ties go to the lowest role index
+        # as in score_proteins()
+        roles, counts = np.unique(hits, return_counts=True)
+        best = int(np.argmax(counts))
+        if counts[best] < min_hits:
+            continue
+        r = int(roles[best])
+        score = float(counts[best]) / n
+        if score > role_scores.get(r, 0.0):
+            role_scores[r] = score
+    return role_scores
+
+
+
+
+def _init_worker(kmer_file, min_hits):
+    """Load the role k-mer index once in a worker process"""
+    if isinstance(kmer_file, KmerDatabase):
+        # Packed databases are memory-mapped, so this is shared between
+        # all of the workers
+        _worker_state['database'] = kmer_file
+    else:
+        k, roles, kmers = load_role_kmers(kmer_file, verbose=False)
+        _worker_state['k'] = k
+        _worker_state['kmers'] = kmers
+    _worker_state['min_hits'] = min_hits
+
+
+
+
+def _score_worker(proteins):
+    """Score a chunk of proteins with the worker's index"""
+    if 'database' in _worker_state:
+        return score_proteins_packed(proteins, _worker_state['database'],
+                                     _worker_state['min_hits'])
+    return score_proteins(proteins, _worker_state['k'], _worker_state['kmers'],
+                          _worker_state['min_hits'])
+
+
+
+
+def _chunks(iterable, size):
+    """Group an iterable into lists of at most size items"""
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+
+
+def score_genome(fasta_file, kmer_file, processes=None, chunk_size=CHUNK_SIZE,
+                 min_hits=MIN_HITS, verbose=True):
+    """
+    Score every functional role in a genome from its protein sequences.
+
+    The proteome is streamed in chunks of proteins that are scored in
+    parallel by a pool of worker processes.  With a tab-separated k-mer
+    database each worker holds its own copy of the index; a packed database
+    directory (see kmer_database.py) is memory-mapped and shared instead.
+
+    :param fasta_file: Filepath to the protein FASTA file
+    :type fasta_file: string
+    :param kmer_file: Filepath to the tab-separated role k-mer database, or
+        a packed database directory
+    :type kmer_file: string
+    :param processes: Number of worker processes (defaults to the number of CPUs)
+    :type processes: int
+    :param chunk_size: Number of proteins sent to a worker at a time
+    :type chunk_size: int
+    :param min_hits: Minimum number of role k-mers for a protein to be scored
+    :type min_hits: int
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: A dictionary of functional role to role score
+    :rtype: dict
+    """
+    if os.path.isdir(kmer_file):
+        database = KmerDatabase(kmer_file)
+        roles = database.roles
+        if verbose:
+            print("Opened {} packed {}-mers for {} roles"
+                  .format(len(database), database.k, len(roles)))
+    else:
+        database = None
+        k, roles, kmers = load_role_kmers(kmer_file, verbose=verbose)
+        if verbose:
+            print("Loaded {} {}-mers for {} roles".format(len(kmers), k, len(roles)))
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+
+    chunks = _chunks(read_fasta(fasta_file), chunk_size)
+    role_scores = {}
+    if processes == 1:
+        if database is not None:
+            results = (score_proteins_packed(c, database, min_hits) for c in chunks)
+        else:
+            results = (score_proteins(c, k, kmers, min_hits) for c in chunks)
+        for chunk_scores in results:
+            _merge_scores(role_scores, chunk_scores)
+    else:
+        if database is None:
+            # The workers load their own copy of the index, so the index
+            # built here is no longer needed
+            del kmers
+        for chunk_scores in run_tasks(_score_worker, chunks, _init_worker,
+                                      (database or kmer_file, min_hits),
+                                      processes, ordered=False):
+            _merge_scores(role_scores, chunk_scores)
+
+    role_scores = dict((roles[r], s) for r, s in role_scores.items())
+    if verbose:
+        print("{} roles were found in the genome".format(len(role_scores)))
+    return role_scores
+
+
+
+
+def _merge_scores(role_scores, chunk_scores):
+    """Keep the best score for each role"""
+    for r, s in chunk_scores.items():
+        if s > role_scores.get(r, 0.0):
+            role_scores[r] = s
+
+
+
+
+def role_scores_to_reaction_probabilities(role_scores, orgtype='gramnegative'):
+    """
+    Convert role scores into reaction probabilities using the SEED role to
+    reaction mappings.  The probability of a reaction is the best score of
+    any of the roles that map to it.
+
+    :param role_scores: A dictionary of functional role to role score
+    :type role_scores: dict
+    :param orgtype: Organism type
+    :type orgtype: string
+    :return: A dictionary of reaction id to probability
+    :rtype: dict
+    """
+    roles_to_reactions =\
+        get_role_reaction_index(orgtype).roles_to_reactions(set(role_scores))
+    rxn_probs = {}
+    for role in roles_to_reactions:
+        for rxn in roles_to_reactions[role]:
+            if role_scores[role] > rxn_probs.get(rxn, 0.0):
+                rxn_probs[rxn] = role_scores[role]
+    return rxn_probs
+
+
+
+
+def write_reaction_probabilities(rxn_probs, output_file):
+    """
+    Write reaction probabilities in the format read by
+    likelihood_gapfill_optimization().
+
+    :param rxn_probs: A dictionary of reaction id to probability
+    :type rxn_probs: dict
+    :param output_file: Filepath to write the probabilities to
+    :type output_file: string
+    """
+    with open(output_file, 'w') as fout:
+        fout.write('reaction\tprobability\n')
+        for rxn in sorted(rxn_probs):
+            fout.write('{}\t{}\n'.format(rxn, rxn_probs[rxn]))
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Score the functional roles in '
+                                     'a genome with a role k-mer database and '
+                                     'write the reaction probabilities file')
+    parser.add_argument('fasta', help='Protein FASTA file')
+    parser.add_argument('kmers', help='Role k-mer database (tab-separated file '
+                        'or packed database directory)')
+    parser.add_argument('output', help='Reaction probabilities file to write')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('-c', '--chunk-size', type=int, default=CHUNK_SIZE,
+                        help='Proteins per work unit (default: {})'.format(CHUNK_SIZE))
+    parser.add_argument('-m', '--min-hits', type=int, default=MIN_HITS,
+                        help='Minimum k-mer hits to score a protein (default: {})'
+                        .format(MIN_HITS))
+    parser.add_argument('-o', '--orgtype', default='gramnegative',
+                        help='Organism type used to map roles to reactions '
+                        '(default: gramnegative)')
+    args = parser.parse_args()
+
+    role_scores = score_genome(args.fasta, args.kmers, processes=args.processes,
+                               chunk_size=args.chunk_size,
+                               min_hits=args.min_hits)
+    rxn_probs = role_scores_to_reaction_probabilities(role_scores, args.orgtype)
+    print("{} reactions have k-mer evidence".format(len(rxn_probs)))
+    write_reaction_probabilities(rxn_probs, args.output)
+
+
+if __name__ == '__main__':
+    main()
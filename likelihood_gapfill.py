@@ -1,13 +1,26 @@
 from __future__ import print_function
+import collections
 import copy
 import sys
+import time
 sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
 import PyFBA
+import model_seed_cache
+from candidate_pruning import prune_candidates
+from flux_result import FluxResult
+from gapfill_profile import GapfillProfile, lp_size
+from incremental_fba import IncrementalFBA
+from reaction_overlay import ReactionOverlay
+from reaction_probabilities import load_reaction_probabilities
+from role_reaction_index import get_role_reaction_index
+from sparse_stoichiometry import compound_probability, get_reaction_universe,\
+    suggest_by_compound
 
 
 
 
-def build_draft_model(assigned_functions_file, orgtype='gramnegative', verbose=True):
+def build_draft_model(assigned_functions_file, orgtype='gramnegative', verbose=True,
+                      reactions=None):
     """
     Bild a draft metabolic model from the RAST assigned functions
     file.
@@ -23,6 +36,9 @@ def build_draft_model(assigned_functions_file, orgtype='gramnegative', verbose=T
     :type orgtype: string
     :param verbose: Verbose output
     :type verbose: bool
+    :param reactions: The dictionary of reactions from the Model SEED
+        database, loaded for the organism type when not given
+    :type reactions: dict
     :return: A set of functional roles and a set of reaction ids
     :rtype: (set, set)
     """
@@ -38,17 +54,16 @@ def build_draft_model(assigned_functions_file, orgtype='gramnegative', verbose=T
         print("There are {} unique roles in this genome".format(len(roles_present)))
 
     # Convert functional roles into reactions
-    roles_to_reactions = PyFBA.filters.roles_to_reactions(roles_present)
-    reactions_present = set()
-    for role in roles_to_reactions:
-        reactions_present.update(roles_to_reactions[role])
+    reactions_present =\
+        get_role_reaction_index(orgtype).reactions_for_roles(roles_present)
     if verbose:
         print("There are {}".format(len(reactions_present)),
               "unique reactions associated with this genome.")
 
     # Read in ModelSEED database of compounds, reactions, and enzyme complexes
-    compounds, reactions, enzymes =\
-            PyFBA.parse.model_seed.compounds_reactions_enzymes(orgtype)
+    if reactions is None:
+        compounds, reactions, enzymes =\
+                model_seed_cache.compounds_reactions_enzymes(orgtype)
 
     # Update the reactions to run, making sure that all the reactions
     # are in our reactions database
@@ -67,10 +82,173 @@ def build_draft_model(assigned_functions_file, orgtype='gramnegative', verbose=T
 
 
 
+def _suggest_from_media(compounds, reactions, reactions_to_run, media,
+                        close_roles_file, genus_roles_file):
+    """Reactions based on the media"""
+    return PyFBA.gapfill.suggest_from_media(compounds, reactions,
+                                            reactions_to_run, media)
+
+
+def _suggest_from_close_genomes(compounds, reactions, reactions_to_run, media,
+                                close_roles_file, genus_roles_file):
+    """Reactions from roles present in RAST close genomes"""
+    close_reactions = PyFBA.gapfill.suggest_from_roles(close_roles_file, reactions)
+    # Find which of the suggested reactions are new
+    close_reactions.difference_update(reactions_to_run)
+    return close_reactions
+
+
+def _suggest_from_genus(compounds, reactions, reactions_to_run, media,
+                        close_roles_file, genus_roles_file):
+    """Reactions from roles present in genomes from the same genus"""
+    genus_reactions = PyFBA.gapfill.suggest_from_roles(genus_roles_file, reactions)
+    # Find which of the suggested reactions are new
+    genus_reactions.difference_update(reactions_to_run)
+    return genus_reactions
+
+
+def _suggest_essential(compounds, reactions, reactions_to_run, media,
+                       close_roles_file, genus_roles_file):
+    """Essential reactions that are present in all models"""
+    essential_reactions = PyFBA.gapfill.suggest_essential_reactions()
+    # Find which of the suggested reactions are new
+    essential_reactions.difference_update(reactions_to_run)
+    return essential_reactions
+
+
+def _suggest_from_subsystems(compounds, reactions, reactions_to_run, media,
+                             close_roles_file, genus_roles_file):
+    """Reactions that complete subsystems"""
+    return PyFBA.gapfill.suggest_reactions_from_subsystems(reactions,
+                                                           reactions_to_run,
+                                                           threshold=0.5)
+
+
+def _suggest_orphans(compounds, reactions, reactions_to_run, media,
+                     close_roles_file, genus_roles_file):
+    """Reactions connected to orphan compounds"""
+    return suggest_by_compound(get_reaction_universe(reactions),
+                               reactions_to_run, max_reactions=1)
+
+
+def _suggest_by_compound_probability(compounds, reactions, reactions_to_run,
+                                     media, close_roles_file, genus_roles_file):
+    """Reactions that meet a threshold for probability of existence"""
+    # Only reactions with proteins
+    with_proteins = set(r for r in reactions if reactions[r].enzymes)
+    return compound_probability(get_reaction_universe(reactions),
+                                reactions_to_run, cutoff=0,
+                                allowed_reactions=with_proteins)
+
+
+# A stage of reaction suggestion:
+#   name         the name of the stage in profiles
+#   label        the label of the stage's reactions in the list of added
+#                reactions
+#   source       the source recorded for the reactions the stage suggests
+#   description  what the stage suggests, for verbose output
+#   suggest      a function (compounds, reactions, reactions_to_run, media,
+#                close_roles_file, genus_roles_file) returning the set of
+#                suggested reaction ids
+SuggestionStage = collections.namedtuple(
+    'SuggestionStage', ['name', 'label', 'source', 'description', 'suggest'])
+
+# The stages of suggest_additional_reactions(), in the order they are tried
+SUGGESTION_STAGES = [
+    SuggestionStage('media', 'media', 'media_reactions',
+                    'reactions from media', _suggest_from_media),
+    SuggestionStage('close_genomes', 'close genomes', 'close_genomes',
+                    'reactions from RAST close genomes',
+                    _suggest_from_close_genomes),
+    SuggestionStage('genus', 'genus_reactions', 'genus_reactions',
+                    'reactions from other species in the same genus',
+                    _suggest_from_genus),
+    SuggestionStage('essential', 'essential', 'essential_ractions',
+                    'essential reactions', _suggest_essential),
+    SuggestionStage('subsystems', 'subsystems', 'subsystem_reactions',
+                    'reactions that complete subsystems',
+                    _suggest_from_subsystems),
+    SuggestionStage('orphans', 'orphans', 'orphan_compounds',
+                    'reactions connecting to orphan compounds',
+                    _suggest_orphans),
+    SuggestionStage('compound_probability', 'compound probability',
+                    'probable_reactions',
+                    'reactions based on compound probability',
+                    _suggest_by_compound_probability),
+]
+
+
+
+
+def _grow(fba, new_reactions, record):
+    """
+    Add the reactions suggested at a stage to the FBA model and test for
+    growth, recording the number of candidates, the size of the LP and the
+    simplex iterations in the stage's profile record.
+    """
+    start = time.time()
+    added = fba.add_reactions(new_reactions)
+    record['build_seconds'] = time.time() - start
+    record['candidates'] = len(new_reactions)
+    record['added'] = len(added)
+
+    iterations = fba.iterations
+    start = time.time()
+    status, value, growth = fba.solve()
+    record['solve_seconds'] = time.time() - start
+    record['iterations'] = fba.iterations - iterations
+    record.update(fba.size())
+    record['reactions'] = len(fba)
+    record['status'] = status
+    record['biomass_flux'] = value
+    record['growth'] = growth
+    return status, value, growth
+
+
+
+
+def _minimal_stages(fba, suggested, draft_reactions, record):
+    """
+    Drop the stages whose reactions are not needed for growth.
+
+    The model grows with the reactions of all of the stages, and did not
+    grow before the last stage was added, so the last stage is always
+    needed.  Each earlier stage, largest first, is switched off in the
+    model; if the model still grows it is dropped, otherwise it is switched
+    back on.  Only the bounds of the columns change between these tests, so
+    each one is a warm-started re-solve of the same LP.
+    """
+    kept = list(suggested)
+    iterations = fba.iterations
+    for stage, stage_reactions in sorted(suggested[:-1],
+                                         key=lambda s: -len(s[1])):
+        needed = set(draft_reactions)
+        for other, other_reactions in kept:
+            if other is not stage:
+                needed.update(other_reactions)
+        removable = stage_reactions - needed
+        fba.disable_reactions(removable)
+        status, value, growth = fba.solve()
+        if growth:
+            kept = [s for s in kept if s[0] is not stage]
+        else:
+            fba.enable_reactions(removable)
+    record['stages'] = len(suggested)
+    record['kept'] = len(kept)
+    record['iterations'] = fba.iterations - iterations
+    record['candidates'] = sum(len(r) for s, r in suggested)
+    record['kept_candidates'] = len(set().union(*[r for s, r in kept]))
+    return kept
+
+
+
+
 def suggest_additional_reactions(compounds, reactions, draft_reactions,
                                   draft_roles, media, biomass_equation,
                                   close_roles_file, genus_roles_file,
-                                  verbose=True):
+                                  verbose=True, profile=None, stages=None,
+                                  role_index=None, minimal_stages=False,
+                                  backend=None):
     """
     Suggest additional reactions to add to a draft model to enable the model
     to grow on a media type where it is known to grow.  Reactions are suggested
@@ -87,6 +265,11 @@ def suggest_additional_reactions(compounds, reactions, draft_reactions,
           is based upon the fraction of compounds for the reaction that are
           present in the model)
 
+    The stages are tried in order, and the reactions of each stage are added
+    to the model until it grows.  With minimal_stages, the stages that are
+    not needed for growth once the later stages have been added are then
+    dropped, so only the reactions of the remaining stages are suggested.
+
     :param compounds: The dictionary of all compounds from Model SEED
     :type compounds: dict
     :param reactions: The dictionary of all reactions from Model SEED
@@ -105,177 +288,83 @@ def suggest_additional_reactions(compounds, reactions, draft_reactions,
     :type genus_roles_file: string
     :param verbose: Verbose output
     :type verbose: bool
+    :param profile: Profile to add a record for each stage to
+    :type profile: gapfill_profile.GapfillProfile
+    :param stages: The stages to suggest reactions from, in order (defaults
+        to SUGGESTION_STAGES)
+    :type stages: list of SuggestionStage
+    :param role_index: The index used to map the suggested reactions to
+        roles (defaults to the Model SEED index)
+    :type role_index: role_reaction_index.RoleReactionIndex
+    :param minimal_stages: Only suggest the reactions of the stages that are
+        needed for the model to grow
+    :type minimal_stages: bool
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
     :return: A set of reactions possibly missing from the model, a set of roles possibly missing
         from the model, and a dictionary of source for the missing reactions
     :rtype: (set, set, dict)
     """
+    if profile is None:
+        profile = GapfillProfile()
+    if stages is None:
+        stages = SUGGESTION_STAGES
+    if role_index is None:
+        role_index = get_role_reaction_index()
 
     # Initialize the reactions to run as the set of reactions from the draft model
     reactions_to_run = copy.copy(draft_reactions)
-    
-    # TEST IF DRAFT MODEL GROWS ON THE MEDIA
-    status, value, growth =\
-            PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                 media, biomass_equation)
-    print("Initial FBA run has a biomass flux value"
-          " of {} --> Growth: {}".format(value, growth))
-
-
-    # PROPOSE REACTIONS TO ADD TO THE MODEL IF IT WON'T GROW ON THE MEDIA
-    if not growth:
-        # Keep track of the suggested reactions
-        added_reactions = []
-        reaction_source = {}
-        
-        # SUGGEST REACTIONS FROM MEDIA
-        if verbose:
-            print("\nFinding reactions from media...")
-        media_reactions = PyFBA.gapfill.suggest_from_media(compounds, reactions,
-                                                            reactions_to_run, media)
-        added_reactions.append(("media", media_reactions))
-        reactions_to_run.update(media_reactions)
-        for rxn in media_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'media_reactions'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding media reactions, the biomass reaction "
-                  "has a flux of {} --> Growth: {}".format(value, growth))
-    
 
-    if not growth:
-        # SUGGEST REACTIONS FROM RAST CLOSELY-RELATED ORGANISMS
-        if verbose:
-            print("\nFinding reactions from closely-related organisms...")
-        close_reactions = PyFBA.gapfill.suggest_from_roles(close_roles_file, reactions)
-        # Find which of the suggested reactions are new
-        close_reactions.difference_update(reactions_to_run)
-        added_reactions.append(("close genomes", close_reactions))
-        reactions_to_run.update(close_reactions)
-        for rxn in close_reactions:
+    # Build the FBA model once and add the reactions suggested at each stage
+    # to it, rather than rebuilding the model for every growth test
+    with IncrementalFBA(compounds, reactions, media, biomass_equation,
+                        universe=get_reaction_universe(reactions),
+                        backend=backend, n_reactions=len(reactions_to_run)) as fba:
+        # TEST IF DRAFT MODEL GROWS ON THE MEDIA
+        with profile.stage('draft') as record:
+            status, value, growth = _grow(fba, reactions_to_run, record)
+        print("Initial FBA run has a biomass flux value"
+              " of {} --> Growth: {}".format(value, growth))
+
+        # Keep track of the reactions suggested at each stage
+        suggested = []
+
+        # PROPOSE REACTIONS TO ADD TO THE MODEL UNTIL IT GROWS ON THE MEDIA
+        for stage in stages:
+            if growth:
+                break
+            with profile.stage(stage.name) as record:
+                if verbose:
+                    print("\nFinding {}...".format(stage.description))
+                stage_reactions = stage.suggest(compounds, reactions,
+                                                reactions_to_run, media,
+                                                close_roles_file, genus_roles_file)
+                suggested.append((stage, stage_reactions))
+                reactions_to_run.update(stage_reactions)
+
+                # Test for growth
+                status, value, growth = _grow(fba, stage_reactions, record)
+                if verbose:
+                    print("After adding {}, the biomass reaction has a flux of {} "
+                          "--> Growth: {}".format(stage.description, value, growth))
+
+        # DROP THE STAGES THAT ARE NOT NEEDED FOR GROWTH
+        if minimal_stages and growth and len(suggested) > 1:
+            with profile.stage('minimal_stages') as record:
+                suggested = _minimal_stages(fba, suggested, draft_reactions, record)
+                if verbose:
+                    print("\nThe model grows with the reactions from {} of {} stages: {}"
+                          .format(record['kept'], record['stages'],
+                                  ", ".join(s.name for s, r in suggested)))
+
+    added_reactions = []
+    reaction_source = {}
+    for stage, stage_reactions in suggested:
+        added_reactions.append((stage.label, stage_reactions))
+        for rxn in stage_reactions:
             if rxn not in reaction_source:
-                reaction_source[rxn] = 'close_genomes'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding reactions from RAST close genomes, "
-                  "the biomass reaction has a flux of {} --> Growth: {}".format(value, growth))
-
-    if not growth:
-        # SUGGEST REACTIONS FROM ALL GENOMES IN SAME GENUS
-        if verbose:
-            print("\nFinding reactions from species in same genera...")
-        genus_reactions = set()
-        genus_reactions = PyFBA.gapfill.suggest_from_roles(genus_roles_file, reactions)
-        # Find which of the suggested reactions are new
-        genus_reactions.difference_update(reactions_to_run)
-        added_reactions.append(("genus_reactions", genus_reactions))
-        reactions_to_run.update(genus_reactions)
-        for rxn in genus_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'genus_reactions'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding reactions from other species in the same genus, "
-                  "the biomass reaction has a flux of {} --> Growth: {}".format(value, growth))
-
-    if not growth:
-        # SUGGEST ESSENTIAL REACTIONS
-        if verbose:
-            print("\nFinding essential reactions...")
-        essential_reactions = PyFBA.gapfill.suggest_essential_reactions()
-        # Find which of the suggested reactions are new
-        essential_reactions.difference_update(reactions_to_run)
-        added_reactions.append(("essential", essential_reactions))
-        reactions_to_run.update(essential_reactions)
-        for rxn in essential_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'essential_ractions'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding essential reactions, the biomass reaction has"
-                  " a flux of {} --> Growth: {}".format(value, growth))
-
-    if not growth:
-        # SUGGEST REACTIONS THAT COMPLETE SUBSYSTEMS
-        if verbose:
-            print("\nFinding reactions that complete subsystems...")
-        subsystem_reactions =\
-                            PyFBA.gapfill.suggest_reactions_from_subsystems(reactions,
-                                                                             reactions_to_run,
-                                                                             threshold=0.5)
-        added_reactions.append(("subsystems", subsystem_reactions))
-        reactions_to_run.update(subsystem_reactions)
-        for rxn in subsystem_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'subsystem_reactions'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding subsystem reactions, the biomass reaction "
-                  "has a flux of {} --> Growth: {}".format(value, growth))
-    
-    if not growth:
-        # SUGGEST REACTIONS THAT CONNECT TO ORPHAN COMPOUNDS
-        if verbose:
-            print("\nFinding reactions conecting to orphan compounds...")
-        orphan_reactions = PyFBA.gapfill.suggest_by_compound(compounds, reactions,
-                                                              reactions_to_run,
-                                                              max_reactions=1)
-        added_reactions.append(("orphans", orphan_reactions))
-        reactions_to_run.update(orphan_reactions)
-        for rxn in orphan_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'orphan_compounds'
-
-        # Test for growth
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding reactions connecting to orphan compounds, "
-                  "the biomass reaction has a flux of {} --> Growth: {}".format(value, growth))
-
-    if not growth:
-        # SUGGEST COMPOUND-PROBABILITY REACTIONS
-        if verbose:
-            print("\nFinding compound-probability reactions...")
-        probable_reactions = PyFBA.gapfill.compound_probability(reactions,
-                                                                 reactions_to_run,
-                                                                 cutoff=0,
-                                                                 rxn_with_proteins=True)
-        probable_reactions.difference_update(reactions_to_run)
-        added_reactions.append(("compound probability", probable_reactions))
-        reactions_to_run.update(probable_reactions)
-        for rxn in probable_reactions:
-            if rxn not in reaction_source:
-                reaction_source[rxn] = 'probable_reactions'
-    
-        status, value, growth =\
-                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run,
-                                     media, biomass_equation)
-        if verbose:
-            print("After adding reactions based on compound probability, "
-                  "the biomass reaction has a flux of {} --> Growth: {}".format(value, growth))
-
+                reaction_source[rxn] = stage.source
 
     # GET THE SET OF REACTIONS THAT MAY NEED TO BE ADDED TO THE MODEL
     missing_reactions = set()
@@ -287,10 +376,7 @@ def suggest_additional_reactions(compounds, reactions, draft_reactions,
 
     # MAP THE REACTIONS THAT MAY NEED TO BE ADDED TO THEIR ASSOCIATED
     # FUNCTIONAL ROLES
-    missing_reactions_to_roles = PyFBA.filters.reactions_to_roles(missing_reactions)
-    missing_roles = set()
-    for r in missing_reactions_to_roles:
-        missing_roles.update(missing_reactions_to_roles[r])
+    missing_roles = role_index.roles_for_reactions(missing_reactions)
     if verbose:
         print("\nThere are {} functional roles that may be missing from the model."
               .format(len(missing_roles)))
@@ -303,7 +389,9 @@ def suggest_additional_reactions(compounds, reactions, draft_reactions,
 def likelihood_gapfill_optimization(compounds, reactions, original_reactions,
                                      suggested_reactions, biomass_equation,
                                      media, role_probabilities_file,
-                                     essential_reactions, verbose=True):
+                                     essential_reactions, prune=True,
+                                     verbose=True, profile=None,
+                                     reaction_source=None):
     """
     Run FBA in the likelihood-based gapfill mode to determine which of the
     suggested reactions to add to the draft model to enable growth. Reactions
@@ -311,91 +399,110 @@ def likelihood_gapfill_optimization(compounds, reactions, original_reactions,
     due to the way objective coefficients are calculated fromt the reaction
     probabilites and the objective function utilized in the optimization.
 
+    This LP is built and solved by PyFBA.fba.run_fba with PyFBA's own solver.
+    It is deliberately not built on the lp_backends backends, so the backend
+    chosen for the growth tests does not apply to it.
+
     :param compounds: The dictionary of compounds from the Model SEED database
     :type compounds: dict
-    :param reactions: The dictionary of reactions from the Model SEED database
+    :param reactions: The dictionary of reactions from the Model SEED database.
+        This dictionary is not modified.
     :type reactions: dict
     :param original_reactions: The set of reaction ids from the draft model
     :type original_reactions: set
     :param suggested_reactions: The set of suggested reaction ids to be used in
-        gapfilling to complete the model and enable growth
+        gapfilling to complete the model and enable growth.  This set is not
+        modified.
     :type suggested_reactions: set
     :param biomass_equation: The biomass equation as a Reaction object
     :type biomass_equation: metabolism.Reaction object
     :param media: A set of compounds present in the media
     :type media: set
     :param role_probabilities_file: Filepath to file containing a list of roles
-        and associated probabilities for the roles
-    :type role_probabilities_file: string
+        and associated probabilities for the roles, or an already loaded
+        ReactionProbabilities store
+    :type role_probabilities_file: string or ReactionProbabilities
     :param essential_reactions: The set of essntial reactions (returned by the PyFBA.gapfill.suggest_essential_reactions() function)
     :type essential_reactions: set
+    :param prune: Remove duplicated and blocked candidate reactions from the
+        oriented candidates before building the likelihood LP
+    :type prune: bool
     :param verbose: Verbose output
     :type verbose: bool
+    :param profile: Profile to add a record for each step to
+    :type profile: gapfill_profile.GapfillProfile
+    :param reaction_source: A dictionary of the source of each suggested
+        reaction (from suggest_additional_reactions()), used to summarize
+        the added reactions by source in the profile
+    :type reaction_source: dict
     :return: A set of reactions added in the gapfilling process and a dictionary
-        of fluxes for the added reactions
+        of fluxes for the added reactions.  The flux of a reversed reaction
+        is its flux in the direction it was made to run, and the flux of a
+        split reaction is the net flux of its halves in its own direction.
     :rtype: (set, dict)
     """
+    if profile is None:
+        profile = GapfillProfile()
 
-    # Read in the role probabilities from text file
+    # Load the reaction probabilities.  The store is only parsed the first
+    # time a file is used and is shared by later calls in the same process.
+    with profile.stage('load_probabilities'):
+        rxn_probs = load_reaction_probabilities(role_probabilities_file,
+                                                verbose=verbose)
+
+    # Report the candidates the likelihood LP has no probability for, once
+    # for each reaction in the life of the store
     if verbose:
-        print("Loading reaction probabilities file ...")
-    rxn_probs = {}
-    with open(role_probabilities_file,'r') as fin:
-        for i, line in enumerate(fin):
-            if i==0:
-                continue
-            r, p = line.strip().split('\t')
-            rxn_probs[r] = float(p)
+        rxn_probs.report_missing(suggested_reactions)
 
-    
     # Enforce that all the candidate gap-filling reactions not present in the
     # original model can run only in the left to right (>) direction.  Reverse
     # all of the reacions that run right to left, and split the bidirectional
     # reactions into two separate left to right reactions.  The reactions
-    # present in the original model can be left unmodified.
+    # present in the original model can be left unmodified.  All of these
+    # changes are made in an overlay of the reactions dictionary so the
+    # caller's reactions are left untouched.
     if verbose:
         print("Enforcing all potential gapfilling reactions to run in the "
               " left to right direction ...")
+    orient_start = time.time()
+    reactions = ReactionOverlay(reactions)
+    suggested_reactions = set(suggested_reactions)
     to_delete = []
     to_add = []
+    split_from = {}
     rev_count = 0
     split_count = 0
     for rxn in suggested_reactions:
+        # Transport reactions are given explicit bounds
+        if reactions[rxn].is_transport:
+            bounds = (0.0, 1000.0)
+        else:
+            bounds = (None, None)
+
         # If the reaction is a transport reaction that runs left to right,
         # explicitly set the reaction bounds
         if reactions[rxn].direction == '>' and reactions[rxn].is_transport:
-            reactions[rxn].lower_bound = 0.0
-            reactions[rxn].upper_bound = 1000.0
+            reactions.orient(rxn, 1, rxn, *bounds)
 
         # Reverse the reaction if it runs right to left
         if reactions[rxn].direction == '<':
             rev_count += 1
-            reactions[rxn].reverse_reaction()
-            if reactions[rxn].is_transport:
-                # Explicitly set the reaction bounds for transport reactions
-                reactions[rxn].lower_bound = 0.0
-                reactions[rxn].upper_bound = 1000.0
+            reactions.orient(rxn, -1, rxn, *bounds)
 
         # Split bidirectional reactions into two forward reactions:
-        # one for left to right and one for right to left
+        # one for left to right and one for right to left.  Both halves are
+        # views of the bidirectional reaction in the overlay, not copies.
         if reactions[rxn].direction == '=':
             split_count += 1
-            # Split the reaction
-            (fwd, rev) = reactions[rxn].split_reaction()
-            if reactions[rxn].is_transport:
-                # Explicitly set the reaction bounds for transport reactions
-                fwd.lower_bound = 0.0
-                fwd.upper_bound = 1000.0
-                rev.lower_bound = 0.0
-                rev.upper_bound = 1000.0
-            # Add the forward and reverse reactions to the master
-            # reactions dictionary
-            reactions[fwd.name] = fwd
-            reactions[rev.name] = rev
+            fwd = reactions.orient(rxn, 1, rxn + '_f', *bounds)
+            rev = reactions.orient(rxn, -1, rxn + '_r', *bounds)
             # Keep track of reactions to delete from and add
             # to reactions_to_run set
             to_delete.append(rxn)
             to_add += [fwd.name, rev.name]
+            split_from[fwd.name] = rxn
+            split_from[rev.name] = rxn
 
     if verbose:
         print("{} reactions reversed to run left to right.".format(rev_count))
@@ -403,21 +510,37 @@ def likelihood_gapfill_optimization(compounds, reactions, original_reactions,
               .format(split_count))
 
    
-    # Update the suggested_reactions set
+    # Update the local copy of the suggested_reactions set
     # Remove the bidirectional reactions from the suggested_reactions set
     for rxn in to_delete:
         suggested_reactions.discard(rxn)
     # Add the new forward and reverse reactions for the bidirectional
     # reactions that were split to the suggested_reactions set
     suggested_reactions.update(to_add)
-
-    # Update the reactions probability hash with probabilities for the
-    # forward and reverse reactions that were created from the
-    # bidirectional reactions that were split
-    for rxn in to_add:
-        bidirect_rxn = rxn[:-2]
-        if bidirect_rxn in rxn_probs:
-            rxn_probs[rxn] = rxn_probs[bidirect_rxn]
+    profile.records.append({'stage': 'orient',
+                            'seconds': time.time() - orient_start,
+                            'reversed': rev_count, 'split': split_count,
+                            'candidates': len(suggested_reactions)})
+
+    # Remove candidate reactions that cannot carry flux or that duplicate
+    # another reaction, so they never become columns in the likelihood LP.
+    # This runs on the oriented reactions, so every candidate is tested with
+    # the direction and bounds it has in the LP.
+    if prune:
+        if verbose:
+            print("Pruning candidate gapfilling reactions ...")
+        with profile.stage('prune') as record:
+            suggested_reactions, prune_report =\
+                prune_candidates(reactions, original_reactions,
+                                 suggested_reactions, media, biomass_equation,
+                                 rxn_probs=rxn_probs,
+                                 protected=essential_reactions,
+                                 split_from=split_from, verbose=verbose)
+            record.update(prune_report)
+
+    # The probabilities of the forward and reverse reactions created from
+    # the bidirectional reactions are looked up from the bidirectional
+    # reactions by the probability store, so rxn_probs is not updated here
     
 
     # Set the reactions to run in FBA
@@ -425,40 +548,51 @@ def likelihood_gapfill_optimization(compounds, reactions, original_reactions,
     reactions_to_run.update(original_reactions)
     reactions_to_run.update(suggested_reactions)
 
-    # Run gapfilling by running the FBA in the likelihood gapfilling mode
-    status, value, growth = \
-            PyFBA.fba.run_fba(compounds, reactions, reactions_to_run, media,
-                              biomass_equation, verbose=True,
-                              likelihood_gapfill=True,
-                              reaction_probs = rxn_probs,
-                              original_reactions_to_run = original_reactions,
-                              essential_reactions = essential_reactions)
-
-    # Get the reaction fluxes from FBA to see which reactions ran
-    reaction_flux = PyFBA.fba.reaction_fluxes()
-    biomass_flux = reaction_flux["BIOMASS_EQN"]
-    if biomass_flux >= 1.0:
-        growth = True
-    else:
-        growth = False
-    if verbose:
-        print("After gap-filling, the biomass reaction has a flux "
-              " of {} --> Growth: {}".format(biomass_flux, growth))
-
-    # Check how many reactions ran and record which reactions were added
-    # in gap-filling along with their fluxes
-    rxns_running_count = 0
-    gf_rxn_fluxes = {}
-    for r in reaction_flux:
-        if r == "BIOMASS_EQN":
-            continue
-        if reaction_flux[r] != 0.0 and "UPTAKE_SECRETION_REACTION" not in r:
-            rxns_running_count += 1
-            if r not in original_reactions:
-                gf_rxn_fluxes[r.replace('_f','').replace('_r','')] = reaction_flux[r]
-    # Record set of gapfilling reactions added
-    gf_added_reactions = set(
-        [i.replace('_f','').replace('_r','') for i in gf_rxn_fluxes.keys()])
+    # Run gapfilling by running the FBA in the likelihood gapfilling mode.
+    # PyFBA builds and solves this LP itself (it is not an LPBackend, so
+    # --backend does not apply), so its size is counted from the reactions
+    # rather than read from the solver.
+    with profile.stage('likelihood') as record:
+        record['candidates'] = len(suggested_reactions)
+        record['reactions'] = len(reactions_to_run)
+        record.update(lp_size(reactions, reactions_to_run, biomass_equation))
+        status, value, growth = \
+                PyFBA.fba.run_fba(compounds, reactions, reactions_to_run, media,
+                                  biomass_equation, verbose=True,
+                                  likelihood_gapfill=True,
+                                  reaction_probs = rxn_probs,
+                                  original_reactions_to_run = original_reactions,
+                                  essential_reactions = essential_reactions)
+        record['status'] = status
+        record['biomass_flux'] = value
+        # PyFBA does not report the solver's iteration count, so unlike the
+        # growth test stages this one has none
+        record['iterations'] = None
+
+        # Get the reaction fluxes from FBA to see which reactions ran.  The
+        # columns of the reversed and split reactions are mapped back to the
+        # original reactions through their views in the overlay.
+        flux_result = FluxResult.from_fluxes(PyFBA.fba.reaction_fluxes(), reactions)
+        biomass_flux = flux_result.biomass_flux
+        if biomass_flux >= 1.0:
+            growth = True
+        else:
+            growth = False
+        if verbose:
+            print("After gap-filling, the biomass reaction has a flux "
+                  " of {} --> Growth: {}".format(biomass_flux, growth))
+
+        # Record which reactions were added in gap-filling along with their
+        # fluxes, collapsing the split reactions
+        running = flux_result.active()
+        added = running & ~flux_result.in_reactions(original_reactions)
+        gf_rxn_fluxes = flux_result.reaction_fluxes(added)
+        gf_added_reactions = set(gf_rxn_fluxes)
+        record['growth'] = growth
+        record['running'] = int(running.sum())
+        record['added'] = len(gf_added_reactions)
+        if reaction_source is not None:
+            record['sources'] = flux_result.summarize(reaction_source, added)
 
 
     return gf_added_reactions, gf_rxn_fluxes
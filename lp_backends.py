@@ -0,0 +1,563 @@
+from __future__ import print_function
+import json
+import os
+import tempfile
+import numpy as np
+try:
+    import swiglpk as glpk
+except ImportError:
+    glpk = None
+try:
+    import highspy
+except ImportError:
+    highspy = None
+
+
+# The backend used when none is chosen
+DEFAULT_BACKEND = 'glpk'
+
+# The backend name that picks the fastest calibrated backend for the size
+# of the model (see calibrated_backend())
+AUTO_BACKEND = 'auto'
+
+# The file in the cache directory that keeps the fastest backend found for
+# each size of model
+CALIBRATION_FILE = 'lp_calibration.json'
+
+
+
+
+class LPBackend(object):
+    """
+    A linear program held by a local LP solver, built and changed in place.
+
+    The LP maximizes its objective subject to equality rows and column
+    bounds, which is all an FBA model needs.  Rows and columns are numbered
+    from 1 in the order they are added, as in GLPK, whatever numbering the
+    solver uses itself.  Each backend keeps the solver's basis between
+    solves where it can, so a model that is changed and solved again is
+    warm started.
+
+    Only the growth tests (incremental_fba.IncrementalFBA) are solved on
+    these backends.  The likelihood LP of likelihood_gapfill is built and
+    solved by PyFBA.fba.run_fba with PyFBA's own solver, whichever backend
+    is chosen.
+    """
+
+    name = None
+    # The keyword arguments the backend accepts, and the values of its
+    # method option
+    options = ()
+    methods = ()
+
+    def add_rows(self, n):
+        """
+        Add rows fixed at zero.
+
+        :param n: The number of rows to add
+        :type n: int
+        :return: The index of the first new row
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def add_columns(self, columns):
+        """
+        Add columns with a zero objective coefficient.
+
+        :param columns: A list of (coefficients, lower bound, upper bound)
+            tuples, where the coefficients are a dictionary of row index to
+            coefficient
+        :type columns: list
+        :return: The index of the first new column
+        :rtype: int
+        """
+        raise NotImplementedError
+
+    def set_col_bounds(self, j, lower, upper):
+        """Set the bounds of column j"""
+        raise NotImplementedError
+
+    def set_objective(self, j, coefficient):
+        """Set the objective coefficient of column j"""
+        raise NotImplementedError
+
+    def solve(self):
+        """
+        Solve the LP.
+
+        :return: The status: 'optimal', 'feasible', 'infeasible',
+            'unbounded', 'undefined' or 'failed'
+        :rtype: string
+        """
+        raise NotImplementedError
+
+    def objective_value(self):
+        """The objective value of the last solve"""
+        raise NotImplementedError
+
+    def column_values(self):
+        """
+        The values of all of the columns from the last solve.
+
+        :return: The values in column order, so column j is at j - 1
+        :rtype: numpy.ndarray
+        """
+        raise NotImplementedError
+
+    def size(self):
+        """
+        The size of the linear program.
+
+        :return: A dictionary with the number of rows, columns and nonzeros
+        :rtype: dict
+        """
+        raise NotImplementedError
+
+    def close(self):
+        """Free the solver's problem"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+
+class GLPKBackend(LPBackend):
+    """
+    GLPK through swiglpk, solved with the simplex method.
+    """
+
+    name = 'glpk'
+    options = ('method', 'presolve', 'verbose')
+    methods = ('dual', 'primal')
+
+    def __init__(self, method='dual', presolve=False, verbose=False):
+        """
+        :param method: The simplex method, 'dual' (dual simplex, falling
+            back to primal) or 'primal'
+        :type method: string
+        :param presolve: Use the LP presolver.  Presolve discards the basis,
+            so with it every solve starts from scratch.
+        :type presolve: bool
+        :param verbose: Print the solver's messages
+        :type verbose: bool
+        """
+        if glpk is None:
+            raise ImportError("The glpk backend needs swiglpk")
+        self.iterations = 0
+        self.lp = glpk.glp_create_prob()
+        glpk.glp_set_obj_dir(self.lp, glpk.GLP_MAX)
+        self.smcp = glpk.glp_smcp()
+        glpk.glp_init_smcp(self.smcp)
+        self.smcp.msg_lev = glpk.GLP_MSG_ON if verbose else glpk.GLP_MSG_OFF
+        self.smcp.meth = {'dual': glpk.GLP_DUALP,
+                          'primal': glpk.GLP_PRIMAL}[method]
+        self.smcp.presolve = glpk.GLP_ON if presolve else glpk.GLP_OFF
+        self._has_basis = False
+
+    def add_rows(self, n):
+        first = glpk.glp_add_rows(self.lp, n)
+        for i in range(first, first + n):
+            glpk.glp_set_row_bnds(self.lp, i, glpk.GLP_FX, 0.0, 0.0)
+        return first
+
+    def add_columns(self, columns):
+        first = glpk.glp_add_cols(self.lp, len(columns))
+        for j, (coefficients, lower, upper) in enumerate(columns, first):
+            self.set_col_bounds(j, lower, upper)
+            ind = glpk.intArray(len(coefficients) + 1)
+            val = glpk.doubleArray(len(coefficients) + 1)
+            for k, (i, coeff) in enumerate(coefficients.items(), 1):
+                ind[k] = i
+                val[k] = coeff
+            glpk.glp_set_mat_col(self.lp, j, len(coefficients), ind, val)
+        return first
+
+    def set_col_bounds(self, j, lower, upper):
+        if lower == upper:
+            glpk.glp_set_col_bnds(self.lp, j, glpk.GLP_FX, lower, upper)
+        else:
+            glpk.glp_set_col_bnds(self.lp, j, glpk.GLP_DB, lower, upper)
+
+    def set_objective(self, j, coefficient):
+        glpk.glp_set_obj_coef(self.lp, j, coefficient)
+
+    def solve(self):
+        if not self._has_basis:
+            glpk.glp_std_basis(self.lp)
+            self._has_basis = True
+        itcnt = glpk.glp_get_it_cnt(self.lp)
+        ret = glpk.glp_simplex(self.lp, self.smcp)
+        if ret in (glpk.GLP_EBADB, glpk.GLP_ESING, glpk.GLP_ECOND):
+            # The previous basis could not be reused, start from a new one
+            glpk.glp_std_basis(self.lp)
+            ret = glpk.glp_simplex(self.lp, self.smcp)
+        self.iterations += glpk.glp_get_it_cnt(self.lp) - itcnt
+
+        if ret != 0:
+            return 'failed'
+        return {glpk.GLP_OPT: 'optimal',
+                glpk.GLP_FEAS: 'feasible',
+                glpk.GLP_INFEAS: 'infeasible',
+                glpk.GLP_NOFEAS: 'infeasible',
+                glpk.GLP_UNBND: 'unbounded',
+                glpk.GLP_UNDEF: 'undefined'}.get(glpk.glp_get_status(self.lp),
+                                                 'undefined')
+
+    def objective_value(self):
+        return glpk.glp_get_obj_val(self.lp)
+
+    def column_values(self):
+        return np.array([glpk.glp_get_col_prim(self.lp, j) for j in
+                         range(1, glpk.glp_get_num_cols(self.lp) + 1)])
+
+    def size(self):
+        return {'rows': glpk.glp_get_num_rows(self.lp),
+                'columns': glpk.glp_get_num_cols(self.lp),
+                'nonzeros': glpk.glp_get_num_nz(self.lp)}
+
+    def close(self):
+        if self.lp is not None:
+            glpk.glp_delete_prob(self.lp)
+            self.lp = None
+
+
+
+
+class HiGHSBackend(LPBackend):
+    """
+    HiGHS through highspy.  HiGHS keeps its basis when bounds change or
+    columns are added, so simplex solves are warm started.
+    """
+
+    name = 'highs'
+    options = ('method', 'presolve', 'threads', 'verbose')
+    methods = ('dual', 'primal', 'ipm')
+
+    def __init__(self, method='dual', presolve=False, threads=1, verbose=False):
+        """
+        :param method: 'dual' or 'primal' simplex, or 'ipm' for the
+            interior point method (which is not warm started)
+        :type method: string
+        :param presolve: Use the LP presolver
+        :type presolve: bool
+        :param threads: The number of threads HiGHS may use
+        :type threads: int
+        :param verbose: Print the solver's messages
+        :type verbose: bool
+        """
+        if highspy is None:
+            raise ImportError("The highs backend needs highspy")
+        self.iterations = 0
+        self.lp = highspy.Highs()
+        self.lp.setOptionValue('output_flag', bool(verbose))
+        self.lp.setOptionValue('presolve', 'on' if presolve else 'off')
+        self.lp.setOptionValue('threads', int(threads))
+        if method == 'ipm':
+            self.lp.setOptionValue('solver', 'ipm')
+        else:
+            self.lp.setOptionValue('solver', 'simplex')
+            # HiGHS simplex strategies: 1 is dual, 4 is primal
+            self.lp.setOptionValue('simplex_strategy',
+                                   {'dual': 1, 'primal': 4}[method])
+        self.lp.changeObjectiveSense(highspy.ObjSense.kMaximize)
+
+    def add_rows(self, n):
+        first = self.lp.getNumRow() + 1
+        zeros = np.zeros(n)
+        self.lp.addRows(n, zeros, zeros, 0, np.zeros(n, dtype=np.int32),
+                        np.zeros(0, dtype=np.int32), np.zeros(0))
+        return first
+
+    def add_columns(self, columns):
+        first = self.lp.getNumCol() + 1
+        starts = np.zeros(len(columns), dtype=np.int32)
+        indices = []
+        values = []
+        for k, (coefficients, lower, upper) in enumerate(columns):
+            starts[k] = len(indices)
+            for i, coeff in coefficients.items():
+                indices.append(i - 1)
+                values.append(coeff)
+        self.lp.addCols(len(columns), np.zeros(len(columns)),
+                        np.array([c[1] for c in columns], dtype=np.float64),
+                        np.array([c[2] for c in columns], dtype=np.float64),
+                        len(indices), starts, np.array(indices, dtype=np.int32),
+                        np.array(values, dtype=np.float64))
+        return first
+
+    def set_col_bounds(self, j, lower, upper):
+        self.lp.changeColBounds(j - 1, lower, upper)
+
+    def set_objective(self, j, coefficient):
+        self.lp.changeColCost(j - 1, coefficient)
+
+    def solve(self):
+        self.lp.run()
+        info = self.lp.getInfo()
+        self.iterations += max(0, info.simplex_iteration_count) +\
+            max(0, info.ipm_iteration_count)
+        status = self.lp.getModelStatus()
+        if status == highspy.HighsModelStatus.kOptimal:
+            return 'optimal'
+        if status in (highspy.HighsModelStatus.kInfeasible,
+                      highspy.HighsModelStatus.kUnboundedOrInfeasible):
+            return 'infeasible'
+        if status == highspy.HighsModelStatus.kUnbounded:
+            return 'unbounded'
+        if status in (highspy.HighsModelStatus.kTimeLimit,
+                      highspy.HighsModelStatus.kIterationLimit,
+                      highspy.HighsModelStatus.kUnknown):
+            return 'undefined'
+        return 'failed'
+
+    def objective_value(self):
+        return self.lp.getInfo().objective_function_value
+
+    def column_values(self):
+        return np.array(self.lp.getSolution().col_value)
+
+    def size(self):
+        return {'rows': self.lp.getNumRow(),
+                'columns': self.lp.getNumCol(),
+                'nonzeros': self.lp.getNumNz()}
+
+    def close(self):
+        self.lp = None
+
+
+
+
+BACKENDS = {GLPKBackend.name: GLPKBackend,
+            HiGHSBackend.name: HiGHSBackend}
+
+
+
+
+def available_backends():
+    """
+    The names of the backends whose solvers are installed.
+
+    :rtype: list
+    """
+    installed = {'glpk': glpk is not None, 'highs': highspy is not None}
+    return sorted(name for name in BACKENDS if installed[name])
+
+
+
+
+def check_backend(name, options):
+    """
+    Check a backend name and its options, so a mistake is reported when the
+    backend is chosen rather than when a worker first builds its LP.
+
+    :param name: The backend name
+    :type name: string
+    :param options: The solver options
+    :type options: dict
+    :raises ValueError: If the backend, an option or the method is unknown
+    """
+    if name not in BACKENDS:
+        raise ValueError("Unknown LP backend {}, expected one of {}".format(
+            name, ", ".join(sorted(BACKENDS) + [AUTO_BACKEND])))
+    backend = BACKENDS[name]
+    unknown = sorted(set(options) - set(backend.options))
+    if unknown:
+        raise ValueError("Unknown option {} for the {} backend, expected one of {}"
+                         .format(", ".join(unknown), name, ", ".join(backend.options)))
+    if 'method' in options and options['method'] not in backend.methods:
+        raise ValueError("Unknown method {} for the {} backend, expected one of {}"
+                         .format(options['method'], name, ", ".join(backend.methods)))
+
+
+
+
+def parse_backend(spec):
+    """
+    Parse a backend given on the command line as a name followed by
+    solver options, e.g. "highs:method=primal,threads=4", or "auto" for
+    the fastest calibrated backend.
+
+    :param spec: The backend specification
+    :type spec: string
+    :return: The backend name and a dictionary of options
+    :rtype: (string, dict)
+    :raises ValueError: If the backend, an option or the method is unknown
+    """
+    name, _, option_text = spec.partition(':')
+    options = {}
+    for option in option_text.split(','):
+        if not option.strip():
+            continue
+        key, _, value = option.partition('=')
+        value = value.strip()
+        if value.lower() in ('true', 'on', 'yes'):
+            value = True
+        elif value.lower() in ('false', 'off', 'no'):
+            value = False
+        elif value.isdigit():
+            value = int(value)
+        options[key.strip()] = value
+    if name == AUTO_BACKEND:
+        if options:
+            raise ValueError("The {} backend takes no options".format(AUTO_BACKEND))
+        return name, options
+    check_backend(name, options)
+    return name, options
+
+
+
+
+def make_backend(backend=None):
+    """
+    Create the LP for a backend.  Backends are passed around by name, or as
+    a (name, options) pair, so they can be sent to worker processes.  The
+    auto backend must be resolved first (see resolve_backend()).
+
+    :param backend: The backend name, a (name, options) pair, or None for
+        the default backend
+    :type backend: string or tuple
+    :rtype: LPBackend
+    """
+    if backend is None:
+        backend = DEFAULT_BACKEND
+    if isinstance(backend, str):
+        name, options = parse_backend(backend)
+    else:
+        name, options = backend
+    check_backend(name, options)
+    return BACKENDS[name](**options)
+
+
+
+
+def size_class(n_reactions):
+    """
+    The size class of a model: models within a factor of two of each other
+    in their number of reactions share a class.
+
+    :param n_reactions: The number of reactions in the model
+    :type n_reactions: int
+    :rtype: int
+    """
+    return int(n_reactions).bit_length()
+
+
+
+
+def calibration_file(cache_dir=None):
+    """
+    The file keeping the fastest backend for each size of model.
+
+    :param cache_dir: The cache directory (defaults to
+        model_seed_cache.cache_directory())
+    :type cache_dir: string
+    :rtype: string
+    """
+    if cache_dir is None:
+        # Imported here so the backends can be used without PyFBA installed
+        from model_seed_cache import cache_directory
+        cache_dir = cache_directory()
+    return os.path.join(cache_dir, CALIBRATION_FILE)
+
+
+
+
+def load_calibration(cache_dir=None):
+    """
+    Read the fastest backend recorded for each size class.
+
+    :param cache_dir: The cache directory
+    :type cache_dir: string
+    :return: A dictionary of size class to (name, options) pair
+    :rtype: dict
+    """
+    path = calibration_file(cache_dir)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fin:
+        calibration = json.load(fin)
+    return {int(size): (name, options)
+            for size, (name, options) in calibration.items()}
+
+
+
+
+def record_calibration(n_reactions, backend, cache_dir=None):
+    """
+    Keep a backend as the fastest one for models of this size, replacing
+    whatever was recorded for the size class before.  The file is written
+    to a temporary file first and moved into place.
+
+    :param n_reactions: The number of reactions in the calibrated model
+    :type n_reactions: int
+    :param backend: The fastest backend as a (name, options) pair
+    :type backend: tuple
+    :param cache_dir: The cache directory
+    :type cache_dir: string
+    """
+    name, options = backend
+    check_backend(name, options)
+    calibration = load_calibration(cache_dir)
+    calibration[size_class(n_reactions)] = (name, options)
+    path = calibration_file(cache_dir)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as fout:
+            json.dump({str(size): list(b) for size, b in calibration.items()},
+                      fout, indent=1, sort_keys=True)
+        os.replace(tmp, path)
+    except:
+        os.remove(tmp)
+        raise
+
+
+
+
+def calibrated_backend(n_reactions, cache_dir=None):
+    """
+    The fastest backend recorded for the size class nearest to a model's.
+
+    :param n_reactions: The number of reactions in the model
+    :type n_reactions: int
+    :param cache_dir: The cache directory
+    :type cache_dir: string
+    :return: The (name, options) pair, or None if nothing was recorded
+    :rtype: tuple
+    """
+    calibration = load_calibration(cache_dir)
+    if not calibration:
+        return None
+    target = size_class(n_reactions)
+    # Prefer the larger class when two are as near
+    nearest = min(calibration, key=lambda size: (abs(size - target), -size))
+    return calibration[nearest]
+
+
+
+
+def resolve_backend(backend, n_reactions=None, cache_dir=None):
+    """
+    Turn the auto backend into the fastest backend calibrated for a model of
+    this size, falling back to the default backend when no calibration was
+    recorded (see incremental_fba.calibrate_backends()) or the size of the
+    model is not known.  Any other backend is returned unchanged.
+
+    :param backend: The backend name, a (name, options) pair, or None
+    :type backend: string or tuple
+    :param n_reactions: The number of reactions in the model
+    :type n_reactions: int
+    :param cache_dir: The cache directory holding the calibration
+    :type cache_dir: string
+    :rtype: string or tuple
+    """
+    name = backend[0] if isinstance(backend, tuple) else backend
+    if name != AUTO_BACKEND:
+        return backend
+    if n_reactions is None:
+        return DEFAULT_BACKEND
+    return calibrated_backend(n_reactions, cache_dir) or DEFAULT_BACKEND
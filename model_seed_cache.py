@@ -0,0 +1,236 @@
+from __future__ import print_function
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Bump this when the layout of the cache file changes
+CACHE_VERSION = 1
+
+# Default location of the cache, can be overridden with the
+# GAPFILL_CACHE_DIR environment variable
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache',
+                                 'likelihood_gapfill')
+
+
+
+
+def cache_directory(cache_dir=None):
+    """
+    Return the directory used to store cached data, creating it if needed.
+
+    :param cache_dir: Directory to use instead of the default
+    :type cache_dir: string
+    :return: The cache directory
+    :rtype: string
+    """
+    if cache_dir is None:
+        cache_dir = os.environ.get('GAPFILL_CACHE_DIR', DEFAULT_CACHE_DIR)
+    if not os.path.isdir(cache_dir):
+        os.makedirs(cache_dir)
+    return cache_dir
+
+
+
+
+def model_seed_source_files():
+    """
+    Find the files the Model SEED database is parsed from.  These are the
+    files in the directory named by the ModelSEEDDatabase environment
+    variable and the Biochemistry directory shipped with PyFBA.
+
+    :return: A sorted list of file paths
+    :rtype: list
+    """
+    source_dirs = [os.path.join(os.path.dirname(os.path.abspath(PyFBA.__file__)),
+                                'Biochemistry')]
+    if 'ModelSEEDDatabase' in os.environ:
+        source_dirs.append(os.environ['ModelSEEDDatabase'])
+
+    source_files = set()
+    for source_dir in source_dirs:
+        for root, dirs, files in os.walk(source_dir):
+            # Skip version control and other hidden directories
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for f in files:
+                if not f.startswith('.'):
+                    source_files.add(os.path.abspath(os.path.join(root, f)))
+    return sorted(source_files)
+
+
+
+
+def file_hash(filepath):
+    """
+    Compute the SHA-1 hash of the contents of a file.
+
+    :param filepath: Path to the file
+    :type filepath: string
+    :return: The hex digest of the file contents
+    :rtype: string
+    """
+    sha = hashlib.sha1()
+    with open(filepath, 'rb') as fin:
+        for block in iter(lambda: fin.read(1 << 20), b''):
+            sha.update(block)
+    return sha.hexdigest()
+
+
+
+
+def source_manifest(source_files, previous=None):
+    """
+    Build the manifest of (size, mtime, hash) for each of the source files.
+
+    Files whose size and modification time match the previous manifest keep
+    their previously computed hash, so only files that were touched since
+    the cache was written are re-hashed.
+
+    :param source_files: The source file paths
+    :type source_files: list
+    :param previous: A previously computed manifest
+    :type previous: dict
+    :return: A dictionary of file path to (size, mtime, hash)
+    :rtype: dict
+    """
+    if previous is None:
+        previous = {}
+    manifest = {}
+    for f in source_files:
+        st = os.stat(f)
+        old = previous.get(f)
+        if old is not None and old[0] == st.st_size and old[1] == st.st_mtime:
+            manifest[f] = old
+        else:
+            manifest[f] = (st.st_size, st.st_mtime, file_hash(f))
+    return manifest
+
+
+
+
+def _manifest_is_current(cached, source_files):
+    """
+    Check a snapshot's manifest against the source files.  Sizes and
+    modification times are compared first, and a file is only hashed when
+    its size is unchanged but its modification time is not (e.g. after a
+    fresh checkout), so an unchanged tree is never hashed.
+    """
+    if set(cached) != set(source_files):
+        return False
+    for f in source_files:
+        st = os.stat(f)
+        size, mtime, digest = cached[f]
+        if st.st_size != size:
+            return False
+        if st.st_mtime != mtime and file_hash(f) != digest:
+            return False
+    return True
+
+
+
+
+def cached_snapshot(name, orgtype, build, cache_dir=None, verbose=False):
+    """
+    Load data derived from the Model SEED database from a binary snapshot,
+    building and saving it first if there is no valid snapshot.
+
+    The snapshot is keyed by its name, the organism type, the PyFBA
+    version, and the sizes, modification times and hashes of the Model SEED
+    source files, and it is rebuilt whenever any of these change.  A
+    snapshot that can no longer be unpickled, e.g. because PyFBA classes
+    were renamed or moved, is rebuilt too.
+
+    :param name: Name of the snapshot
+    :type name: string
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param build: Function called with no arguments to build the data
+    :type build: function
+    :param cache_dir: Directory to store the snapshot in
+    :type cache_dir: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The data returned by build()
+    """
+    cache_file = os.path.join(cache_directory(cache_dir),
+                              '{}_{}.pickle'.format(name, orgtype))
+    source_files = model_seed_source_files()
+    pyfba_version = getattr(PyFBA, '__version__', None)
+
+    # The snapshot holds two pickles: a small header with the source file
+    # manifest, followed by the data itself.  Only the header is read to
+    # decide whether the snapshot is still valid.  A corrupt snapshot can
+    # fail to unpickle with almost any error, and is rebuilt.
+    cached_manifest = None
+    if os.path.exists(cache_file):
+        try:
+            with open(cache_file, 'rb') as fin:
+                header = pickle.load(fin)
+                if header.get('version') == CACHE_VERSION and\
+                   header.get('orgtype') == orgtype and\
+                   header.get('pyfba_version') == pyfba_version:
+                    cached_manifest = header['manifest']
+                    if _manifest_is_current(cached_manifest, source_files):
+                        if verbose:
+                            print("Loading {} from {}".format(name, cache_file),
+                                  file=sys.stderr)
+                        return pickle.load(fin)
+        except (EOFError, KeyError, AttributeError, ImportError, ValueError,
+                TypeError, pickle.UnpicklingError) as e:
+            cached_manifest = None
+            if verbose:
+                print("Ignoring unreadable cache file {}: {}"
+                      .format(cache_file, e), file=sys.stderr)
+
+    if verbose:
+        print("Building {} ...".format(name), file=sys.stderr)
+    data = build()
+    manifest = source_manifest(source_files, cached_manifest)
+
+    # Write to a temporary file and move it into place so concurrent runs
+    # never see a partially written snapshot
+    header = {'version': CACHE_VERSION, 'orgtype': orgtype,
+              'pyfba_version': pyfba_version, 'manifest': manifest}
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            pickle.dump(header, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            pickle.dump(data, fout, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, cache_file)
+    except:
+        os.remove(tmp)
+        raise
+    if verbose:
+        print("Saved {} to {}".format(name, cache_file), file=sys.stderr)
+
+    return data
+
+
+
+
+def compounds_reactions_enzymes(orgtype='gramnegative', cache_dir=None,
+                                verbose=False):
+    """
+    Load the Model SEED compounds, reactions, and enzyme complexes, using a
+    binary snapshot on disk when one is available.
+
+    This is a drop-in replacement for
+    PyFBA.parse.model_seed.compounds_reactions_enzymes().  The snapshot is
+    rebuilt whenever any of the Model SEED source files change.
+
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param cache_dir: Directory to store the snapshot in
+    :type cache_dir: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The compounds, reactions, and enzymes dictionaries
+    :rtype: (dict, dict, dict)
+    """
+    return cached_snapshot('model_seed', orgtype,
+                           lambda: PyFBA.parse.model_seed.compounds_reactions_enzymes(orgtype),
+                           cache_dir=cache_dir, verbose=verbose)
@@ -0,0 +1,316 @@
+from __future__ import print_function
+import multiprocessing
+import os
+import sys
+import model_seed_cache
+from gapfill_profile import GapfillProfile
+from likelihood_gapfill import likelihood_gapfill_optimization
+from reaction_probabilities import load_reaction_probabilities
+from role_reaction_index import get_role_reaction_index
+from shared_universe import publish_reaction_universe
+from sparse_stoichiometry import get_reaction_universe, use_reaction_universe
+from suggestion_cache import cached_suggest_additional_reactions
+from worker_pool import run_tasks
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Per-process gap-filling state, populated once in each worker by
+# _init_worker() so the Model SEED database is only loaded in a worker a
+# single time rather than once per media condition
+_worker_state = {}
+
+
+
+
+def _init_worker(database, orgtype, universe, draft_reactions, draft_roles,
+                 biomass_equation, essential_reactions, close_roles_file,
+                 genus_roles_file, role_probabilities_file, media_dir,
+                 profile_dir, minimal_stages, backend, verbose):
+    """
+    Initialize a gap-filling worker process with the Model SEED database
+    and the draft model.  Without a database, the worker loads the snapshot
+    of the organism type's database from disk instead of receiving a copy
+    from the parent, and uses the reaction universe the parent published
+    in shared memory rather than building its own.
+    """
+    if database is None:
+        compounds, reactions, enzymes =\
+            model_seed_cache.compounds_reactions_enzymes(orgtype, verbose=verbose)
+    else:
+        compounds, reactions = database
+    if universe is not None:
+        use_reaction_universe(reactions, universe)
+    _worker_state['compounds'] = compounds
+    _worker_state['reactions'] = reactions
+    _worker_state['role_index'] =\
+        get_role_reaction_index(orgtype) if orgtype is not None else None
+    _worker_state['draft_reactions'] = draft_reactions
+    _worker_state['draft_roles'] = draft_roles
+    _worker_state['biomass_equation'] = biomass_equation
+    _worker_state['essential_reactions'] = essential_reactions
+    _worker_state['close_roles_file'] = close_roles_file
+    _worker_state['genus_roles_file'] = genus_roles_file
+    _worker_state['role_probabilities_file'] = role_probabilities_file
+    _worker_state['media_dir'] = media_dir
+    _worker_state['profile_dir'] = profile_dir
+    _worker_state['minimal_stages'] = minimal_stages
+    _worker_state['backend'] = backend
+    _worker_state['verbose'] = verbose
+
+
+
+
+def _gapfill_worker(media_condition):
+    """
+    Run suggestion and likelihood gap-filling for a single media condition
+    using the state of the current worker process.
+    """
+    return gapfill_media_condition(media_condition,
+                                   _worker_state['compounds'],
+                                   _worker_state['reactions'],
+                                   _worker_state['draft_reactions'],
+                                   _worker_state['draft_roles'],
+                                   _worker_state['biomass_equation'],
+                                   _worker_state['essential_reactions'],
+                                   _worker_state['close_roles_file'],
+                                   _worker_state['genus_roles_file'],
+                                   _worker_state['role_probabilities_file'],
+                                   _worker_state['media_dir'],
+                                   profile_dir=_worker_state['profile_dir'],
+                                   minimal_stages=_worker_state['minimal_stages'],
+                                   role_index=_worker_state['role_index'],
+                                   backend=_worker_state['backend'],
+                                   verbose=_worker_state['verbose'])
+
+
+
+
+def gapfill_media_condition(media_condition, compounds, reactions,
+                            draft_reactions, draft_roles, biomass_equation,
+                            essential_reactions, close_roles_file,
+                            genus_roles_file, role_probabilities_file,
+                            media_dir, profile_dir=None, minimal_stages=False,
+                            role_index=None, backend=None, verbose=True):
+    """
+    Suggest reactions and run the likelihood-based gap-filling optimization
+    for a single media condition.
+
+    :param media_condition: Name of the media condition (the media file name
+        without the .txt extension)
+    :type media_condition: string
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param draft_reactions: The set of reaction ids from the draft model
+    :type draft_reactions: set
+    :param draft_roles: The set of functional roles from the draft model
+    :type draft_roles: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param essential_reactions: The set of essential reactions
+    :type essential_reactions: set
+    :param close_roles_file: A filepath to a file with a list of roles present in RAST close genomes
+    :type close_roles_file: string
+    :param genus_roles_file: A filepath to a file with a list of roles present in genomes from the same genus
+    :type genus_roles_file: string
+    :param role_probabilities_file: Filepath to the reaction probabilities
+        file, or an already loaded ReactionProbabilities store
+    :type role_probabilities_file: string or ReactionProbabilities
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param profile_dir: Directory to write a JSON profile of the stages of
+        gap-filling to, as <media_condition>.json
+    :type profile_dir: string
+    :param minimal_stages: Only suggest the reactions of the suggestion
+        stages that are needed for the model to grow
+    :type minimal_stages: bool
+    :param role_index: The index used to map the suggested reactions to
+        roles (defaults to the Model SEED index)
+    :type role_index: role_reaction_index.RoleReactionIndex
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The media condition, the set of reactions added in gap-filling
+        and a dictionary of fluxes for the added reactions
+    :rtype: (string, set, dict)
+    """
+    if verbose:
+        print("\n\n\nGap-filling on {} media...".format(media_condition))
+
+    profile = GapfillProfile(media=media_condition)
+
+    # Read the media file and set the media variable
+    with profile.stage('read_media'):
+        media = PyFBA.parse.read_media_file(media_dir + media_condition + '.txt')
+
+    # Suggest additional reactions, reusing earlier suggestions for the
+    # same draft model and media
+    suggested_rxns, suggested_roles, source =\
+        cached_suggest_additional_reactions(compounds, reactions,
+                                            draft_reactions, draft_roles,
+                                            media, biomass_equation,
+                                            close_roles_file, genus_roles_file,
+                                            verbose=verbose, profile=profile,
+                                            minimal_stages=minimal_stages,
+                                            role_index=role_index,
+                                            backend=backend)
+    if verbose:
+        print("\n{} reactions were suggested to complete the model for {} media.\n"
+              .format(len(suggested_rxns), media_condition))
+
+    # Run likelihood gap-filling optimization
+    added_reactions, added_rxn_fluxes =\
+        likelihood_gapfill_optimization(compounds, reactions, draft_reactions,
+                                        suggested_rxns, biomass_equation,
+                                        media, role_probabilities_file,
+                                        essential_reactions, verbose=verbose,
+                                        profile=profile, reaction_source=source)
+
+    if profile_dir is not None:
+        profile.write(os.path.join(profile_dir, media_condition + '.json'))
+
+    return media_condition, added_reactions, added_rxn_fluxes
+
+
+
+
+def gapfill_media_conditions(media_conditions, compounds, reactions,
+                             draft_reactions, draft_roles, biomass_equation,
+                             essential_reactions, close_roles_file,
+                             genus_roles_file, role_probabilities_file,
+                             media_dir, processes=None, journal=None,
+                             profile_dir=None, minimal_stages=False,
+                             orgtype=None, backend=None, verbose=True):
+    """
+    Run likelihood-based gap-filling on each of the media conditions using a
+    pool of worker processes.
+
+    When an organism type is given, the compounds and reactions must be its
+    Model SEED database as loaded by model_seed_cache, and each worker
+    loads the database from the snapshot on disk rather than receiving a
+    copy from this process.  Otherwise every worker receives its own copy.
+    In both cases the reaction universe is published once in shared memory
+    for all of the workers.  Results are collected as the workers finish
+    and are then aggregated in sorted media order, so the returned
+    aggregates are the same regardless of the order in which the media
+    conditions complete.
+
+    When a journal is given, each result is appended to it as soon as the
+    media condition completes.  Media conditions that are already in the
+    journal are not gap-filled again; their results are read back from the
+    journal instead, so an interrupted run can be resumed.
+
+    :param media_conditions: The media conditions to gap-fill on
+    :type media_conditions: set
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param draft_reactions: The set of reaction ids from the draft model
+    :type draft_reactions: set
+    :param draft_roles: The set of functional roles from the draft model
+    :type draft_roles: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param essential_reactions: The set of essential reactions
+    :type essential_reactions: set
+    :param close_roles_file: A filepath to a file with a list of roles present in RAST close genomes
+    :type close_roles_file: string
+    :param genus_roles_file: A filepath to a file with a list of roles present in genomes from the same genus
+    :type genus_roles_file: string
+    :param role_probabilities_file: Filepath to the reaction probabilities
+        file, or an already loaded ReactionProbabilities store
+    :type role_probabilities_file: string or ReactionProbabilities
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param processes: Number of worker processes (defaults to the number of CPUs)
+    :type processes: int
+    :param journal: Journal to record the results in and resume from
+    :type journal: gapfill_journal.GapfillJournal
+    :param profile_dir: Directory to write a JSON profile of each media
+        condition to
+    :type profile_dir: string
+    :param minimal_stages: Only suggest the reactions of the suggestion
+        stages that are needed for the model to grow
+    :type minimal_stages: bool
+    :param orgtype: The organism type of the Model SEED database, which is
+        also used to map the suggested reactions to roles
+    :type orgtype: string
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The set of all reactions added in gap-filling, a dictionary of
+        the media each added reaction came from, and a dictionary of the
+        reactions added on each media condition
+    :rtype: (set, dict, dict)
+    """
+    media_conditions = sorted(media_conditions)
+    media_added_rxns = {}
+    if journal is not None:
+        # Reuse the results of the media conditions that are already done
+        for media_condition, added_reactions in journal.completed().items():
+            if media_condition in media_conditions:
+                media_added_rxns[media_condition] = added_reactions
+        if media_added_rxns:
+            print("{} of {} media conditions were already gap-filled in {}"
+                  .format(len(media_added_rxns), len(media_conditions),
+                          journal.path))
+    remaining = [m for m in media_conditions if m not in media_added_rxns]
+
+    def record(media_condition, added_reactions, added_rxn_fluxes):
+        if journal is not None:
+            journal.record(media_condition, added_reactions, added_rxn_fluxes)
+        media_added_rxns[media_condition] = added_reactions
+        print("{} reactions were added in gap-filling on {} media. ({}/{})"
+              .format(len(added_reactions), media_condition,
+                      len(media_added_rxns), len(media_conditions)))
+
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(remaining)))
+
+    # Load the reaction probabilities once up front.  The store is sent to
+    # the workers by file path and memory-mapped there, so all of the
+    # workers share a single copy.
+    role_probabilities = load_reaction_probabilities(role_probabilities_file,
+                                                     verbose=verbose)
+
+    worker_args = (draft_reactions, draft_roles, biomass_equation,
+                   essential_reactions, close_roles_file, genus_roles_file,
+                   role_probabilities, media_dir, profile_dir, minimal_stages,
+                   backend, verbose)
+
+    if processes == 1:
+        for result in run_tasks(_gapfill_worker, remaining, _init_worker,
+                                ((compounds, reactions), orgtype, None) +
+                                worker_args, finalizer=_worker_state.clear):
+            record(*result)
+    else:
+        database = (compounds, reactions) if orgtype is None else None
+        with publish_reaction_universe(get_reaction_universe(reactions)) as shared:
+            for result in run_tasks(_gapfill_worker, remaining, _init_worker,
+                                    (database, orgtype, shared) + worker_args,
+                                    processes, ordered=False):
+                record(*result)
+
+    # Aggregate the results in sorted media order
+    gapfill_added_rxns = set()
+    gapfill_media_source = {}
+    for media_condition in media_conditions:
+        added_reactions = media_added_rxns[media_condition]
+        # Record reactions added to the model in gapfilling
+        gapfill_added_rxns.update(added_reactions)
+        # Record which media the reaction was added from
+        for rxn in sorted(added_reactions):
+            if rxn not in gapfill_media_source:
+                gapfill_media_source[rxn] = [media_condition]
+            else:
+                gapfill_media_source[rxn].append(media_condition)
+
+    return gapfill_added_rxns, gapfill_media_source, media_added_rxns
@@ -0,0 +1,246 @@
+from __future__ import print_function
+import copy
+try:
+    from collections.abc import MutableMapping
+except ImportError:
+    from collections import MutableMapping
+
+
+# Reaction attributes that describe one side or one direction of a reaction,
+# and the attribute holding the same thing for the reverse direction
+REVERSED_ATTRIBUTES = {'left_abundance': 'right_abundance',
+                       'right_abundance': 'left_abundance',
+                       'pLR': 'pRL', 'pRL': 'pLR',
+                       'inp': 'outp', 'outp': 'inp'}
+
+# Directions swapped by reversing a reaction
+REVERSED_DIRECTIONS = {'>': '<', '<': '>'}
+
+# Reaction methods that modify the reaction.  A view shares its reaction
+# with the base dictionary, so these are not passed through to it.
+MODIFYING_METHODS = frozenset(['set_direction', 'add_left_compounds',
+                               'add_right_compounds',
+                               'set_left_compound_abundance',
+                               'set_right_compound_abundance',
+                               'set_probability_left_to_right',
+                               'set_probability_right_to_left', 'set_deltaG',
+                               'check_input_output', 'toggle_input_reaction',
+                               'toggle_output_reaction', 'reverse_reaction',
+                               'split_reaction', 'add_attribute',
+                               'reset_bounds'])
+
+
+
+
+class ReactionView(object):
+    """
+    A reaction that runs left to right, seen through a Model SEED reaction in
+    one of its two directions.
+
+    Reversing a reaction or splitting a bidirectional reaction into forward
+    and reverse halves would otherwise copy the whole Reaction object.  A
+    view only holds the base reaction and a direction sign (+1 forward, -1
+    reverse): the compounds and abundances are read from the base reaction,
+    with the two sides swapped for the reverse direction, as are the
+    direction probabilities, the input/output flags, the gap-filling
+    direction and the sign of delta G, following Reaction.reverse_reaction().
+    Any other attribute is read from the base reaction.  Methods that would
+    modify the shared base reaction raise AttributeError; use
+    ReactionOverlay.local() to change a reaction.
+    """
+
+    __slots__ = ('base', 'sign', 'name', 'lower_bound', 'upper_bound')
+
+    def __init__(self, base, sign=1, name=None, lower_bound=None,
+                 upper_bound=None):
+        """
+        :param base: The reaction
+        :type base: metabolism.Reaction object
+        :param sign: 1 to run the reaction forward, -1 to run it in reverse
+        :type sign: int
+        :param name: The reaction id of the view (defaults to the reaction's)
+        :type name: string
+        :param lower_bound: Explicit lower flux bound
+        :type lower_bound: float
+        :param upper_bound: Explicit upper flux bound
+        :type upper_bound: float
+        """
+        if isinstance(base, ReactionView):
+            sign *= base.sign
+            base = base.base
+        self.base = base
+        self.sign = sign
+        self.name = name if name is not None else base.name
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+
+    @property
+    def direction(self):
+        return '>'
+
+    @property
+    def left_compounds(self):
+        if self.sign > 0:
+            return self.base.left_compounds
+        return self.base.right_compounds
+
+    @property
+    def right_compounds(self):
+        if self.sign > 0:
+            return self.base.right_compounds
+        return self.base.left_compounds
+
+    def get_left_compound_abundance(self, compound):
+        if self.sign > 0:
+            return self.base.get_left_compound_abundance(compound)
+        return self.base.get_right_compound_abundance(compound)
+
+    def get_right_compound_abundance(self, compound):
+        if self.sign > 0:
+            return self.base.get_right_compound_abundance(compound)
+        return self.base.get_left_compound_abundance(compound)
+
+    def get_probability_left_to_right(self):
+        return self.pLR
+
+    def get_probability_right_to_left(self):
+        return self.pRL
+
+    def get_deltaG(self):
+        return self.deltaG
+
+    def is_input_reaction(self):
+        if self.sign > 0:
+            return self.base.is_input_reaction()
+        return self.base.is_output_reaction()
+
+    def is_output_reaction(self):
+        if self.sign > 0:
+            return self.base.is_output_reaction()
+        return self.base.is_input_reaction()
+
+    def number_of_left_compounds(self):
+        return len(self.left_compounds)
+
+    def number_of_right_compounds(self):
+        return len(self.right_compounds)
+
+    def __getattr__(self, name):
+        # Only called for attributes the view does not define itself
+        if name in ReactionView.__slots__:
+            raise AttributeError(name)
+        if name in MODIFYING_METHODS:
+            raise AttributeError("{} of reaction view {} would modify the shared "
+                                 "reaction; use ReactionOverlay.local() instead"
+                                 .format(name, self.name))
+        if self.sign < 0:
+            if name in REVERSED_ATTRIBUTES:
+                return getattr(self.base, REVERSED_ATTRIBUTES[name])
+            if name == 'deltaG':
+                return -self.base.deltaG
+            if name == 'gfdirection':
+                return REVERSED_DIRECTIONS.get(self.base.gfdirection,
+                                               self.base.gfdirection)
+        return getattr(self.base, name)
+
+    def __repr__(self):
+        return "ReactionView({!r}, {})".format(self.base.name, self.sign)
+
+
+
+
+class ReactionOverlay(MutableMapping):
+    """
+    A copy-on-write view of the Model SEED reactions dictionary.
+
+    Reads fall through to the shared base dictionary, which is never
+    modified.  Reactions that are reversed, split or given new bounds are
+    replaced in the overlay by lightweight views with orient(), other
+    changes are made to a copy made with local(), and any
+    reactions added or deleted through the overlay only exist in the
+    overlay.  This lets a single gap-filling optimization change reaction
+    directions without affecting any other optimization that uses the same
+    base database.
+    """
+
+    def __init__(self, base):
+        """
+        :param base: The dictionary of reactions from the Model SEED database
+        :type base: dict
+        """
+        self.base = base
+        self.changed = {}
+        self.deleted = set()
+
+    def __getitem__(self, rxn):
+        if rxn in self.changed:
+            return self.changed[rxn]
+        if rxn in self.deleted:
+            raise KeyError(rxn)
+        return self.base[rxn]
+
+    def __setitem__(self, rxn, reaction):
+        self.deleted.discard(rxn)
+        self.changed[rxn] = reaction
+
+    def __delitem__(self, rxn):
+        if rxn not in self:
+            raise KeyError(rxn)
+        self.changed.pop(rxn, None)
+        if rxn in self.base:
+            self.deleted.add(rxn)
+
+    def __contains__(self, rxn):
+        if rxn in self.changed:
+            return True
+        return rxn not in self.deleted and rxn in self.base
+
+    def __iter__(self):
+        for rxn in self.base:
+            if rxn not in self.deleted and rxn not in self.changed:
+                yield rxn
+        for rxn in self.changed:
+            yield rxn
+
+    def __len__(self):
+        return (len(self.base) - len(self.deleted) +
+                sum(1 for rxn in self.changed if rxn not in self.base))
+
+    def local(self, rxn):
+        """
+        Return a copy of the reaction that is private to this overlay,
+        copying it from the base dictionary the first time it is requested.
+
+        :param rxn: The reaction id
+        :type rxn: string
+        :return: The overlay's own copy of the reaction
+        :rtype: metabolism.Reaction object
+        """
+        if rxn not in self.changed:
+            self.changed[rxn] = copy.deepcopy(self[rxn])
+        return self.changed[rxn]
+
+    def orient(self, rxn, sign=1, name=None, lower_bound=None,
+               upper_bound=None):
+        """
+        Put a view of a reaction that runs left to right in the overlay,
+        without copying the reaction.
+
+        :param rxn: The reaction id
+        :type rxn: string
+        :param sign: 1 to run the reaction forward, -1 to run it in reverse
+        :type sign: int
+        :param name: The reaction id to store the view under (defaults to rxn)
+        :type name: string
+        :param lower_bound: Explicit lower flux bound
+        :type lower_bound: float
+        :param upper_bound: Explicit upper flux bound
+        :type upper_bound: float
+        :return: The view
+        :rtype: ReactionView
+        """
+        if name is None:
+            name = rxn
+        view = ReactionView(self[rxn], sign, name, lower_bound, upper_bound)
+        self[name] = view
+        return view
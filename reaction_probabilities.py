@@ -0,0 +1,268 @@
+from __future__ import print_function
+import glob
+import hashlib
+import os
+import sys
+import tempfile
+import numpy as np
+from model_seed_cache import cache_directory
+try:
+    from collections.abc import Mapping
+except ImportError:
+    from collections import Mapping
+
+
+# Suffixes given to the forward and reverse halves of a split
+# bidirectional reaction by Reaction.split_reaction()
+SPLIT_SUFFIXES = ('_f', '_r')
+
+# Stores that have already been opened in this process, keyed by the
+# absolute path of the probabilities file
+_loaded = {}
+
+
+
+
+class ReactionProbabilities(Mapping):
+    """
+    Read-only reaction probabilities backed by a sorted, memory-mapped
+    index.
+
+    The reaction probabilities file is parsed once and written to the cache
+    directory as two NumPy arrays: the sorted reaction ids and their
+    probabilities.  The index is rebuilt when the file changes, and the
+    index of the previous version of the file is removed.  Later loads
+    (including loads in other worker processes) memory-map those arrays,
+    so they share the operating system's page cache and lookups are binary
+    searches.  The forward and reverse halves of a split reaction (rxn_f
+    and rxn_r) are in the store with the probability of the bidirectional
+    reaction they were split from.
+    """
+
+    def __init__(self, probabilities_file, cache_dir=None, verbose=False):
+        """
+        :param probabilities_file: Filepath to the tab-separated reaction
+            probabilities file (one header line, then reaction id and
+            probability on each line)
+        :type probabilities_file: string
+        :param cache_dir: Directory to store the index in
+        :type cache_dir: string
+        :param verbose: Verbose output
+        :type verbose: bool
+        """
+        self.probabilities_file = os.path.abspath(probabilities_file)
+        self.cache_dir = cache_dir
+        st = os.stat(self.probabilities_file)
+        self.signature = (st.st_size, st.st_mtime)
+        # The index is named by the file path and by its version, so the
+        # indexes of older versions of the same file can be found
+        path_key = hashlib.sha1(self.probabilities_file.encode('utf-8')).hexdigest()
+        version_key = hashlib.sha1('{}\t{}'.format(st.st_size, st.st_mtime)
+                                   .encode('utf-8')).hexdigest()
+        path_prefix = os.path.join(cache_directory(cache_dir),
+                                   'reaction_probabilities_' + path_key)
+        prefix = '{}_{}'.format(path_prefix, version_key)
+        ids_file = prefix + '.ids.npy'
+        values_file = prefix + '.values.npy'
+
+        if not (os.path.exists(ids_file) and os.path.exists(values_file)):
+            ids, values = self._parse(verbose)
+            _save_array(ids_file, ids)
+            _save_array(values_file, values)
+            _remove_stale(path_prefix, prefix, verbose)
+        elif verbose:
+            print("Loading reaction probabilities index {}".format(prefix),
+                  file=sys.stderr)
+        self.ids = np.load(ids_file, mmap_mode='r')
+        self.values = np.load(values_file, mmap_mode='r')
+        self._length = None
+        # The reactions already reported by report_missing()
+        self.reported = set()
+
+    def _parse(self, verbose):
+        """
+        Parse the reaction probabilities file, reporting any malformed or
+        duplicated rows once.
+        """
+        if verbose:
+            print("Loading reaction probabilities file ...")
+        probs = {}
+        malformed = []
+        duplicated = []
+        with open(self.probabilities_file, 'r') as fin:
+            for i, line in enumerate(fin):
+                if i == 0 or not line.strip():
+                    continue
+                fields = line.strip().split('\t')
+                try:
+                    r, p = fields
+                    p = float(p)
+                except ValueError:
+                    malformed.append(i + 1)
+                    continue
+                if r in probs:
+                    duplicated.append(i + 1)
+                probs[r] = p
+
+        if malformed:
+            print("WARNING: {} malformed rows in {} were skipped (lines {}{})"
+                  .format(len(malformed), self.probabilities_file,
+                          ', '.join(str(i) for i in malformed[:10]),
+                          ', ...' if len(malformed) > 10 else ''),
+                  file=sys.stderr)
+        if duplicated:
+            print("WARNING: {} reactions in {} are listed more than once; the "
+                  "last probability was used (lines {}{})"
+                  .format(len(duplicated), self.probabilities_file,
+                          ', '.join(str(i) for i in duplicated[:10]),
+                          ', ...' if len(duplicated) > 10 else ''),
+                  file=sys.stderr)
+
+        ids = sorted(probs)
+        return (np.array(ids, dtype=np.str_),
+                np.array([probs[r] for r in ids], dtype=np.float64))
+
+    def __reduce__(self):
+        # Only the file path is sent to other processes; they memory-map
+        # the same index instead of receiving a copy of the arrays
+        return (load_reaction_probabilities,
+                (self.probabilities_file, self.cache_dir))
+
+    def _find(self, rxn):
+        """Index of the reaction id in the sorted ids, or -1"""
+        if not self.ids.size:
+            return -1
+        i = int(np.searchsorted(self.ids, rxn))
+        if i < self.ids.size and self.ids[i] == rxn:
+            return i
+        return -1
+
+    def _index(self, rxn):
+        i = self._find(rxn)
+        if i < 0 and rxn[-2:] in SPLIT_SUFFIXES:
+            i = self._find(rxn[:-2])
+        return i
+
+    def __getitem__(self, rxn):
+        i = self._index(rxn)
+        if i < 0:
+            raise KeyError(rxn)
+        return float(self.values[i])
+
+    def __contains__(self, rxn):
+        return self._index(rxn) >= 0
+
+    def __iter__(self):
+        # The split halves of every reaction are in the store too, unless the
+        # file lists them itself
+        for r in self.ids:
+            r = str(r)
+            yield r
+            for suffix in SPLIT_SUFFIXES:
+                if self._find(r + suffix) < 0:
+                    yield r + suffix
+
+    def __len__(self):
+        if self._length is None:
+            listed = 0
+            for suffix in SPLIT_SUFFIXES if self.ids.size else ():
+                halves = np.char.add(self.ids, suffix)
+                idx = np.searchsorted(self.ids, halves)
+                idx[idx == self.ids.size] = 0
+                listed += int(np.count_nonzero(self.ids[idx] == halves))
+            self._length = 3 * int(self.ids.size) - listed
+        return self._length
+
+    def missing(self, rxns):
+        """
+        The reactions that have no probability.
+
+        :param rxns: The reaction ids
+        :type rxns: iterable
+        :return: The reaction ids that are not in the store, sorted
+        :rtype: list
+        """
+        return sorted(r for r in rxns if r not in self)
+
+    def report_missing(self, rxns):
+        """
+        Warn about the reactions that have no probability.  Each reaction is
+        reported once for the life of the store, so repeated calls (e.g. one
+        per media condition) only report the reactions not seen before.
+
+        :param rxns: The reaction ids
+        :type rxns: iterable
+        :return: The reaction ids newly reported, sorted
+        :rtype: list
+        """
+        new = [r for r in self.missing(rxns) if r not in self.reported]
+        if new:
+            self.reported.update(new)
+            print("WARNING: {} reactions have no probability in {} ({}{})"
+                  .format(len(new), self.probabilities_file,
+                          ', '.join(new[:10]), ', ...' if len(new) > 10 else ''),
+                  file=sys.stderr)
+        return new
+
+
+
+
+def _save_array(filepath, array):
+    """Write a NumPy array to a file atomically"""
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(filepath), suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'wb') as fout:
+            np.save(fout, array)
+        os.replace(tmp, filepath)
+    except:
+        os.remove(tmp)
+        raise
+
+
+
+
+def _remove_stale(path_prefix, prefix, verbose):
+    """
+    Remove the indexes of older versions of a probabilities file.  Processes
+    that still have an old index memory-mapped keep reading it until they
+    close it.
+    """
+    for filepath in glob.glob(path_prefix + '_*.npy'):
+        if filepath.startswith(prefix + '.'):
+            continue
+        try:
+            os.remove(filepath)
+        except OSError:
+            continue
+        if verbose:
+            print("Removed stale reaction probabilities index {}".format(filepath),
+                  file=sys.stderr)
+
+
+
+
+def load_reaction_probabilities(probabilities_file, cache_dir=None,
+                                verbose=False):
+    """
+    Return the reaction probabilities for a file, opening the store only the
+    first time the file is requested in this process.
+
+    :param probabilities_file: Filepath to the reaction probabilities file,
+        or an already loaded store, which is returned as is
+    :type probabilities_file: string or ReactionProbabilities
+    :param cache_dir: Directory to store the index in
+    :type cache_dir: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The reaction probabilities
+    :rtype: ReactionProbabilities
+    """
+    if isinstance(probabilities_file, ReactionProbabilities):
+        return probabilities_file
+    path = os.path.abspath(probabilities_file)
+    st = os.stat(path)
+    if path not in _loaded or\
+       _loaded[path].signature != (st.st_size, st.st_mtime):
+        _loaded[path] = ReactionProbabilities(path, cache_dir=cache_dir,
+                                              verbose=verbose)
+    return _loaded[path]
@@ -0,0 +1,208 @@
+from __future__ import print_function
+import argparse
+import pickle
+import sys
+import model_seed_cache
+from batch_growth_prediction import predict_growth, score_predictions
+from lp_backends import DEFAULT_BACKEND, parse_backend
+from parallel_gapfill import gapfill_media_conditions
+from role_reaction_index import get_role_reaction_index
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+
+
+def refine_model(compounds, reactions, model_reactions, model_roles,
+                 biomass_equation, essential_reactions, close_roles_file,
+                 genus_roles_file, role_probabilities_file, exp_growth_results,
+                 media_dir, max_iterations=10, processes=None,
+                 role_index=None, orgtype=None, backend=None, verbose=True):
+    """
+    Gap-fill a model on the media where it is predicted not to grow but
+    growth is observed, and repeat until the predictions stop changing.
+
+    Each iteration gap-fills only the false negative media, adds every
+    reaction added on them to the model, and then predicts growth again
+    only on the media the model was predicted not to grow on.  Adding
+    reactions to a model never lowers its maximum biomass flux, so the
+    media it already grows on cannot change.
+
+    The media that are still false negatives are gap-filled again in the
+    next iteration, against the model with the reactions added so far.  The
+    loop stops when no false negative media are left, when an iteration
+    adds no new reactions, or after max_iterations.
+
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param model_reactions: The set of reaction ids in the model
+    :type model_reactions: set
+    :param model_roles: The set of functional roles in the model
+    :type model_roles: set
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param essential_reactions: The set of essential reactions
+    :type essential_reactions: set
+    :param close_roles_file: A filepath to a file with a list of roles present in RAST close genomes
+    :type close_roles_file: string
+    :param genus_roles_file: A filepath to a file with a list of roles present in genomes from the same genus
+    :type genus_roles_file: string
+    :param role_probabilities_file: Filepath to the reaction probabilities
+        file, or an already loaded ReactionProbabilities store
+    :type role_probabilities_file: string or ReactionProbabilities
+    :param exp_growth_results: A dictionary of media condition to observed
+        growth (1 or 0)
+    :type exp_growth_results: dict
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param max_iterations: The largest number of rounds of gap-filling
+    :type max_iterations: int
+    :param processes: Number of worker processes (defaults to the number of CPUs)
+    :type processes: int
+    :param role_index: The role/reaction index used to find the roles of
+        the added reactions (defaults to the Model SEED index)
+    :type role_index: role_reaction_index.RoleReactionIndex
+    :param orgtype: The organism type of the Model SEED database (see
+        parallel_gapfill.gapfill_media_conditions())
+    :type orgtype: string
+    :param backend: The LP backend, by name or as a (name, options) pair
+        (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The reactions and roles of the refined model, a list with the
+        reactions added in each iteration, and a dictionary of media
+        condition to predicted growth (1 or 0) for the refined model
+    :rtype: (set, set, list, dict)
+    """
+    if role_index is None:
+        role_index = get_role_reaction_index(orgtype or 'gramnegative')
+    model_reactions = set(model_reactions)
+    model_roles = set(model_roles)
+
+    fba_growth_results = predict_growth(compounds, reactions, model_reactions,
+                                        biomass_equation, set(exp_growth_results),
+                                        media_dir, processes=processes,
+                                        backend=backend, verbose=verbose)
+    iteration_added_rxns = []
+    for iteration in range(max_iterations):
+        results = score_predictions(fba_growth_results, exp_growth_results)
+        to_gapfill = set(results['fn'])
+        print("Iteration {}: {} false negative media to gap-fill".format(
+            iteration + 1, len(to_gapfill)))
+        if not to_gapfill:
+            break
+
+        gapfill_added_rxns, gapfill_media_source, media_added_rxns =\
+            gapfill_media_conditions(to_gapfill, compounds, reactions,
+                                     model_reactions, model_roles,
+                                     biomass_equation, essential_reactions,
+                                     close_roles_file, genus_roles_file,
+                                     role_probabilities_file, media_dir,
+                                     processes=processes, orgtype=orgtype,
+                                     backend=backend, verbose=verbose)
+        new_reactions = gapfill_added_rxns - model_reactions
+        iteration_added_rxns.append(new_reactions)
+        print("{} reactions were added in gap-filling on {} media".format(
+            len(new_reactions), len(to_gapfill)))
+        if not new_reactions:
+            break
+        model_reactions.update(new_reactions)
+        model_roles.update(role_index.roles_for_reactions(new_reactions))
+
+        # Only the media the model did not grow on can change
+        no_growth = set(m for m in fba_growth_results
+                        if not fba_growth_results[m])
+        fba_growth_results.update(
+            predict_growth(compounds, reactions, model_reactions,
+                           biomass_equation, no_growth, media_dir,
+                           processes=processes, backend=backend,
+                           verbose=verbose))
+
+    return model_reactions, model_roles, iteration_added_rxns, fba_growth_results
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Gap-fill a model on the media '
+                                     'it is wrongly predicted not to grow on '
+                                     'until the predictions stop changing')
+    parser.add_argument('-i', '--iterations', type=int, default=10,
+                        help='Largest number of rounds of gap-filling (default: 10)')
+    parser.add_argument('-p', '--processes', type=int, default=None,
+                        help='Number of worker processes (default: number of CPUs)')
+    parser.add_argument('-o', '--output',
+                        default='citrobacter_gapfilling_4/refined_model_reactions.p',
+                        help='Pickle the reactions of the refined model to this file')
+    parser.add_argument('--backend', type=parse_backend, default=DEFAULT_BACKEND,
+                        help='LP backend and options for the growth tests, '
+                        'e.g. highs:threads=2, or auto for the fastest backend '
+                        'calibrated by benchmark_gapfill.py --calibrate; the '
+                        'likelihood LP is always solved by PyFBA '
+                        '(default: {})'.format(DEFAULT_BACKEND))
+    args = parser.parse_args()
+
+    # Load the Model SEED database
+    compounds, reactions, enzymes =\
+        model_seed_cache.compounds_reactions_enzymes('gramnegative')
+    essentials = PyFBA.gapfill.suggest_essential_reactions()
+    biomass_equation = PyFBA.metabolism.biomass_equation('gramnegative')
+
+    # Load the draft model reactions and roles and the reactions added in
+    # gap-filling on rich media
+    model_rxns = pickle.load(open('/Users/Taylor/anthill_backup/backup_archive/'
+                                  'citrobacter_gapfilling_4/citrobacter_draft_reactions.p',
+                                  'rb'))
+    model_roles = pickle.load(open('/Users/Taylor/anthill_backup/backup_archive/'
+                                   'citrobacter_gapfilling_4/citrobacter_draft_roles.p',
+                                   'rb'))
+    LB_added_rxns =\
+        pickle.load(open('/Users/Taylor/anthill_backup/backup_archive/'
+                         'citrobacter_gapfilling_4/ArgonneLB_added_reactions.p', 'rb'))
+    model_rxns.update(LB_added_rxns)
+    model_roles.update(
+        get_role_reaction_index('gramnegative').roles_for_reactions(LB_added_rxns))
+
+    # Load the experimental phenotypic growth data
+    exp_growth_results = {}
+    with open('/Users/Taylor/Desktop/c.sedlakii_growth.txt', 'r') as fin:
+        for i, line in enumerate(fin):
+            if i == 0:
+                continue
+            condition, result = line.strip().split('\t')
+            exp_growth_results[condition] = int(result)
+
+    model_rxns, model_roles, iteration_added_rxns, fba_growth_results =\
+        refine_model(compounds, reactions, model_rxns, model_roles,
+                     biomass_equation, essentials,
+                     "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/example_data/"
+                     "Citrobacter/ungapfilled_model/closest.genomes.roles",
+                     "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/example_data/"
+                     "Citrobacter/ungapfilled_model/citrobacter.roles",
+                     "/Users/Taylor/anthill_backup/backup_archive/"
+                     "genome_reaction_probabilities.txt",
+                     exp_growth_results,
+                     "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/media/",
+                     max_iterations=args.iterations, processes=args.processes,
+                     orgtype='gramnegative', backend=args.backend, verbose=False)
+
+    results = score_predictions(fba_growth_results, exp_growth_results)
+    count_agree = len(results['tp']) + len(results['tn'])
+    percent_agreement = (float(count_agree) / len(fba_growth_results)) * 100
+    print('\n\n{} reactions were added in {} iterations.'.format(
+        sum(len(r) for r in iteration_added_rxns), len(iteration_added_rxns)))
+    print('The agreement between the FBA growth results and the experimental '
+          'phenotypic growth results is {} %.'.format(percent_agreement))
+    print('\tTP: {}'.format(len(results['tp'])))
+    print('\tTN: {}'.format(len(results['tn'])))
+    print('\tFP: {}'.format(len(results['fp'])))
+    print('\tFN: {}'.format(len(results['fn'])))
+
+    pickle.dump(model_rxns, open(args.output, 'wb'))
+
+
+if __name__ == '__main__':
+    main()
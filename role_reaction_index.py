@@ -0,0 +1,154 @@
+from __future__ import print_function
+import inspect
+import sys
+import model_seed_cache
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# Indexes that have already been loaded in this process, keyed by
+# organism type
+_loaded = {}
+
+
+
+
+class RoleReactionIndex(object):
+    """
+    A bidirectional index between functional roles and Model SEED
+    reactions.
+
+    PyFBA.filters.reactions_to_roles() and roles_to_reactions() rebuild the
+    mapping from the SEED tables on every call.  This index holds both
+    directions of the mapping in memory, so bulk queries are set unions
+    over dictionary lookups.
+    """
+
+    def __init__(self, reaction_roles, orgtype=None):
+        """
+        :param reaction_roles: A dictionary of reaction id to the set of
+            roles associated with the reaction
+        :type reaction_roles: dict
+        :param orgtype: The organism type the mapping was built for
+        :type orgtype: string
+        """
+        self.orgtype = orgtype
+        self.reaction_roles = {}
+        self.role_reactions = {}
+        for rxn, roles in reaction_roles.items():
+            if not roles:
+                continue
+            self.reaction_roles[rxn] = frozenset(roles)
+            for role in roles:
+                self.role_reactions.setdefault(role, set()).add(rxn)
+        for role in self.role_reactions:
+            self.role_reactions[role] = frozenset(self.role_reactions[role])
+
+    def roles_for_reactions(self, reactions):
+        """
+        All of the roles associated with any of the reactions.
+
+        :param reactions: The reaction ids
+        :type reactions: set
+        :return: The set of roles
+        :rtype: set
+        """
+        roles = set()
+        for rxn in reactions:
+            if rxn in self.reaction_roles:
+                roles.update(self.reaction_roles[rxn])
+        return roles
+
+    def reactions_for_roles(self, roles):
+        """
+        All of the reactions associated with any of the roles.
+
+        :param roles: The functional roles
+        :type roles: set
+        :return: The set of reaction ids
+        :rtype: set
+        """
+        reactions = set()
+        for role in roles:
+            if role in self.role_reactions:
+                reactions.update(self.role_reactions[role])
+        return reactions
+
+    def reactions_to_roles(self, reactions):
+        """
+        The roles of each reaction, in the form returned by
+        PyFBA.filters.reactions_to_roles().
+
+        :param reactions: The reaction ids
+        :type reactions: set
+        :return: A dictionary of reaction id to set of roles, for the
+            reactions that have roles
+        :rtype: dict
+        """
+        return dict((rxn, set(self.reaction_roles[rxn])) for rxn in reactions
+                    if rxn in self.reaction_roles)
+
+    def roles_to_reactions(self, roles):
+        """
+        The reactions of each role, in the form returned by
+        PyFBA.filters.roles_to_reactions().
+
+        :param roles: The functional roles
+        :type roles: set
+        :return: A dictionary of role to set of reaction ids, for the roles
+            that have reactions
+        :rtype: dict
+        """
+        return dict((role, set(self.role_reactions[role])) for role in roles
+                    if role in self.role_reactions)
+
+
+
+
+def build_role_reaction_index(orgtype='gramnegative', verbose=False):
+    """
+    Build the index from the SEED tables by mapping every reaction in the
+    Model SEED database to its roles for the organism type.  PyFBA releases
+    that do not take an organism type use the same mapping for every
+    organism.
+
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The index
+    :rtype: RoleReactionIndex
+    """
+    compounds, reactions, enzymes =\
+        model_seed_cache.compounds_reactions_enzymes(orgtype, verbose=verbose)
+    reactions_to_roles = PyFBA.filters.reactions_to_roles
+    if 'organism_type' in inspect.signature(reactions_to_roles).parameters:
+        reaction_roles = reactions_to_roles(set(reactions), organism_type=orgtype)
+    else:
+        reaction_roles = reactions_to_roles(set(reactions))
+    return RoleReactionIndex(reaction_roles, orgtype=orgtype)
+
+
+
+
+def get_role_reaction_index(orgtype='gramnegative', cache_dir=None,
+                            verbose=False):
+    """
+    Return the role and reaction index, building it at most once per process
+    and loading it from disk when it has been built before.
+
+    :param orgtype: Organism type
+    :type orgtype: string
+    :param cache_dir: Directory to store the index in
+    :type cache_dir: string
+    :param verbose: Verbose output
+    :type verbose: bool
+    :return: The index
+    :rtype: RoleReactionIndex
+    """
+    if orgtype not in _loaded:
+        _loaded[orgtype] = model_seed_cache.cached_snapshot(
+            'role_reaction_index', orgtype,
+            lambda: build_role_reaction_index(orgtype, verbose=verbose),
+            cache_dir=cache_dir, verbose=verbose)
+    return _loaded[orgtype]
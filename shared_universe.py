@@ -0,0 +1,276 @@
+from __future__ import print_function
+from multiprocessing import resource_tracker, shared_memory
+import numpy as np
+import scipy.sparse
+from sparse_stoichiometry import ReactionUniverse
+
+
+
+
+def _attach(name):
+    """Attach to an existing shared memory block without taking ownership"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:
+        # Before Python 3.13 attaching always registers the block with the
+        # resource tracker, which unlinks the blocks still registered when
+        # it thinks their processes have leaked them.  Only the publishing
+        # process frees the block (see _unlink()).
+        block = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(block._name, 'shared_memory')
+        return block
+
+
+
+
+def _unlink(block):
+    """Free a shared memory block and remove it from the resource tracker"""
+    # Attaching left the block unregistered or untracked, and the processes
+    # share one tracker, so register it again for unlink() to remove
+    resource_tracker.register(block._name, 'shared_memory')
+    block.unlink()
+    if not getattr(block, '_track', True):
+        resource_tracker.unregister(block._name, 'shared_memory')
+
+
+
+
+class _SortedIndex(object):
+    """
+    The column index of the reactions, looked up by binary search in the
+    sorted array of reaction ids, so no dictionary has to be built.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def _find(self, rxn):
+        key = rxn.encode('utf-8')
+        i = int(np.searchsorted(self.ids, key))
+        if i < len(self.ids) and self.ids[i] == key:
+            return i
+        return -1
+
+    def __contains__(self, rxn):
+        return self._find(rxn) >= 0
+
+    def __getitem__(self, rxn):
+        i = self._find(rxn)
+        if i < 0:
+            raise KeyError(rxn)
+        return i
+
+    def get(self, rxn, default=None):
+        i = self._find(rxn)
+        return default if i < 0 else i
+
+    def __len__(self):
+        return len(self.ids)
+
+
+
+
+class _ReactionIds(object):
+    """
+    The sorted reaction ids, decoded from the packed byte strings when they
+    are used, so callers get the same str ids as from a ReactionUniverse.
+    """
+
+    def __init__(self, ids):
+        self.ids = ids
+
+    def __getitem__(self, j):
+        return self.ids[j].decode('utf-8')
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        for rxn in self.ids:
+            yield rxn.decode('utf-8')
+
+
+
+
+class _CompoundTable(object):
+    """
+    The (name, location) keys of the compounds, decoded from the packed
+    string table when they are used.
+    """
+
+    def __init__(self, names, offsets, locations):
+        self.names = names
+        self.offsets = offsets
+        self.locations = locations
+
+    def __getitem__(self, i):
+        name = self.names[self.offsets[i]:self.offsets[i + 1]].tobytes()
+        return name.decode('utf-8'), self.locations[i].decode('utf-8')
+
+    def __len__(self):
+        return len(self.locations)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self[i]
+
+
+
+
+class SharedReactionUniverse(ReactionUniverse):
+    """
+    A read-only ReactionUniverse whose arrays are held in shared memory.
+
+    The universe is published once with publish_reaction_universe(), which
+    copies the sparse stoichiometric matrix, the left and right compound
+    incidence matrices, the bounds, directions, transport and
+    media-dependence flags, and the reaction id and compound string tables
+    into shared memory blocks.  Pickling the published universe only sends
+    the names of the blocks, so worker processes that receive it attach to
+    the same memory instead of unpickling the reaction database, and worker
+    memory stays flat however many workers there are.
+
+    There are no Reaction objects behind a shared universe, so a reaction
+    counts as current unless it was changed in a ReactionOverlay.
+    """
+
+    def __init__(self, blocks, owner=False):
+        """
+        :param blocks: A dictionary of array name to (block name, shape,
+            dtype) describing the shared memory blocks
+        :type blocks: dict
+        :param owner: Whether this process created the blocks and unlinks
+            them when it is closed
+        :type owner: bool
+        """
+        self.blocks = blocks
+        self.owner = owner
+        self._memory = {}
+        arrays = {}
+        for name, (block_name, shape, dtype) in blocks.items():
+            block = _attach(block_name)
+            self._memory[name] = block
+            arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+            arrays[name].flags.writeable = False
+
+        self.reactions = None
+        self.reaction_ids = _ReactionIds(arrays['reaction_ids'])
+        self.index = _SortedIndex(arrays['reaction_ids'])
+        self.compound_keys = _CompoundTable(arrays['compound_names'],
+                                            arrays['compound_offsets'],
+                                            arrays['compound_locations'])
+        self.lower = arrays['lower']
+        self.upper = arrays['upper']
+        self.direction = arrays['direction']
+        self.is_transport = arrays['is_transport']
+        self.media_dependent = arrays['media_dependent']
+        self.extracellular = arrays['extracellular']
+        self.matrix = scipy.sparse.csc_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=(len(self.compound_keys), len(self.reaction_ids)), copy=False)
+        self.left, self.right = [
+            scipy.sparse.csr_matrix((np.ones(len(arrays[side + '_indices'])),
+                                     arrays[side + '_indices'],
+                                     arrays[side + '_indptr']),
+                                    shape=(len(self.reaction_ids),
+                                           len(self.compound_keys)), copy=False)
+            for side in ('left', 'right')]
+        self._compound_index = None
+
+    @property
+    def compound_index(self):
+        # Only built if it is used
+        if self._compound_index is None:
+            self._compound_index = dict((k, i) for i, k in
+                                        enumerate(self.compound_keys))
+        return self._compound_index
+
+    def is_current(self, rxn, reactions):
+        return rxn in self.index and rxn not in getattr(reactions, 'changed', ())
+
+    def __reduce__(self):
+        return (SharedReactionUniverse, (self.blocks,))
+
+    def close(self):
+        """
+        Detach from the shared memory, and free it if this process
+        published it.  The universe cannot be used after it is closed.
+        """
+        self.matrix = self.left = self.right = self._incidence = None
+        self.reaction_ids = self.lower = self.upper = None
+        self.direction = self.is_transport = self.extracellular = None
+        self.media_dependent = None
+        self.index = self.compound_keys = None
+        for block in self._memory.values():
+            block.close()
+            if self.owner:
+                _unlink(block)
+        self._memory = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+
+
+def publish_reaction_universe(universe):
+    """
+    Copy a reaction universe into shared memory.
+
+    The caller owns the shared memory and must close() the returned
+    universe (or use it as a context manager) once the workers are done.
+
+    :param universe: The reaction universe
+    :type universe: sparse_stoichiometry.ReactionUniverse
+    :return: The universe in shared memory
+    :rtype: SharedReactionUniverse
+    """
+    names = [k[0].encode('utf-8') for k in universe.compound_keys]
+    offsets = np.zeros(len(names) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(n) for n in names])
+    matrix = universe.matrix.tocsc()
+    left = universe.left.tocsr()
+    right = universe.right.tocsr()
+    arrays = {'data': matrix.data,
+              'indices': matrix.indices,
+              'indptr': matrix.indptr,
+              'left_indices': left.indices,
+              'left_indptr': left.indptr,
+              'right_indices': right.indices,
+              'right_indptr': right.indptr,
+              'lower': universe.lower,
+              'upper': universe.upper,
+              'direction': universe.direction,
+              'is_transport': universe.is_transport,
+              'media_dependent': universe.media_dependent,
+              'extracellular': universe.extracellular,
+              'reaction_ids': np.array([r.encode('utf-8') for r in
+                                        universe.reaction_ids], dtype=np.bytes_),
+              'compound_names': np.frombuffer(b''.join(names), dtype=np.uint8),
+              'compound_offsets': offsets,
+              'compound_locations': np.array([k[1].encode('utf-8') for k in
+                                              universe.compound_keys],
+                                             dtype=np.bytes_)}
+
+    blocks = {}
+    created = []
+    try:
+        for name, array in arrays.items():
+            # Blocks cannot be empty
+            block = shared_memory.SharedMemory(create=True,
+                                               size=max(1, array.nbytes))
+            created.append(block)
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            blocks[name] = (block.name, array.shape, array.dtype.str)
+        shared = SharedReactionUniverse(blocks, owner=True)
+    except:
+        for block in created:
+            block.close()
+            _unlink(block)
+        raise
+    for block in created:
+        block.close()
+    return shared
@@ -0,0 +1,408 @@
+from __future__ import print_function
+import collections
+import hashlib
+import numpy as np
+import scipy.sparse
+from incremental_fba import compound_key, is_media_dependent,\
+    media_flux_bounds, reaction_flux_bounds, reaction_stoichiometry
+
+
+# Reaction direction codes used in ReactionUniverse.direction
+DIRECTION_CODES = {'>': 1, '<': -1, '=': 0}
+
+# The universes most recently built in this process, with the reactions
+# dictionary they were built from, keyed by that dictionary (see
+# _reactions_key())
+_built = collections.OrderedDict()
+
+# The number of universes kept in _built
+MAX_BUILT_UNIVERSES = 4
+
+
+
+
+class ReactionUniverse(object):
+    """
+    The stoichiometric matrix of the whole Model SEED reaction database,
+    built once as a sparse matrix.
+
+    Rows are compounds (keyed by name and location) and columns are
+    reactions in sorted id order.  The flux bounds, directions and
+    transport flags of the reactions are kept in parallel arrays, with the
+    bounds of media-dependent reactions (see
+    incremental_fba.is_media_dependent()) given for an empty media.  The
+    compounds on the left and right sides of the reactions are kept in two
+    incidence matrices, which include compounds that appear on both sides
+    and so have no net stoichiometry.  An FBA model for any set of reactions
+    is a selection of columns from this matrix, so the per-reaction
+    stoichiometry never has to be rebuilt from the Reaction objects.
+    """
+
+    def __init__(self, reactions):
+        """
+        :param reactions: The dictionary of reactions from the Model SEED database
+        :type reactions: dict
+        """
+        # A copy, so later changes to the dictionary do not change the
+        # universe
+        self.reactions = dict(reactions)
+        self.reaction_ids = sorted(reactions)
+        self.index = dict((r, j) for j, r in enumerate(self.reaction_ids))
+        self.compound_keys = []
+        self.compound_index = {}
+
+        n = len(self.reaction_ids)
+        self.lower = np.empty(n, dtype=np.float64)
+        self.upper = np.empty(n, dtype=np.float64)
+        self.direction = np.zeros(n, dtype=np.int8)
+        self.is_transport = np.zeros(n, dtype=bool)
+        self.media_dependent = np.zeros(n, dtype=bool)
+        rows = []
+        cols = []
+        vals = []
+        sides = {'left': ([], []), 'right': ([], [])}
+        for j, rxn in enumerate(self.reaction_ids):
+            reaction = reactions[rxn]
+            for key, coeff in reaction_stoichiometry(reaction).items():
+                rows.append(self._compound_row(key))
+                cols.append(j)
+                vals.append(coeff)
+            for side, side_compounds in (('left', reaction.left_compounds),
+                                         ('right', reaction.right_compounds)):
+                for c in side_compounds:
+                    sides[side][0].append(j)
+                    sides[side][1].append(self._compound_row(compound_key(c)))
+            self.lower[j], self.upper[j] = reaction_flux_bounds(reaction)
+            self.direction[j] = DIRECTION_CODES.get(reaction.direction, 0)
+            self.is_transport[j] = bool(reaction.is_transport)
+            self.media_dependent[j] = is_media_dependent(reaction)
+
+        self.matrix = scipy.sparse.csc_matrix(
+            (np.array(vals, dtype=np.float64), (rows, cols)),
+            shape=(len(self.compound_keys), n))
+        self.left, self.right = [_side_incidence(sides[side], n,
+                                                 len(self.compound_keys))
+                                 for side in ('left', 'right')]
+        self.extracellular = np.array([k[1] == 'e' for k in self.compound_keys],
+                                      dtype=bool)
+
+    def _compound_row(self, key):
+        if key not in self.compound_index:
+            self.compound_index[key] = len(self.compound_keys)
+            self.compound_keys.append(key)
+        return self.compound_index[key]
+
+    @property
+    def shape(self):
+        return self.matrix.shape
+
+    @property
+    def incidence(self):
+        """
+        The reaction by compound incidence matrix: 1 where a compound is on
+        either side of a reaction and 0 elsewhere.  Built the first time it
+        is used.
+
+        :rtype: scipy.sparse.csr_matrix
+        """
+        if getattr(self, '_incidence', None) is None:
+            incidence = (self.left + self.right).tocsr()
+            incidence.data = (incidence.data != 0).astype(np.float64)
+            self._incidence = incidence
+        return self._incidence
+
+    @property
+    def fingerprint(self):
+        """
+        A hash of the contents of the universe: the reaction ids, compounds,
+        stoichiometry, bounds, directions and flags.  Computed the first time
+        it is used.
+
+        :rtype: string
+        """
+        if getattr(self, '_fingerprint', None) is None:
+            sha = hashlib.sha1()
+            for rxn in self.reaction_ids:
+                sha.update(rxn if isinstance(rxn, bytes) else rxn.encode('utf-8'))
+                sha.update(b'\0')
+            for name, location in self.compound_keys:
+                sha.update('{}\t{}\0'.format(name, location).encode('utf-8'))
+            matrix = self.matrix.tocsc()
+            left = self.left.tocsr()
+            right = self.right.tocsr()
+            for array in (matrix.data, matrix.indices, matrix.indptr,
+                          left.indices, left.indptr, right.indices, right.indptr,
+                          self.lower, self.upper,
+                          self.direction, self.is_transport, self.media_dependent):
+                sha.update(np.ascontiguousarray(array).tobytes())
+            self._fingerprint = sha.hexdigest()
+        return self._fingerprint
+
+    def is_current(self, rxn, reactions):
+        """
+        Whether a reaction in a reactions dictionary is the same object the
+        universe was built from, i.e. it has not been replaced (for example
+        reversed in a ReactionOverlay) since.  Without a reactions
+        dictionary every reaction in the universe is current.
+
+        :param rxn: The reaction id
+        :type rxn: string
+        :param reactions: The reactions dictionary
+        :type reactions: dict
+        :rtype: bool
+        """
+        if reactions is None:
+            return rxn in self.index
+        return rxn in self.index and\
+            self.reactions.get(rxn) is reactions.get(rxn)
+
+    def indices(self, reaction_ids):
+        """
+        The column indices of the reactions that are in the universe.
+
+        :param reaction_ids: The reaction ids
+        :type reaction_ids: set
+        :return: The sorted column indices
+        :rtype: numpy.ndarray
+        """
+        return np.array(sorted(self.index[r] for r in reaction_ids
+                               if r in self.index), dtype=np.int64)
+
+    def mask(self, reaction_ids):
+        """
+        A boolean mask over the columns selecting the reactions.
+
+        :param reaction_ids: The reaction ids
+        :type reaction_ids: set
+        :return: The column mask
+        :rtype: numpy.ndarray
+        """
+        mask = np.zeros(len(self.reaction_ids), dtype=bool)
+        mask[self.indices(reaction_ids)] = True
+        return mask
+
+    def column(self, j):
+        """
+        The stoichiometry of one column.
+
+        :param j: The column index
+        :type j: int
+        :return: A dictionary of compound key to stoichiometric coefficient
+        :rtype: dict
+        """
+        start, end = self.matrix.indptr[j], self.matrix.indptr[j + 1]
+        return dict((self.compound_keys[i], float(v)) for i, v in
+                    zip(self.matrix.indices[start:end],
+                        self.matrix.data[start:end]))
+
+    def uptake_keys(self, j):
+        """
+        The extracellular compounds on the left side of one column (see
+        incremental_fba.uptake_compound_keys()).
+
+        :param j: The column index
+        :type j: int
+        :return: The sorted compound keys
+        :rtype: tuple
+        """
+        start, end = self.left.indptr[j], self.left.indptr[j + 1]
+        return tuple(sorted(self.compound_keys[i] for i in
+                            self.left.indices[start:end]
+                            if self.extracellular[i]))
+
+    def flux_bounds(self, j, media):
+        """
+        The flux bounds of one column on a media.
+
+        :param j: The column index
+        :type j: int
+        :param media: The compound keys of the media
+        :type media: set
+        :return: The lower and upper flux bounds
+        :rtype: (float, float)
+        """
+        if self.media_dependent[j]:
+            return media_flux_bounds(self.uptake_keys(j), media)
+        return self.lower[j], self.upper[j]
+
+    def submatrix(self, mask):
+        """
+        The columns selected by a mask, restricted to the compounds those
+        columns use.
+
+        :param mask: The column mask
+        :type mask: numpy.ndarray
+        :return: The sparse submatrix and the row indices (into
+            compound_keys) of its rows
+        :rtype: (scipy.sparse.csc_matrix, numpy.ndarray)
+        """
+        sub = self.matrix[:, mask]
+        rows = np.flatnonzero(np.diff(sub.tocsr().indptr))
+        return sub[rows, :], rows
+
+
+
+
+def _side_incidence(entries, n_reactions, n_compounds):
+    """The reaction by compound incidence matrix of one side of the reactions"""
+    rows, cols = entries
+    incidence = scipy.sparse.csr_matrix((np.ones(len(rows)), (rows, cols)),
+                                        shape=(n_reactions, n_compounds))
+    incidence.sum_duplicates()
+    incidence.data[:] = 1.0
+    return incidence
+
+
+
+
+def _reactions_key(reactions):
+    """
+    The key of a reactions dictionary in _built: the identity and size of
+    the dictionary, or for a ReactionOverlay those of its base dictionary
+    and the reactions changed and deleted in the overlay, so only the
+    overlay's changes are visited.  An overlay without changes shares the
+    universe of its base dictionary.  The cached universe and its dictionary
+    are kept together, so the ids are not reused while the universe is
+    cached.  A dictionary must not be changed in place once its universe is
+    built; change a ReactionOverlay of it instead.
+    """
+    changed = getattr(reactions, 'changed', None)
+    if changed is None:
+        return id(reactions), len(reactions)
+    if not changed and not reactions.deleted:
+        return id(reactions.base), len(reactions.base)
+    return (id(reactions.base), len(reactions.base),
+            frozenset((rxn, id(reaction)) for rxn, reaction in changed.items()),
+            frozenset(reactions.deleted))
+
+
+
+
+def _cache_universe(key, reactions, universe):
+    """Cache a universe, dropping the least recently used ones"""
+    _built[key] = (getattr(reactions, 'base', reactions), universe)
+    while len(_built) > MAX_BUILT_UNIVERSES:
+        _built.popitem(last=False)
+
+
+
+
+def get_reaction_universe(reactions):
+    """
+    Return the universe for a reactions dictionary, building it only the
+    first time the dictionary (or an overlay with the same changes) is used
+    in this process.  Only the MAX_BUILT_UNIVERSES most recently used
+    universes are kept.
+
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :return: The universe
+    :rtype: ReactionUniverse
+    """
+    key = _reactions_key(reactions)
+    if key in _built:
+        _built.move_to_end(key)
+    else:
+        _cache_universe(key, reactions, ReactionUniverse(reactions))
+    return _built[key][1]
+
+
+
+
+def use_reaction_universe(reactions, universe):
+    """
+    Use an existing universe for a reactions dictionary instead of building
+    one, e.g. a shared_universe.SharedReactionUniverse published by the
+    parent process for the same Model SEED database.
+
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param universe: The universe of the reactions
+    :type universe: ReactionUniverse
+    """
+    _cache_universe(_reactions_key(reactions), reactions, universe)
+
+
+
+
+def compound_probability(universe, reactions_to_run, cutoff=0,
+                         allowed_reactions=None):
+    """
+    Suggest the reactions whose compounds are present in the model, as
+    PyFBA.gapfill.compound_probability() does, using the incidence matrices.
+
+    A compound is present if it is on either side of a reaction in the
+    model.  Each side of a reaction is scored by the fraction of its
+    compounds that are present: pLR for the left side and pRL for the
+    right side (0 for an empty side).  A reaction is suggested when either
+    score is above the cutoff.  A cutoff of 0 is replaced, as in PyFBA, by
+    the smaller of the average pLR and the average pRL of the scored
+    reactions that are in the model.  The scores are computed for every
+    reaction at once as sparse matrix-vector products.
+
+    :param universe: The reaction universe
+    :type universe: ReactionUniverse
+    :param reactions_to_run: The set of reaction ids in the model
+    :type reactions_to_run: set
+    :param cutoff: Reactions with a probability above the cutoff are
+        suggested; 0 to use the average of the model's reactions
+    :type cutoff: float
+    :param allowed_reactions: Only score and suggest these reactions (for
+        example the reactions that have proteins).  All reactions when None.
+    :type allowed_reactions: set
+    :return: The suggested reaction ids, which are not in the model
+    :rtype: set
+    """
+    in_model = universe.mask(reactions_to_run)
+    present = (universe.incidence.T.dot(in_model.astype(np.float64)) > 0)\
+        .astype(np.float64)
+    scores = []
+    for side in (universe.left, universe.right):
+        n_compounds = np.diff(side.indptr)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            scores.append(np.where(n_compounds > 0,
+                                   side.dot(present) / n_compounds, 0.0))
+    p_left, p_right = scores
+
+    if allowed_reactions is None:
+        scored = np.ones(len(in_model), dtype=bool)
+    else:
+        scored = universe.mask(allowed_reactions)
+    if cutoff == 0 and (scored & in_model).any():
+        cutoff = min(p_left[scored & in_model].mean(),
+                     p_right[scored & in_model].mean())
+    suggest = scored & ~in_model & ((p_left > cutoff) | (p_right > cutoff))
+    return set(universe.reaction_ids[j] for j in np.flatnonzero(suggest))
+
+
+
+
+def suggest_by_compound(universe, reactions_to_run, max_reactions=1):
+    """
+    Suggest reactions that connect to orphan compounds, as
+    PyFBA.gapfill.suggest_by_compound() does, using the incidence matrix.
+
+    An orphan compound is an intracellular compound used by at least one
+    and at most max_reactions of the reactions in the model.  Every reaction
+    that is not in the model and uses an orphan compound is suggested.
+    Extracellular compounds are not considered, as in PyFBA.  Both the
+    per-compound counts and the reactions that touch an orphan are sparse
+    matrix-vector products.
+
+    :param universe: The reaction universe
+    :type universe: ReactionUniverse
+    :param reactions_to_run: The set of reaction ids in the model
+    :type reactions_to_run: set
+    :param max_reactions: The largest number of model reactions an orphan
+        compound can have
+    :type max_reactions: int
+    :return: The suggested reaction ids, which are not in the model
+    :rtype: set
+    """
+    incidence = universe.incidence
+    in_model = universe.mask(reactions_to_run)
+    counts = incidence.T.dot(in_model.astype(np.float64))
+    orphans = ((counts > 0) & (counts <= max_reactions) &
+               ~universe.extracellular).astype(np.float64)
+    suggest = ~in_model & (incidence.dot(orphans) > 0)
+    return set(universe.reaction_ids[j] for j in np.flatnonzero(suggest))
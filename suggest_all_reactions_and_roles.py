@@ -1,14 +1,16 @@
 from __future__ import print_function
 import pickle
-from likelihood_gapfill import suggest_additional_reactions
+from suggestion_cache import cached_suggest_additional_reactions
 import sys
 sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
 import PyFBA
+import model_seed_cache
+from role_reaction_index import get_role_reaction_index
 
 
 # Load the Model SEED database
 compounds, reactions, enzymes =\
-           PyFBA.parse.model_seed.compounds_reactions_enzymes('gramnegative')
+           model_seed_cache.compounds_reactions_enzymes('gramnegative')
 
 
 # Load the draft model reactions and roles
@@ -25,10 +27,8 @@ LB_added_rxns = pickle.load(
         'ArgonneLB_added_reactions.p','rb'))
 draft_rxns.update(LB_added_rxns)
 
-LB_added_roles = set()
-rxn2role = PyFBA.filters.reactions_to_roles(LB_added_rxns)
-for i in rxn2role:
-    LB_added_roles.update(rxn2role[i])
+LB_added_roles =\
+    get_role_reaction_index('gramnegative').roles_for_reactions(LB_added_rxns)
 draft_roles.update(LB_added_roles)
 
 
@@ -59,7 +59,7 @@ for media_condition in pos_growth_media:
              'PyFBA/media/' + media_condition + '.txt')
 
     # Suggest additional reactions
-    suggested_rxns, suggested_roles, source = suggest_additional_reactions(compounds,
+    suggested_rxns, suggested_roles, source = cached_suggest_additional_reactions(compounds,
             reactions, draft_rxns, draft_roles, media, biomass_equation,
             "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/example_data/"
             "Citrobacter/ungapfilled_model/closest.genomes.roles",
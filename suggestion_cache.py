@@ -0,0 +1,247 @@
+from __future__ import print_function
+import hashlib
+import os
+import pickle
+import sys
+import tempfile
+from incremental_fba import compound_key, reaction_stoichiometry
+from likelihood_gapfill import SUGGESTION_STAGES, suggest_additional_reactions
+from model_seed_cache import cache_directory, file_hash
+from sparse_stoichiometry import get_reaction_universe
+
+
+# Bump this when suggest_additional_reactions() changes in a way that
+# changes its results, so old entries are no longer used
+CACHE_VERSION = 3
+
+# Default maximum total size of the cached suggestions
+DEFAULT_MAX_BYTES = 1 << 30
+
+# File hashes computed in this process, keyed by path, size and mtime
+_file_hashes = {}
+
+
+
+
+def _cached_file_hash(filepath):
+    """Hash a file, reusing the hash if the file has not changed"""
+    st = os.stat(filepath)
+    key = (os.path.abspath(filepath), st.st_size, st.st_mtime)
+    if key not in _file_hashes:
+        _file_hashes[key] = file_hash(filepath)
+    return _file_hashes[key]
+
+
+
+
+def _stage_name(stage):
+    """The name of a suggestion stage and of the function it runs"""
+    suggest = getattr(stage.suggest, '__qualname__', stage.suggest.__name__)
+    return '{}\t{}.{}'.format(stage.name, stage.suggest.__module__, suggest)
+
+
+
+
+def suggestion_key(draft_reactions, draft_roles, media, biomass_equation,
+                   close_roles_file, genus_roles_file, minimal_stages=False,
+                   reactions=None, stages=None, role_index=None):
+    """
+    The content-addressed key of a call to suggest_additional_reactions().
+
+    The key is a hash of the draft reactions and roles, the compounds in the
+    media, the stoichiometry of the biomass equation, the contents of the
+    role files, the reaction database and role index (which differ between
+    organism types), and the suggestion stages, so it does not depend on
+    where the files are or on the order of any of the sets.
+
+    :param reactions: The reactions dictionary the suggestions come from
+    :type reactions: dict
+    :param stages: The suggestion stages (defaults to SUGGESTION_STAGES)
+    :type stages: list of likelihood_gapfill.SuggestionStage
+    :param role_index: The role/reaction index the suggested reactions are
+        mapped to roles with (defaults to the Model SEED index)
+    :type role_index: role_reaction_index.RoleReactionIndex
+    :return: The hex digest of the key
+    :rtype: string
+    """
+    if stages is None:
+        stages = SUGGESTION_STAGES
+    sha = hashlib.sha256()
+
+    def add(label, values):
+        sha.update(label.encode('utf-8'))
+        for v in values:
+            sha.update(b'\0')
+            sha.update(str(v).encode('utf-8'))
+        sha.update(b'\1')
+
+    add('version', [CACHE_VERSION])
+    add('draft_reactions', sorted(draft_reactions))
+    add('draft_roles', sorted(draft_roles))
+    add('media', sorted('{}\t{}'.format(*compound_key(c)) for c in media))
+    add('biomass', sorted('{}\t{}\t{!r}'.format(k[0], k[1], v) for k, v in
+                          reaction_stoichiometry(biomass_equation).items()))
+    add('close_roles', [_cached_file_hash(close_roles_file)])
+    add('genus_roles', [_cached_file_hash(genus_roles_file)])
+    if minimal_stages:
+        add('minimal_stages', [True])
+    if reactions is not None:
+        add('database', [get_reaction_universe(reactions).fingerprint])
+        add('enzymes', sorted(r for r in reactions
+                              if getattr(reactions[r], 'enzymes', None)))
+    if role_index is not None and role_index.orgtype != 'gramnegative':
+        add('role_index', [role_index.orgtype])
+    add('stages', [_stage_name(stage) for stage in stages])
+    return sha.hexdigest()
+
+
+
+
+class SuggestionCache(object):
+    """
+    A size-bounded, content-addressed cache of suggested reactions.
+
+    Each entry is a pickle of the (reactions, roles, reaction_source) tuple
+    returned by suggest_additional_reactions(), stored under its
+    suggestion_key().  Reading an entry updates its modification time, and
+    when the cache grows past its maximum size the least recently used
+    entries are removed.
+    """
+
+    def __init__(self, cache_dir=None, max_bytes=DEFAULT_MAX_BYTES):
+        """
+        :param cache_dir: Directory to store the cache in
+        :type cache_dir: string
+        :param max_bytes: Maximum total size of the cached entries
+        :type max_bytes: int
+        """
+        self.path = os.path.join(cache_directory(cache_dir), 'suggestions')
+        if not os.path.isdir(self.path):
+            os.makedirs(self.path)
+        self.max_bytes = max_bytes
+
+    def _entry(self, key):
+        return os.path.join(self.path, key + '.pickle')
+
+    def get(self, key):
+        """
+        Return the cached suggestions for a key.
+
+        :param key: The suggestion key
+        :type key: string
+        :return: The cached (reactions, roles, reaction_source) tuple, or None
+        :rtype: tuple
+        """
+        entry = self._entry(key)
+        try:
+            with open(entry, 'rb') as fin:
+                value = pickle.load(fin)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        try:
+            os.utime(entry, None)
+        except OSError:
+            pass
+        return value
+
+    def put(self, key, value):
+        """
+        Store suggestions under a key and evict old entries if the cache is
+        over its maximum size.
+
+        :param key: The suggestion key
+        :type key: string
+        :param value: The (reactions, roles, reaction_source) tuple
+        :type value: tuple
+        """
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fout:
+                pickle.dump(value, fout, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, self._entry(key))
+        except:
+            os.remove(tmp)
+            raise
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used entries until the cache fits"""
+        entries = []
+        total = 0
+        for f in os.listdir(self.path):
+            if not f.endswith('.pickle'):
+                continue
+            try:
+                st = os.stat(os.path.join(self.path, f))
+            except OSError:
+                continue
+            entries.append((st.st_mtime, st.st_size, f))
+            total += st.st_size
+        for mtime, size, f in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(os.path.join(self.path, f))
+            except OSError:
+                pass
+            total -= size
+
+
+
+
+def cached_suggest_additional_reactions(compounds, reactions, draft_reactions,
+                                        draft_roles, media, biomass_equation,
+                                        close_roles_file, genus_roles_file,
+                                        verbose=True, cache=None, profile=None,
+                                        minimal_stages=False, backend=None,
+                                        stages=None, role_index=None):
+    """
+    suggest_additional_reactions(), returning the cached suggestions when
+    the same draft model, media, biomass equation, role files, reaction
+    database and suggestion stages were already used.
+
+    :param cache: The cache to use (defaults to a SuggestionCache in the
+        default cache directory)
+    :type cache: SuggestionCache
+    :param profile: Profile to add the suggestion stages to
+    :type profile: gapfill_profile.GapfillProfile
+    :param minimal_stages: Only suggest the reactions of the stages that are
+        needed for the model to grow
+    :type minimal_stages: bool
+    :param backend: The LP backend for the growth tests, by name or as a
+        (name, options) pair (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :param stages: The suggestion stages (defaults to SUGGESTION_STAGES)
+    :type stages: list of likelihood_gapfill.SuggestionStage
+    :param role_index: The index used to map the suggested reactions to
+        roles (defaults to the Model SEED index)
+    :type role_index: role_reaction_index.RoleReactionIndex
+    :return: A set of reactions possibly missing from the model, a set of roles possibly missing
+        from the model, and a dictionary of source for the missing reactions
+    :rtype: (set, set, dict)
+    """
+    if cache is None:
+        cache = SuggestionCache()
+    key = suggestion_key(draft_reactions, draft_roles, media, biomass_equation,
+                         close_roles_file, genus_roles_file,
+                         minimal_stages=minimal_stages, reactions=reactions,
+                         stages=stages, role_index=role_index)
+    value = cache.get(key)
+    if value is not None:
+        if verbose:
+            print("Using cached suggestions {}".format(key), file=sys.stderr)
+        if profile is not None:
+            profile.records.append({'stage': 'suggestion_cache', 'seconds': 0.0,
+                                    'candidates': len(value[0])})
+        return value
+
+    value = suggest_additional_reactions(compounds, reactions, draft_reactions,
+                                         draft_roles, media, biomass_equation,
+                                         close_roles_file, genus_roles_file,
+                                         verbose=verbose, profile=profile,
+                                         stages=stages,
+                                         minimal_stages=minimal_stages,
+                                         role_index=role_index,
+                                         backend=backend)
+    cache.put(key, value)
+    return value
@@ -0,0 +1,109 @@
+import os
+import pytest
+pytest.importorskip('PyFBA')
+import batch_gapfill
+from batch_gapfill import gapfill_genomes, read_manifest, read_media_list
+
+
+
+
+def _write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+
+
+def test_manifest_rows_are_read_by_column(tmp_path):
+    manifest = _write(tmp_path / 'manifest.tsv',
+                      'genome\tassigned_functions\tclose_roles\tgenus_roles\t'
+                      'probabilities\tmedia\n'
+                      '# a comment\n\n'
+                      'g1\tg1.functions\tg1.close\tg1.genus\tg1.probs\tg1.media\n')
+    assert read_manifest(manifest) == [
+        {'genome': 'g1', 'assigned_functions': 'g1.functions',
+         'close_roles': 'g1.close', 'genus_roles': 'g1.genus',
+         'probabilities': 'g1.probs', 'media': 'g1.media'}]
+
+
+
+
+@pytest.mark.parametrize('rows', [
+    # A column is missing
+    'g1\tg1.functions\tg1.close\tg1.genus\tg1.media\n',
+    # The same genome twice
+    'g1\ta\tb\tc\td\te\ng1\ta\tb\tc\td\te\n'])
+def test_malformed_manifests_are_rejected(tmp_path, rows):
+    with pytest.raises(ValueError):
+        read_manifest(_write(tmp_path / 'manifest.tsv', rows))
+
+
+
+
+def test_media_lists_skip_blank_lines_and_must_not_be_empty(tmp_path):
+    assert read_media_list(_write(tmp_path / 'media.txt',
+                                  'LB\n\n# comment\nM9 \n')) == {'LB', 'M9'}
+    with pytest.raises(ValueError):
+        read_media_list(_write(tmp_path / 'empty.txt', '\n# none\n'))
+
+
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {'gapfill': [], 'draft': []}
+
+    def build_draft_model(assigned_functions, orgtype, verbose=True,
+                          reactions=None):
+        calls['draft'].append(assigned_functions)
+        return {'role'}, {'rxn_draft'}
+
+    def gapfill_media_condition(media_condition, *args, **kwargs):
+        calls['gapfill'].append(media_condition)
+        return media_condition, {'rxn_' + media_condition}, {}
+
+    monkeypatch.setattr(batch_gapfill.model_seed_cache, 'compounds_reactions_enzymes',
+                        lambda orgtype, verbose=True: ({}, {}, {}))
+    monkeypatch.setattr(batch_gapfill.PyFBA.gapfill, 'suggest_essential_reactions',
+                        lambda: set())
+    monkeypatch.setattr(batch_gapfill.PyFBA.metabolism, 'biomass_equation',
+                        lambda orgtype: None)
+    monkeypatch.setattr(batch_gapfill, 'get_role_reaction_index',
+                        lambda orgtype: None)
+    monkeypatch.setattr(batch_gapfill, 'build_draft_model', build_draft_model)
+    monkeypatch.setattr(batch_gapfill, 'gapfill_media_condition',
+                        gapfill_media_condition)
+    return calls
+
+
+
+
+def test_only_resumed_runs_reuse_the_journals(tmp_path, calls):
+    media = tmp_path / 'g1.media'
+    media.write_text('m1\n')
+    manifest = _write(tmp_path / 'manifest.tsv',
+                      'g1\tg1.functions\tg1.close\tg1.genus\tg1.probs\t{}\n'
+                      .format(media))
+    output = str(tmp_path / 'output')
+
+    results = gapfill_genomes(manifest, output, '/media/', processes=1)
+    assert results == {'g1': {'m1': {'rxn_m1'}}}
+    assert calls['gapfill'] == ['m1'] and calls['draft'] == ['g1.functions']
+
+    # A second media condition is added: a resumed run only gap-fills it
+    media.write_text('m1\nm2\n')
+    results = gapfill_genomes(manifest, output, '/media/', processes=1,
+                              resume=True)
+    assert results == {'g1': {'m1': {'rxn_m1'}, 'm2': {'rxn_m2'}}}
+    assert calls['gapfill'] == ['m1', 'm2']
+    with open(os.path.join(output, 'g1', 'gapfill_added_reactions.txt')) as fin:
+        assert fin.read() == 'rxn_m1\tm1\nrxn_m2\tm2\n'
+
+    # Without resuming, the old results are never silently reused
+    with pytest.raises(ValueError):
+        gapfill_genomes(manifest, output, '/media/', processes=1)
+    results = gapfill_genomes(manifest, output, '/media/', processes=1,
+                              overwrite=True)
+    assert calls['gapfill'] == ['m1', 'm2', 'm1', 'm2']
+    # The draft model is built once per genome in each worker
+    assert calls['draft'] == ['g1.functions'] * 3
@@ -0,0 +1,60 @@
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+import batch_growth_prediction
+from batch_growth_prediction import predict_growth, score_predictions
+
+
+
+
+def _reaction(reactions, rxn, left, right, direction, transport=False):
+    reaction = PyFBA.metabolism.Reaction(rxn)
+    reaction.set_direction(direction)
+    reaction.add_left_compounds(set(left))
+    for c in left:
+        reaction.set_left_compound_abundance(c, 1)
+    reaction.add_right_compounds(set(right))
+    for c in right:
+        reaction.set_right_compound_abundance(c, 1)
+    reaction.is_transport = transport
+    reactions[rxn] = reaction
+    return reaction
+
+
+
+
+def test_predictions_are_scored_against_the_phenotypes():
+    results = score_predictions({'m1': 1, 'm2': 0, 'm3': 1, 'm4': 0},
+                                {'m1': 1, 'm2': 0, 'm3': 0, 'm4': 1, 'm5': 1})
+    assert results == {'tp': ['m1'], 'tn': ['m2'], 'fp': ['m3'], 'fn': ['m4']}
+
+
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_growth_depends_only_on_the_media(monkeypatch, processes):
+    pytest.importorskip('swiglpk')
+    # Biomass is made from B, which the model makes from A or C
+    a_e, b_e, c_e = [PyFBA.metabolism.Compound(n, 'e') for n in 'ABC']
+    a, b, c = [PyFBA.metabolism.Compound(n, 'c') for n in 'ABC']
+    biomass_out = PyFBA.metabolism.Compound('Biomass', 'c')
+    reactions = {}
+    _reaction(reactions, 'a_in', [a_e], [a], '>', transport=True)
+    _reaction(reactions, 'c_in', [c_e], [c], '>', transport=True)
+    _reaction(reactions, 'a_to_b', [a], [b], '>')
+    _reaction(reactions, 'c_to_b', [c], [b], '>')
+    biomass = PyFBA.metabolism.Reaction('biomass')
+    biomass.set_direction('>')
+    biomass.add_left_compounds({b})
+    biomass.set_left_compound_abundance(b, 1)
+    biomass.add_right_compounds({biomass_out})
+    biomass.set_right_compound_abundance(biomass_out, 1)
+
+    media = {'A': {a_e}, 'B': {b_e}, 'C': {c_e}}
+    # The workers are forked from this process, so they read the same media
+    monkeypatch.setattr(batch_growth_prediction.PyFBA.parse, 'read_media_file',
+                        lambda path: media[path.rsplit('/', 1)[-1][:-4]])
+
+    growth = predict_growth({}, reactions, {'a_in', 'c_in', 'a_to_b'}, biomass,
+                            set(media), '/media/', processes=processes,
+                            verbose=False)
+    assert growth == {'A': 1, 'B': 0, 'C': 0}
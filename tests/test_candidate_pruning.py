@@ -0,0 +1,133 @@
+import inspect
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+from candidate_pruning import prune_candidates
+from reaction_overlay import ReactionOverlay
+
+
+
+
+def _reaction(reactions, rxn, left, right, direction, transport=False):
+    reaction = PyFBA.metabolism.Reaction(rxn)
+    reaction.set_direction(direction)
+    reaction.add_left_compounds(set(left))
+    for c in left:
+        reaction.set_left_compound_abundance(c, 1)
+    reaction.add_right_compounds(set(right))
+    for c in right:
+        reaction.set_right_compound_abundance(c, 1)
+    reaction.is_transport = transport
+    reactions[rxn] = reaction
+    return reaction
+
+
+
+
+def _network():
+    """
+    A takes up A_e and makes B, which the biomass reaction consumes.  The
+    original model only has the uptake of A.
+    """
+    a_e = PyFBA.metabolism.Compound('A', 'e')
+    a = PyFBA.metabolism.Compound('A', 'c')
+    b = PyFBA.metabolism.Compound('B', 'c')
+    c = PyFBA.metabolism.Compound('C', 'c')
+    reactions = {}
+    _reaction(reactions, 'uptake', [a_e], [a], '>', transport=True)
+    _reaction(reactions, 'forward', [a], [b], '>')
+    _reaction(reactions, 'forward_copy', [a], [b], '>')
+    # B <- A written the other way round, so it runs in the same direction
+    _reaction(reactions, 'reverse', [b], [a], '<')
+    # C is only made and used by this reaction
+    _reaction(reactions, 'dead_end', [b], [c], '=')
+    biomass = PyFBA.metabolism.Reaction('biomass')
+    biomass.set_direction('>')
+    biomass.add_left_compounds({b})
+    biomass.set_left_compound_abundance(b, 1)
+    return reactions, set([a_e]), biomass
+
+
+
+
+def _orient(reactions, candidates):
+    """Orient the candidates as likelihood_gapfill_optimization does"""
+    overlay = ReactionOverlay(reactions)
+    columns = set()
+    split_from = {}
+    for rxn in candidates:
+        direction = overlay[rxn].direction
+        if direction == '=':
+            for sign, name in ((1, rxn + '_f'), (-1, rxn + '_r')):
+                overlay.orient(rxn, sign, name)
+                columns.add(name)
+                split_from[name] = rxn
+        else:
+            overlay.orient(rxn, -1 if direction == '<' else 1, rxn)
+            columns.add(rxn)
+    return overlay, columns, split_from
+
+
+
+
+def test_oriented_duplicates_keep_one_column_in_each_direction():
+    reactions, media, biomass = _network()
+    overlay, columns, split_from = _orient(
+        reactions, {'forward', 'forward_copy', 'reverse'})
+    kept, report = prune_candidates(overlay, {'uptake'}, columns, media,
+                                    biomass, split_from=split_from,
+                                    verbose=False)
+    # All three run A -> B once oriented, so only one column is needed
+    assert len(kept) == 1 and report['duplicates'] == 2
+    assert report['candidates'] == 3 and report['kept'] == 1
+
+
+
+
+def test_split_halves_of_a_dead_end_reaction_are_blocked():
+    reactions, media, biomass = _network()
+    overlay, columns, split_from = _orient(reactions, {'forward', 'dead_end'})
+    kept, report = prune_candidates(overlay, {'uptake'}, columns, media,
+                                    biomass, split_from=split_from,
+                                    verbose=False)
+    assert kept == {'forward'}
+    assert report['blocked'] == 2
+
+
+
+
+def test_protected_reactions_keep_both_split_halves():
+    reactions, media, biomass = _network()
+    overlay, columns, split_from = _orient(reactions, {'forward', 'dead_end'})
+    kept, report = prune_candidates(overlay, {'uptake'}, columns, media,
+                                    biomass, protected={'dead_end'},
+                                    split_from=split_from, verbose=False)
+    assert kept == {'forward', 'dead_end_f', 'dead_end_r'}
+
+
+
+
+def test_pruned_and_unpruned_likelihood_lps_add_the_same_reactions(tmp_path):
+    pytest.importorskip('swiglpk')
+    run_fba = getattr(PyFBA.fba, 'run_fba', None)
+    if run_fba is None or\
+       'likelihood_gapfill' not in inspect.signature(run_fba).parameters:
+        pytest.skip("needs the likelihood gap-filling mode of PyFBA.fba.run_fba")
+    from likelihood_gapfill import likelihood_gapfill_optimization
+    from reaction_probabilities import ReactionProbabilities
+
+    reactions, media, biomass = _network()
+    probabilities_file = tmp_path / 'reaction_probabilities.txt'
+    probabilities_file.write_text('reaction\tprobability\nforward\t0.9\n'
+                                  'forward_copy\t0.5\nreverse\t0.2\n'
+                                  'dead_end\t0.8\n')
+    rxn_probs = ReactionProbabilities(str(probabilities_file),
+                                      cache_dir=str(tmp_path))
+    candidates = {'forward', 'forward_copy', 'reverse', 'dead_end'}
+
+    results = []
+    for prune in (False, True):
+        added, fluxes = likelihood_gapfill_optimization(
+            {}, reactions, {'uptake'}, candidates, biomass, media, rxn_probs,
+            set(), prune=prune, verbose=False)
+        results.append(added)
+    assert results[0] == results[1] == {'forward'}
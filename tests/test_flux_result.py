@@ -0,0 +1,87 @@
+import numpy as np
+import pytest
+from flux_result import FluxResult
+from incremental_fba import BIOMASS_REACTION, UPTAKE_SECRETION_PREFIX
+from reaction_overlay import ReactionOverlay
+
+
+
+
+def _result():
+    # rxn2 was reversed, rxn3_f/rxn3_r are the halves of a split reaction
+    # and rxn_fix contains '_f' without being split
+    names = [BIOMASS_REACTION, 'rxn1', 'rxn2', 'rxn3_f', 'rxn3_r', 'rxn_fix',
+             UPTAKE_SECRETION_PREFIX + ' cpd00027_e']
+    fluxes = np.array([2.5, 1.0, 4.0, 0.0, 3.0, 0.5, -10.0])
+    base_ids = ['rxn1', 'rxn2', 'rxn3', 'rxn_fix']
+    base = [-1, 0, 1, 2, 2, 3, -1]
+    sign = [1, 1, -1, 1, -1, 1, 1]
+    exchange = [False, False, False, False, False, False, True]
+    return FluxResult(names, fluxes, base_ids, base, sign, exchange)
+
+
+
+
+def test_active_excludes_biomass_exchange_and_idle_columns():
+    result = _result()
+    assert result.biomass_flux == 2.5
+    assert [result.names[j] for j in np.flatnonzero(result.active())] ==\
+        ['rxn1', 'rxn2', 'rxn3_r', 'rxn_fix']
+
+
+
+
+def test_reversed_fluxes_keep_their_sign_and_split_fluxes_are_net():
+    result = _result()
+    # Only the reverse half of rxn3 runs, against the direction of rxn3
+    assert result.reaction_fluxes() ==\
+        {'rxn1': 1.0, 'rxn2': 4.0, 'rxn3': -3.0, 'rxn_fix': 0.5}
+
+
+
+
+def test_both_halves_of_a_split_reaction_give_its_net_flux():
+    result = _result()
+    result.fluxes[3] = 5.0
+    assert result.reaction_fluxes()['rxn3'] == 2.0
+    result.fluxes[3] = 1.0
+    assert result.reaction_fluxes()['rxn3'] == -2.0
+    summary = result.summarize({'rxn3': 'orphans'})
+    assert summary['orphans'] == {'reactions': 1, 'flux': 2.0}
+
+
+
+
+def test_added_reactions_exclude_the_original_model():
+    result = _result()
+    added = result.active() & ~result.in_reactions({'rxn1', 'rxn3'})
+    assert result.reaction_fluxes(added) == {'rxn2': 4.0, 'rxn_fix': 0.5}
+
+
+
+
+def test_summarize_counts_reactions_and_flux_by_source():
+    result = _result()
+    summary = result.summarize({'rxn2': 'compound probability',
+                                'rxn3': 'compound probability'})
+    assert summary == {'compound probability': {'reactions': 2, 'flux': 7.0},
+                       'other': {'reactions': 2, 'flux': 1.5}}
+
+
+
+
+def test_from_fluxes_maps_views_back_to_their_reactions():
+    PyFBA = pytest.importorskip('PyFBA')
+    reactions = ReactionOverlay({'rxn2': PyFBA.metabolism.Reaction('rxn2'),
+                                 'rxn3': PyFBA.metabolism.Reaction('rxn3')})
+    reactions.orient('rxn2', -1, 'rxn2')
+    reactions.orient('rxn3', 1, 'rxn3_f')
+    reactions.orient('rxn3', -1, 'rxn3_r')
+    # Reactions built by PyFBA releases that use reaction.id are named here
+    for rxn in ('rxn2', 'rxn3'):
+        reactions.base[rxn].name = rxn
+
+    result = FluxResult.from_fluxes({BIOMASS_REACTION: 1.0, 'rxn2': 2.0,
+                                     'rxn3_f': 0.0, 'rxn3_r': 1.5}, reactions)
+    assert list(result.sign) == [1, -1, 1, -1]
+    assert result.reaction_fluxes() == {'rxn2': 2.0, 'rxn3': -1.5}
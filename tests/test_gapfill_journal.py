@@ -0,0 +1,61 @@
+import pytest
+from gapfill_journal import GapfillJournal
+
+
+
+
+def test_resume_reads_back_recorded_media(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = GapfillJournal(path)
+    journal.record('LB', {'rxn00001', 'rxn00002'}, {'rxn00001': 1.5})
+    journal.record('M9', set(), {})
+
+    resumed = GapfillJournal(path, resume=True)
+    assert resumed.completed() == {'LB': {'rxn00001', 'rxn00002'}, 'M9': set()}
+    assert list(resumed.entries())[0][2] == {'rxn00001': 1.5}
+
+
+
+
+def test_partial_last_line_is_skipped_and_not_joined(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    GapfillJournal(path).record('LB', {'rxn00001'}, {})
+    with open(path, 'a') as fout:
+        fout.write('{"media": "M9", "added_re')
+
+    journal = GapfillJournal(path, resume=True)
+    assert journal.completed() == {'LB': {'rxn00001'}}
+
+    # A result recorded after the interruption starts on its own line
+    journal.record('M9', {'rxn00003'}, {})
+    assert journal.completed() == {'LB': {'rxn00001'}, 'M9': {'rxn00003'}}
+
+
+
+
+def test_last_entry_for_a_media_condition_wins(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    journal = GapfillJournal(path)
+    journal.record('LB', {'rxn00001'}, {})
+    journal.record('LB', {'rxn00002'}, {})
+    assert journal.completed() == {'LB': {'rxn00002'}}
+
+
+
+
+def test_existing_journal_is_not_emptied_without_overwrite(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    GapfillJournal(path).record('LB', {'rxn00001'}, {})
+
+    with pytest.raises(ValueError):
+        GapfillJournal(path, resume=False)
+    assert GapfillJournal(path).completed() == {'LB': {'rxn00001'}}
+
+    assert GapfillJournal(path, resume=False, overwrite=True).completed() == {}
+
+
+
+
+def test_new_journal_does_not_need_overwrite(tmp_path):
+    path = str(tmp_path / 'journal.jsonl')
+    assert GapfillJournal(path, resume=False).completed() == {}
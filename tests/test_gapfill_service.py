@@ -0,0 +1,119 @@
+import os
+import pytest
+pytest.importorskip('PyFBA')
+import gapfill_service
+from gapfill_service import JobQueue
+
+
+
+
+def _echo_job(params):
+    return {'echo': params['value']}
+
+
+
+
+def _failing_job(params):
+    raise ValueError("bad job")
+
+
+
+
+def _exiting_job(params):
+    os._exit(1)
+
+
+
+
+@pytest.fixture
+def queue(monkeypatch):
+    # The workers are forked from this process, so they see these job types
+    monkeypatch.setattr(gapfill_service, 'JOB_TYPES',
+                        {'echo': _echo_job, 'fail': _failing_job,
+                         'exit': _exiting_job})
+    queue = JobQueue({}, {}, None, set(), {}, processes=1)
+    yield queue
+    queue.close()
+
+
+
+
+def test_finished_jobs_have_their_result(queue):
+    job_id = queue.submit('echo', {'value': 3})
+    job = queue.get(job_id, wait=30)
+    assert job['status'] == 'done' and job['result'] == {'echo': 3}
+    assert queue.remove(job_id) and queue.get(job_id) is None
+
+
+
+
+def test_job_errors_fail_only_that_job(queue):
+    failed = queue.get(queue.submit('fail', {}), wait=30)
+    assert failed['status'] == 'failed'
+    assert failed['error'] == 'ValueError: bad job'
+    assert queue.get(queue.submit('echo', {'value': 1}), wait=30)['status'] == 'done'
+
+
+
+
+def test_job_whose_worker_exits_is_failed(queue):
+    job = queue.get(queue.submit('exit', {}), wait=30)
+    assert job['status'] == 'failed'
+    assert 'exited' in job['error']
+
+
+
+
+def test_unknown_job_types_are_refused(queue):
+    with pytest.raises(ValueError):
+        queue.submit('nothing', {})
+    assert queue.summary() == {}
+
+
+
+
+@pytest.fixture
+def worker_state(monkeypatch, tmp_path):
+    data_dir = tmp_path / 'data'
+    data_dir.mkdir()
+    state = {'defaults': {'close_roles': '/defaults/close.roles'},
+             'data_dirs': [os.path.realpath(str(data_dir))]}
+    monkeypatch.setattr(gapfill_service, '_worker_state', state)
+    return data_dir
+
+
+
+
+def test_job_files_must_be_in_a_data_directory(worker_state, tmp_path):
+    roles = worker_state / 'close.roles'
+    roles.write_text('')
+    assert gapfill_service._data_file({}, 'close_roles') == '/defaults/close.roles'
+    assert gapfill_service._data_file({'close_roles': str(roles)}, 'close_roles') ==\
+        os.path.realpath(str(roles))
+    for path in [str(tmp_path / 'close.roles'),
+                 str(worker_state / '..' / 'close.roles'),
+                 str(worker_state) + '_other/close.roles']:
+        with pytest.raises(ValueError):
+            gapfill_service._data_file({'close_roles': path}, 'close_roles')
+    # Without a default the job has to name the file
+    with pytest.raises(ValueError):
+        gapfill_service._data_file({}, 'genus_roles')
+
+
+
+
+def test_job_files_are_refused_without_data_directories(worker_state):
+    gapfill_service._worker_state['data_dirs'] = []
+    with pytest.raises(ValueError):
+        gapfill_service._data_file({'close_roles': str(worker_state / 'x')},
+                                   'close_roles')
+
+
+
+
+@pytest.mark.parametrize('media_condition', ['', '../LB', 'LB/../M9',
+                                             '/etc/passwd', 'sub' + os.sep + 'LB'])
+def test_media_conditions_cannot_leave_the_media_directory(media_condition):
+    with pytest.raises(ValueError):
+        gapfill_service._media_condition(media_condition)
+    assert gapfill_service._media_condition('ArgonneLB') == 'ArgonneLB'
@@ -0,0 +1,115 @@
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+pytest.importorskip('swiglpk')
+from incremental_fba import BIOMASS_COMPOUND, IncrementalFBA, UPTAKE_SECRETION_PREFIX,\
+    media_compound_keys, reaction_flux_bounds
+from sparse_stoichiometry import ReactionUniverse
+
+
+
+
+def _reaction(reactions, rxn, left, right, direction, transport=False):
+    reaction = PyFBA.metabolism.Reaction(rxn)
+    reaction.set_direction(direction)
+    reaction.add_left_compounds(set(left))
+    for c in left:
+        reaction.set_left_compound_abundance(c, 1)
+    reaction.add_right_compounds(set(right))
+    for c in right:
+        reaction.set_right_compound_abundance(c, 1)
+    reaction.is_transport = transport
+    reactions[rxn] = reaction
+    return reaction
+
+
+
+
+def test_grows_with_the_gram_negative_biomass_equation():
+    if not hasattr(PyFBA.metabolism, 'biomass_equation'):
+        pytest.skip("needs PyFBA.metabolism.biomass_equation")
+    biomass_equation = PyFBA.metabolism.biomass_equation('gramnegative')
+
+    # Take up every biomass precursor from the media and secrete every
+    # by-product, so the model can only grow if the Biomass compound the
+    # biomass equation makes can leave the model
+    reactions = {}
+    media = set()
+    for c in biomass_equation.left_compounds:
+        outside = PyFBA.metabolism.Compound(c.name, 'e')
+        media.add(outside)
+        _reaction(reactions, 'in_' + c.name, [outside], [c], '>', transport=True)
+    for c in biomass_equation.right_compounds:
+        if c.name != BIOMASS_COMPOUND:
+            _reaction(reactions, 'out_' + c.name, [c],
+                      [PyFBA.metabolism.Compound(c.name, 'e')], '>', transport=True)
+
+    with IncrementalFBA({}, reactions, media, biomass_equation) as fba:
+        fba.add_reactions(set(reactions))
+        status, value, growth = fba.solve()
+        assert '{} {}'.format(UPTAKE_SECRETION_PREFIX, BIOMASS_COMPOUND) in fba
+    assert status == 'optimal'
+    assert growth
+
+
+
+
+def test_bounds_agree_with_pyfba_reaction_bounds(monkeypatch):
+    if not hasattr(PyFBA, 'fba') or not hasattr(PyFBA.fba, 'reaction_bounds'):
+        pytest.skip("needs PyFBA.fba.reaction_bounds")
+    # reaction_bounds() also sets the bounds of the loaded LP
+    if hasattr(PyFBA, 'lp'):
+        monkeypatch.setattr(PyFBA.lp, 'col_bounds', lambda bounds: None)
+    a_e = PyFBA.metabolism.Compound('A', 'e')
+    a_c = PyFBA.metabolism.Compound('A', 'c')
+    b_e = PyFBA.metabolism.Compound('B', 'e')
+    b_c = PyFBA.metabolism.Compound('B', 'c')
+    c_c = PyFBA.metabolism.Compound('C', 'c')
+    reactions = {}
+    _reaction(reactions, 'forward', [a_c], [b_c], '>')
+    _reaction(reactions, 'reverse', [a_c], [b_c], '<')
+    _reaction(reactions, 'reversible', [b_c], [c_c], '=')
+    _reaction(reactions, 'in_media', [a_e], [a_c], '>', transport=True)
+    _reaction(reactions, 'not_in_media', [b_e], [b_c], '=', transport=True)
+    _reaction(reactions, 'symport', [a_e, b_e], [a_c, b_c], '>', transport=True)
+    _reaction(reactions, 'export', [c_c], [PyFBA.metabolism.Compound('C', 'e')],
+              '>', transport=True)
+    explicit = _reaction(reactions, 'explicit', [b_e], [b_c], '=', transport=True)
+    explicit.lower_bound = -5.0
+    explicit.upper_bound = 5.0
+    media = set([a_e])
+
+    expected = PyFBA.fba.reaction_bounds(reactions, set(reactions), media)
+    keys = media_compound_keys(media)
+    universe = ReactionUniverse(reactions)
+    for rxn in reactions:
+        assert reaction_flux_bounds(reactions[rxn], keys) == tuple(expected[rxn]), rxn
+        assert universe.flux_bounds(universe.index[rxn], keys) == tuple(expected[rxn]), rxn
+
+
+
+
+def test_set_media_changes_transport_bounds():
+    a_e = PyFBA.metabolism.Compound('A', 'e')
+    a_c = PyFBA.metabolism.Compound('A', 'c')
+    b_e = PyFBA.metabolism.Compound('B', 'e')
+    b_c = PyFBA.metabolism.Compound('B', 'c')
+    reactions = {}
+    _reaction(reactions, 'in_A', [a_e], [a_c], '>', transport=True)
+    _reaction(reactions, 'in_B', [b_e], [b_c], '=', transport=True)
+    _reaction(reactions, 'A_to_B', [a_c], [b_c], '>')
+    biomass_equation = PyFBA.metabolism.Reaction('BIOMASS_EQN')
+    biomass_equation.set_direction('>')
+    biomass_equation.add_left_compounds(set([b_c]))
+    biomass_equation.set_left_compound_abundance(b_c, 1)
+
+    universe = ReactionUniverse(reactions)
+    for media in (set([a_e]), set([b_e]), set()):
+        keys = media_compound_keys(media)
+        for source in (None, universe):
+            with IncrementalFBA({}, reactions, set([a_e, b_e]), biomass_equation,
+                                universe=source) as fba:
+                fba.add_reactions(set(reactions))
+                fba.set_media(media)
+                for rxn in reactions:
+                    assert fba.col_bounds[fba.col_index[rxn]] ==\
+                        reaction_flux_bounds(reactions[rxn], keys)
@@ -0,0 +1,114 @@
+import numpy as np
+import pytest
+from kmer_database import KmerDatabase, build_kmer_database, encode_kmers,\
+    load_role_kmers
+
+
+
+
+def _write_kmers(path, lines):
+    path.write_text(''.join('{}\t{}\n'.format(kmer, role) for kmer, role in lines))
+    return str(path)
+
+
+
+
+def test_kmers_shared_by_roles_are_dropped(tmp_path):
+    kmer_file = _write_kmers(tmp_path / 'kmers.txt',
+                             [('ACD', 'role A'), ('cde', 'role B'),
+                              ('ACD', 'role B'), ('EFG', 'role A')])
+    k, roles, kmers = load_role_kmers(kmer_file, verbose=False)
+    assert k == 3 and roles == ['role A', 'role B']
+    assert kmers == {'CDE': 1, 'EFG': 0}
+
+
+
+
+def test_kmers_must_all_have_the_same_length(tmp_path):
+    kmer_file = _write_kmers(tmp_path / 'kmers.txt',
+                             [('ACD', 'role A'), ('ACDE', 'role B')])
+    with pytest.raises(ValueError):
+        load_role_kmers(kmer_file, verbose=False)
+
+
+
+
+def test_encoded_kmers_are_distinct_and_mark_unknown_residues():
+    packed, valid = encode_kmers('ACDXAC', 2)
+    assert len(packed) == 5
+    assert list(valid) == [True, True, False, False, True]
+    # AC appears twice and packs to the same value both times
+    assert packed[0] == packed[4] and len(set(packed[:2])) == 2
+    assert len(encode_kmers('A', 2)[0]) == 0
+
+
+
+
+def test_packed_database_finds_the_role_of_each_kmer(tmp_path):
+    kmer_file = _write_kmers(tmp_path / 'kmers.txt',
+                             [('MKV', 'role A'), ('KVL', 'role A'),
+                              ('LLL', 'role B'), ('AXA', 'role B')])
+    database = build_kmer_database(kmer_file, str(tmp_path / 'db'), verbose=False)
+    assert len(database) == 3 and database.k == 3
+    assert database.roles == ['role A', 'role B']
+
+    role_ids = database.sequence_roles('MKVLLLW')
+    assert list(role_ids) == [0, 0, -1, 1, -1]
+    assert list(database.contains(encode_kmers('LLLQ', 3)[0])) == [True, False]
+
+    # A database opened from its directory, or unpickled in another
+    # process, finds the same roles
+    reopened = KmerDatabase(str(tmp_path / 'db'))
+    assert np.array_equal(reopened.sequence_roles('MKVLLLW'), role_ids)
+
+
+
+
+def test_partly_written_database_cannot_be_opened(tmp_path):
+    kmer_file = _write_kmers(tmp_path / 'kmers.txt', [('MKV', 'role A')])
+    build_kmer_database(kmer_file, str(tmp_path / 'db'), verbose=False)
+    (tmp_path / 'db' / 'meta.json').unlink()
+    with pytest.raises(IOError):
+        KmerDatabase(str(tmp_path / 'db'))
+
+
+
+
+def test_database_built_in_chunks_matches_the_whole_file(tmp_path):
+    # Each chunk of two lines is its own sorted run.  ACD is given two
+    # roles in different chunks and is repeated with the same role, and MKV
+    # is repeated across chunks in lower case.
+    kmer_file = _write_kmers(tmp_path / 'kmers.txt',
+                             [('MKV', 'role A'), ('ACD', 'role A'),
+                              ('LLL', 'role B'), ('ACD', 'role A'),
+                              ('mkv', 'role A'), ('AXA', 'role B'),
+                              ('ACD', 'role C'), ('WWW', 'role C'),
+                              ('KVL', 'role A')])
+    k, roles, kmers = load_role_kmers(kmer_file, verbose=False)
+    database = build_kmer_database(kmer_file, str(tmp_path / 'db'),
+                                   chunk_lines=2, verbose=False)
+    assert database.k == k and database.roles == roles
+    expected = dict((kmer, r) for kmer, r in kmers.items() if 'X' not in kmer)
+    assert len(database) == len(expected) == 4
+    assert list(database.kmers) == sorted(database.kmers)
+    for kmer, r in expected.items():
+        assert list(database.sequence_roles(kmer)) == [r]
+    assert list(database.sequence_roles('ACD')) == [-1]
+
+    whole = build_kmer_database(kmer_file, str(tmp_path / 'whole'),
+                                verbose=False)
+    assert np.array_equal(whole.kmers, database.kmers)
+    assert np.array_equal(whole.role_ids, database.role_ids)
+
+
+
+
+def test_malformed_lines_are_rejected(tmp_path):
+    kmer_file = tmp_path / 'kmers.txt'
+    kmer_file.write_text('MKV\trole A\nKVL\n')
+    with pytest.raises(ValueError):
+        build_kmer_database(str(kmer_file), str(tmp_path / 'db'), verbose=False)
+    kmer_file.write_text('MKV\trole A\nKVLL\trole B\n')
+    with pytest.raises(ValueError):
+        build_kmer_database(str(kmer_file), str(tmp_path / 'db'),
+                            chunk_lines=1, verbose=False)
@@ -0,0 +1,74 @@
+import pytest
+pytest.importorskip('PyFBA')
+from kmer_role_scoring import read_fasta, score_genome, score_proteins,\
+    write_reaction_probabilities
+from kmer_database import load_role_kmers
+
+
+# Role A has the signature k-mers of the first protein and role B those of
+# the second; the third protein shares one k-mer with each
+KMERS = [('MKV', 'role A'), ('KVL', 'role A'), ('VLS', 'role A'),
+         ('GGH', 'role B'), ('GHW', 'role B'), ('HWP', 'role B'),
+         ('HWQ', 'role B')]
+PROTEINS = [('p1', 'MKVLSA'), ('p2', 'GGHWPGGHWQ'), ('p3', 'MKVGGH'),
+            ('p4', 'MK')]
+
+
+
+
+def _write_inputs(tmp_path):
+    kmer_file = tmp_path / 'kmers.txt'
+    kmer_file.write_text(''.join('{}\t{}\n'.format(*line) for line in KMERS))
+    fasta_file = tmp_path / 'proteins.faa'
+    fasta_file.write_text(''.join('>{} protein\n{}\n{}\n'.format(seqid, seq[:4], seq[4:])
+                                  for seqid, seq in PROTEINS))
+    return str(fasta_file), str(kmer_file)
+
+
+
+
+def test_fasta_sequences_are_joined_across_lines(tmp_path):
+    fasta_file, kmer_file = _write_inputs(tmp_path)
+    assert list(read_fasta(fasta_file)) == PROTEINS
+
+
+
+
+def test_proteins_score_their_best_role(tmp_path):
+    fasta_file, kmer_file = _write_inputs(tmp_path)
+    k, roles, kmers = load_role_kmers(kmer_file, verbose=False)
+    scores = score_proteins(PROTEINS, k, kmers)
+    assert scores == {0: 3.0 / 4, 1: 6.0 / 8}
+    # Proteins with fewer hits than min_hits are not scored
+    assert score_proteins(PROTEINS, k, kmers, min_hits=4) == {1: 6.0 / 8}
+
+
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_genome_scores_do_not_depend_on_the_chunks(tmp_path, processes):
+    fasta_file, kmer_file = _write_inputs(tmp_path)
+    scores = score_genome(fasta_file, kmer_file, processes=processes,
+                          chunk_size=1, verbose=False)
+    assert scores == {'role A': 3.0 / 4, 'role B': 6.0 / 8}
+
+
+
+
+def test_reaction_probabilities_file_is_sorted(tmp_path):
+    output = tmp_path / 'probabilities.txt'
+    write_reaction_probabilities({'rxn2': 0.5, 'rxn1': 0.25}, str(output))
+    assert output.read_text() == 'reaction\tprobability\nrxn1\t0.25\nrxn2\t0.5\n'
+
+
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_packed_database_scores_match_the_tab_separated_database(tmp_path,
+                                                                 processes):
+    from kmer_database import build_kmer_database
+    fasta_file, kmer_file = _write_inputs(tmp_path)
+    build_kmer_database(kmer_file, str(tmp_path / 'db'), verbose=False)
+    assert score_genome(fasta_file, str(tmp_path / 'db'), processes=processes,
+                        chunk_size=2, verbose=False) ==\
+        score_genome(fasta_file, kmer_file, processes=1, verbose=False)
@@ -0,0 +1,107 @@
+import numpy as np
+import pytest
+import lp_backends
+from lp_backends import AUTO_BACKEND, DEFAULT_BACKEND, available_backends,\
+    calibrated_backend, make_backend, parse_backend, record_calibration,\
+    resolve_backend
+
+
+
+
+def _solve_chain(backend):
+    """
+    Maximize x3 along the chain x1 = x2 = x3, where x2 is bounded by 5, then
+    tighten x3 to 3 and solve the same LP again.
+    """
+    with make_backend(backend) as lp:
+        rows = lp.add_rows(2)
+        first = lp.add_columns([({rows: 1.0}, 0.0, 10.0),
+                                ({rows: -1.0, rows + 1: 1.0}, 0.0, 5.0),
+                                ({rows + 1: -1.0}, 0.0, 1000.0)])
+        lp.set_objective(first + 2, 1.0)
+        solved = [(lp.solve(), lp.objective_value(), lp.column_values())]
+        lp.set_col_bounds(first + 2, 0.0, 3.0)
+        solved.append((lp.solve(), lp.objective_value(), lp.column_values()))
+        assert lp.size()['rows'] == 2 and lp.size()['columns'] == 3
+    return solved
+
+
+
+
+@pytest.mark.parametrize('backend', [
+    ('glpk', {'method': 'dual'}),
+    ('glpk', {'method': 'primal'}),
+    ('highs', {'method': 'dual'}),
+    ('highs', {'method': 'primal'}),
+    ('highs', {'method': 'ipm'})])
+def test_backends_solve_and_warm_resolve(backend):
+    if backend[0] not in available_backends():
+        pytest.skip('{} is not installed'.format(backend[0]))
+    (status, value, columns), (restatus, revalue, recolumns) = _solve_chain(backend)
+    assert status == 'optimal' and value == pytest.approx(5.0)
+    assert np.allclose(columns, [5.0, 5.0, 5.0])
+    assert restatus == 'optimal' and revalue == pytest.approx(3.0)
+    assert np.allclose(recolumns, [3.0, 3.0, 3.0])
+
+
+
+
+def test_glpk_and_highs_agree():
+    if available_backends() != ['glpk', 'highs']:
+        pytest.skip('both glpk and highs are needed')
+    for (_, glpk_value, glpk_columns), (_, highs_value, highs_columns) in \
+            zip(_solve_chain('glpk'), _solve_chain('highs')):
+        assert glpk_value == pytest.approx(highs_value)
+        assert np.allclose(glpk_columns, highs_columns)
+
+
+
+
+def test_parse_backend_options():
+    assert parse_backend('highs:method=primal,threads=4,presolve=on') == \
+        ('highs', {'method': 'primal', 'threads': 4, 'presolve': True})
+    assert parse_backend('glpk') == ('glpk', {})
+    assert parse_backend('auto') == (AUTO_BACKEND, {})
+
+
+
+
+@pytest.mark.parametrize('spec', ['cplex', 'highs:foo=1', 'glpk:threads=2',
+                                  'glpk:method=ipm', 'auto:method=dual'])
+def test_parse_backend_rejects_unknown_backends_and_options(spec):
+    with pytest.raises(ValueError):
+        parse_backend(spec)
+
+
+
+
+def test_make_backend_rejects_unknown_options():
+    with pytest.raises(ValueError):
+        make_backend(('highs', {'foo': 1}))
+    with pytest.raises(ValueError):
+        make_backend(AUTO_BACKEND)
+
+
+
+
+def test_auto_picks_the_backend_calibrated_for_the_nearest_size(tmp_path):
+    cache_dir = str(tmp_path)
+    # Nothing calibrated yet
+    assert calibrated_backend(100, cache_dir) is None
+    assert resolve_backend(AUTO_BACKEND, 100, cache_dir) == DEFAULT_BACKEND
+
+    record_calibration(100, ('highs', {'method': 'dual'}), cache_dir)
+    record_calibration(5000, ('glpk', {'method': 'primal'}), cache_dir)
+    assert resolve_backend(parse_backend('auto'), 120, cache_dir) == \
+        ('highs', {'method': 'dual'})
+    assert resolve_backend(AUTO_BACKEND, 4000, cache_dir) == \
+        ('glpk', {'method': 'primal'})
+    # A later calibration of the same size replaces the earlier one
+    record_calibration(127, ('glpk', {'method': 'dual'}), cache_dir)
+    assert calibrated_backend(100, cache_dir) == ('glpk', {'method': 'dual'})
+
+    # Other backends, and auto for a model of unknown size, are not looked up
+    assert resolve_backend(('highs', {}), 100, cache_dir) == ('highs', {})
+    assert resolve_backend(AUTO_BACKEND, None, cache_dir) == DEFAULT_BACKEND
+    with pytest.raises(ValueError):
+        record_calibration(100, ('highs', {'foo': 1}), cache_dir)
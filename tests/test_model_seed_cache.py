@@ -0,0 +1,57 @@
+import os
+import pytest
+pytest.importorskip('PyFBA')
+import model_seed_cache
+
+
+
+
+@pytest.fixture
+def source(tmp_path, monkeypatch):
+    source_file = tmp_path / 'reactions.tsv'
+    source_file.write_text('rxn00001\n')
+    monkeypatch.setattr(model_seed_cache, 'model_seed_source_files',
+                        lambda: [str(source_file)])
+    return source_file
+
+
+
+
+def _snapshot(tmp_path, builds):
+    def build():
+        builds.append(1)
+        return {'built': len(builds)}
+    return model_seed_cache.cached_snapshot('test', 'gramnegative', build,
+                                            cache_dir=str(tmp_path / 'cache'))
+
+
+
+
+def test_snapshot_is_reused_until_a_source_file_changes(tmp_path, source):
+    builds = []
+    assert _snapshot(tmp_path, builds) == {'built': 1}
+    assert _snapshot(tmp_path, builds) == {'built': 1}
+
+    source.write_text('rxn00001\nrxn00002\n')
+    assert _snapshot(tmp_path, builds) == {'built': 2}
+
+
+
+
+def test_touched_source_file_is_hashed_and_not_rebuilt(tmp_path, source):
+    builds = []
+    _snapshot(tmp_path, builds)
+    st = os.stat(str(source))
+    os.utime(str(source), (st.st_atime, st.st_mtime + 10))
+    assert _snapshot(tmp_path, builds) == {'built': 1}
+
+
+
+
+def test_corrupt_snapshot_is_rebuilt(tmp_path, source):
+    builds = []
+    _snapshot(tmp_path, builds)
+    cache_file = tmp_path / 'cache' / 'test_gramnegative.pickle'
+    cache_file.write_bytes(cache_file.read_bytes()[:20])
+    assert _snapshot(tmp_path, builds) == {'built': 2}
+    assert _snapshot(tmp_path, builds) == {'built': 2}
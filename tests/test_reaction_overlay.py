@@ -0,0 +1,123 @@
+import copy
+import pytest
+from reaction_overlay import ReactionOverlay, ReactionView
+
+
+
+
+def _reaction(rxn, left, right, direction):
+    PyFBA = pytest.importorskip('PyFBA')
+    reaction = PyFBA.metabolism.Reaction(rxn)
+    reaction.set_direction(direction)
+    for side, compounds in (('left', left), ('right', right)):
+        getattr(reaction, 'add_{}_compounds'.format(side))(set(compounds))
+        for c, abundance in compounds.items():
+            getattr(reaction, 'set_{}_compound_abundance'.format(side))(c, abundance)
+    return reaction
+
+
+
+
+def _compound(name, location='c'):
+    PyFBA = pytest.importorskip('PyFBA')
+    return PyFBA.metabolism.Compound(name, location)
+
+
+
+
+def test_overlay_changes_do_not_reach_the_base():
+    base = {'rxn1': {'direction': '>'}, 'rxn2': {'direction': '='}}
+    overlay = ReactionOverlay(base)
+
+    overlay.local('rxn1')['direction'] = '<'
+    overlay['rxn3'] = {'direction': '='}
+    del overlay['rxn2']
+
+    assert overlay['rxn1'] == {'direction': '<'}
+    assert base['rxn1'] == {'direction': '>'}
+    assert 'rxn2' not in overlay and 'rxn2' in base
+    assert 'rxn3' in overlay and 'rxn3' not in base
+    assert sorted(overlay) == ['rxn1', 'rxn3']
+    assert len(overlay) == 2
+    with pytest.raises(KeyError):
+        overlay['rxn2']
+
+
+
+
+def test_deleted_reactions_can_be_added_back():
+    base = {'rxn1': 1}
+    overlay = ReactionOverlay(base)
+    del overlay['rxn1']
+    overlay['rxn1'] = 2
+    assert overlay['rxn1'] == 2 and base['rxn1'] == 1
+    assert list(overlay) == ['rxn1'] and len(overlay) == 1
+
+
+
+
+def test_forward_view_reads_the_base_reaction():
+    a, b = _compound('A'), _compound('B')
+    base = {'rxn1': _reaction('rxn1', {a: 1}, {b: 2}, '=')}
+    view = ReactionOverlay(base).orient('rxn1', 1, 'rxn1_f')
+
+    assert view.name == 'rxn1_f' and view.direction == '>'
+    assert view.left_compounds == {a} and view.right_compounds == {b}
+    assert view.get_right_compound_abundance(b) == 2
+    assert base['rxn1'].direction == '='
+
+
+
+
+def test_reversed_view_swaps_every_direction_dependent_attribute():
+    a, b = _compound('A'), _compound('B', 'e')
+    reaction = _reaction('rxn1', {a: 1}, {b: 2}, '<')
+    reaction.pLR, reaction.pRL = 0.2, 0.9
+    reaction.deltaG = -3.5
+    reaction.gfdirection = '<'
+    reaction.inp, reaction.outp = False, True
+    overlay = ReactionOverlay({'rxn1': reaction})
+    view = overlay.orient('rxn1', -1, 'rxn1', 0.0, 1000.0)
+
+    assert view.direction == '>'
+    assert view.left_compounds == {b} and view.right_compounds == {a}
+    assert view.left_abundance == {b: 2} and view.right_abundance == {a: 1}
+    assert view.get_left_compound_abundance(b) == 2
+    assert view.number_of_left_compounds() == 1
+    assert (view.pLR, view.pRL) == (0.9, 0.2)
+    assert view.get_probability_left_to_right() == 0.9
+    assert view.deltaG == 3.5 and view.get_deltaG() == 3.5
+    assert view.gfdirection == '>'
+    assert (view.inp, view.outp) == (True, False)
+    assert view.is_input_reaction() and not view.is_output_reaction()
+    assert (view.lower_bound, view.upper_bound) == (0.0, 1000.0)
+
+    # A copy reversed with Reaction.reverse_reaction() agrees with the view
+    reversed_copy = copy.deepcopy(reaction)
+    reversed_copy.reverse_reaction()
+    assert (view.pLR, view.pRL, view.deltaG, view.gfdirection) ==\
+        (reversed_copy.pLR, reversed_copy.pRL, reversed_copy.deltaG,
+         reversed_copy.gfdirection)
+    assert reaction.deltaG == -3.5 and reaction.pLR == 0.2
+
+
+
+
+def test_reversing_a_reversed_view_gives_the_forward_reaction():
+    a, b = _compound('A'), _compound('B')
+    reaction = _reaction('rxn1', {a: 1}, {b: 1}, '=')
+    view = ReactionView(ReactionView(reaction, -1, 'rxn1_r'), -1, 'rxn1')
+    assert view.base is reaction and view.sign == 1
+    assert view.left_compounds == {a}
+
+
+
+
+def test_views_do_not_modify_the_shared_reaction():
+    a, b = _compound('A'), _compound('B')
+    reaction = _reaction('rxn1', {a: 1}, {b: 1}, '<')
+    view = ReactionView(reaction, -1, 'rxn1')
+    for method in ('reverse_reaction', 'set_direction', 'add_left_compounds'):
+        with pytest.raises(AttributeError):
+            getattr(view, method)
+    assert reaction.direction == '<'
@@ -0,0 +1,82 @@
+import pickle
+import pytest
+pytest.importorskip('PyFBA')
+from reaction_probabilities import ReactionProbabilities,\
+    load_reaction_probabilities
+
+
+
+
+def _store(tmp_path, text):
+    probabilities_file = tmp_path / 'probabilities.txt'
+    probabilities_file.write_text(text)
+    return ReactionProbabilities(str(probabilities_file),
+                                 cache_dir=str(tmp_path / 'cache'))
+
+
+
+
+def test_split_halves_have_the_probability_of_their_reaction(tmp_path):
+    store = _store(tmp_path, 'reaction\tprobability\nrxn2\t0.5\nrxn1\t0.25\n')
+    assert store['rxn1'] == 0.25 and store['rxn2_r'] == 0.5
+    assert 'rxn1_f' in store and 'rxn3' not in store and 'rxn3_f' not in store
+    with pytest.raises(KeyError):
+        store['rxn3']
+
+
+
+
+def test_iteration_agrees_with_membership(tmp_path):
+    # rxn1_f is listed itself, with its own probability
+    store = _store(tmp_path, 'reaction\tprobability\nrxn1\t0.25\n'
+                             'rxn1_f\t0.75\nrxn2\t0.5\n')
+    assert store['rxn1_f'] == 0.75 and store['rxn1_r'] == 0.25
+    ids = list(store)
+    assert len(ids) == len(set(ids)) == len(store)
+    assert all(rxn in store for rxn in ids)
+    assert set(ids) >= {'rxn1', 'rxn1_f', 'rxn1_r', 'rxn2', 'rxn2_f', 'rxn2_r'}
+    assert len(_store(tmp_path, 'reaction\tprobability\n')) == 0
+
+
+
+
+def test_missing_reports_reactions_without_a_probability(tmp_path):
+    store = _store(tmp_path, 'reaction\tprobability\nrxn1\t0.25\n')
+    assert store.missing({'rxn1', 'rxn1_r', 'rxn9_f', 'rxn3'}) ==\
+        ['rxn3', 'rxn9_f']
+
+
+
+
+def test_missing_reactions_are_reported_once(tmp_path, capsys):
+    store = _store(tmp_path, 'reaction\tprobability\nrxn1\t0.25\n')
+    capsys.readouterr()
+    assert store.report_missing({'rxn1', 'rxn3'}) == ['rxn3']
+    assert store.report_missing({'rxn3', 'rxn4'}) == ['rxn4']
+    assert store.report_missing({'rxn1', 'rxn3', 'rxn4'}) == []
+    err = capsys.readouterr().err
+    assert err.count('rxn3') == 1 and err.count('rxn4') == 1
+    # Long lists are cut short
+    store.report_missing('rxn{:02d}'.format(i) for i in range(10, 30))
+    err = capsys.readouterr().err
+    assert '20 reactions' in err and 'rxn19, ...' in err and 'rxn20' not in err
+
+
+
+
+def test_malformed_and_duplicated_rows(tmp_path):
+    store = _store(tmp_path, 'reaction\tprobability\nrxn1\t0.25\nrxn2\n'
+                             'rxn3\tx\nrxn1\t0.5\n')
+    assert dict(store.items()) == {'rxn1': 0.5, 'rxn1_f': 0.5, 'rxn1_r': 0.5}
+
+
+
+
+def test_store_is_loaded_once_and_pickled_by_path(tmp_path):
+    probabilities_file = tmp_path / 'probabilities.txt'
+    probabilities_file.write_text('reaction\tprobability\nrxn1\t0.25\n')
+    store = load_reaction_probabilities(str(probabilities_file),
+                                        cache_dir=str(tmp_path / 'cache'))
+    assert load_reaction_probabilities(str(probabilities_file)) is store
+    assert load_reaction_probabilities(store) is store
+    assert pickle.loads(pickle.dumps(store)) is store
@@ -0,0 +1,66 @@
+import pytest
+pytest.importorskip('PyFBA')
+import refine_model
+from role_reaction_index import RoleReactionIndex
+
+
+# The reactions each media condition needs for growth, and the reaction
+# gap-filling adds on it each time
+NEEDS = {'m1': {'r1'}, 'm2': {'r2', 'r3'}, 'm3': set(), 'm4': {'r9'}}
+ADDS = {'m1': ['r1'], 'm2': ['r2', 'r3'], 'm4': []}
+
+
+
+
+@pytest.fixture
+def calls(monkeypatch):
+    calls = {'predict': [], 'gapfill': []}
+
+    def predict_growth(compounds, reactions, model_reactions, biomass_equation,
+                       media_conditions, media_dir, **kwargs):
+        calls['predict'].append(set(media_conditions))
+        return dict((m, int(NEEDS[m] <= model_reactions))
+                    for m in media_conditions)
+
+    def gapfill_media_conditions(media_conditions, compounds, reactions,
+                                 model_reactions, *args, **kwargs):
+        calls['gapfill'].append(set(media_conditions))
+        # Each round adds one more of the reactions a media condition needs
+        added = dict((m, set([r for r in ADDS[m]
+                              if r not in model_reactions][:1]))
+                     for m in media_conditions)
+        return set().union(*added.values()), {}, added
+
+    monkeypatch.setattr(refine_model, 'predict_growth', predict_growth)
+    monkeypatch.setattr(refine_model, 'gapfill_media_conditions',
+                        gapfill_media_conditions)
+    return calls
+
+
+
+
+def test_false_negatives_are_gap_filled_until_they_grow(calls):
+    role_index = RoleReactionIndex({'r2': {'role 2'}})
+    reactions, roles, iteration_added, growth = refine_model.refine_model(
+        {}, {}, set(), set(), None, set(), 'close', 'genus', 'probs',
+        {'m1': 1, 'm2': 1, 'm3': 1, 'm4': 0}, '/media/',
+        role_index=role_index, verbose=False)
+
+    # m2 needs two rounds, so it is gap-filled again while it does not grow
+    assert calls['gapfill'] == [{'m1', 'm2'}, {'m2'}]
+    assert iteration_added == [{'r1', 'r2'}, {'r3'}]
+    assert reactions == {'r1', 'r2', 'r3'} and roles == {'role 2'}
+    assert growth == {'m1': 1, 'm2': 1, 'm3': 1, 'm4': 0}
+    # Growth is only predicted again on the media that did not grow
+    assert calls['predict'][1:] == [{'m1', 'm2', 'm4'}, {'m2', 'm4'}]
+
+
+
+
+def test_refinement_stops_when_nothing_is_added(calls):
+    reactions, roles, iteration_added, growth = refine_model.refine_model(
+        {}, {}, set(), set(), None, set(), 'close', 'genus', 'probs',
+        {'m4': 1}, '/media/', role_index=RoleReactionIndex({}), verbose=False)
+    assert calls['gapfill'] == [{'m4'}]
+    assert iteration_added == [set()]
+    assert growth == {'m4': 0}
@@ -0,0 +1,36 @@
+import inspect
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+from role_reaction_index import RoleReactionIndex, build_role_reaction_index
+
+
+
+
+def _index():
+    return RoleReactionIndex({'rxn1': {'role A'}, 'rxn2': {'role A', 'role B'},
+                              'rxn3': set()}, orgtype='gramnegative')
+
+
+
+
+def test_both_directions_of_the_mapping():
+    index = _index()
+    assert index.orgtype == 'gramnegative'
+    assert index.reactions_for_roles({'role A'}) == {'rxn1', 'rxn2'}
+    assert index.roles_for_reactions({'rxn2', 'rxn3', 'rxn9'}) ==\
+        {'role A', 'role B'}
+    assert index.reactions_to_roles({'rxn1', 'rxn3'}) == {'rxn1': {'role A'}}
+    assert index.roles_to_reactions({'role B', 'role C'}) == {'role B': {'rxn2'}}
+
+
+
+
+@pytest.mark.parametrize('orgtype', ['gramnegative', 'grampositive'])
+def test_index_agrees_with_pyfba_for_the_organism_type(orgtype):
+    if 'organism_type' not in\
+       inspect.signature(PyFBA.filters.roles_to_reactions).parameters:
+        pytest.skip("needs the organism types of PyFBA.filters")
+    index = build_role_reaction_index(orgtype)
+    roles = sorted(index.role_reactions)[:200]
+    assert index.roles_to_reactions(set(roles)) ==\
+        PyFBA.filters.roles_to_reactions(set(roles), organism_type=orgtype)
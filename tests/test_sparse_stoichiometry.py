@@ -0,0 +1,108 @@
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+import sparse_stoichiometry
+from incremental_fba import reaction_stoichiometry
+from reaction_overlay import ReactionOverlay
+from sparse_stoichiometry import ReactionUniverse, compound_probability,\
+    get_reaction_universe, suggest_by_compound, use_reaction_universe
+
+
+
+
+def _reaction(reactions, rxn, left, right, direction='>', transport=False):
+    reaction = PyFBA.metabolism.Reaction(rxn)
+    reaction.set_direction(direction)
+    reaction.add_left_compounds(set(left))
+    for c in left:
+        reaction.set_left_compound_abundance(c, 1)
+    reaction.add_right_compounds(set(right))
+    for c in right:
+        reaction.set_right_compound_abundance(c, 1)
+    reaction.is_transport = transport
+    reactions[rxn] = reaction
+    return reaction
+
+
+
+
+def _reactions():
+    a_e, a, b, c, d, e = [PyFBA.metabolism.Compound(n, loc) for n, loc in
+                          (('A', 'e'), ('A', 'c'), ('B', 'c'), ('C', 'c'),
+                           ('D', 'c'), ('E', 'c'))]
+    reactions = {}
+    _reaction(reactions, 'r_in', [a_e], [a], transport=True)
+    _reaction(reactions, 'r1', [a], [b])
+    _reaction(reactions, 'r2', [b], [c], '=')
+    _reaction(reactions, 'r3', [c, d], [a], '<')
+    _reaction(reactions, 'r4', [d], [e])
+    return reactions
+
+
+
+
+def test_columns_match_the_reaction_stoichiometry():
+    reactions = _reactions()
+    universe = ReactionUniverse(reactions)
+    assert universe.reaction_ids == ['r1', 'r2', 'r3', 'r4', 'r_in']
+    for j, rxn in enumerate(universe.reaction_ids):
+        assert universe.column(j) == reaction_stoichiometry(reactions[rxn])
+    assert list(universe.direction) == [1, 0, -1, 1, 1]
+    assert list(universe.media_dependent) == [False] * 4 + [True]
+    assert universe.uptake_keys(4) == (('A', 'e'),)
+
+
+
+
+def test_universe_is_built_once_per_dictionary_and_overlay_changes():
+    reactions = _reactions()
+    universe = get_reaction_universe(reactions)
+    assert get_reaction_universe(reactions) is universe
+    assert get_reaction_universe(ReactionOverlay(reactions)) is universe
+
+    # Overlays with the same changes share a universe, other changes do not
+    changed = ReactionOverlay(reactions)
+    view = changed.orient('r3', -1, 'r3')
+    same = ReactionOverlay(reactions)
+    same['r3'] = view
+    assert get_reaction_universe(same) is get_reaction_universe(changed)
+    assert get_reaction_universe(changed) is not universe
+
+    # A new dictionary with the same size is not mistaken for the old one
+    assert get_reaction_universe(_reactions()) is not universe
+
+
+
+
+def test_a_published_universe_can_be_used_for_a_dictionary():
+    reactions = _reactions()
+    universe = ReactionUniverse(reactions)
+    use_reaction_universe(reactions, universe)
+    assert get_reaction_universe(reactions) is universe
+    assert len(sparse_stoichiometry._built) <= sparse_stoichiometry.MAX_BUILT_UNIVERSES
+
+
+
+
+def test_compound_probability_scores_each_side():
+    reactions = _reactions()
+    universe = ReactionUniverse(reactions)
+    model = {'r_in', 'r1'}
+    # A_e, A and B are present: r2 has its whole left side, r3 its whole
+    # right side and r4 nothing
+    assert compound_probability(universe, model, cutoff=0.5) == {'r2', 'r3'}
+    assert compound_probability(universe, model, cutoff=0.5,
+                                allowed_reactions={'r2', 'r4'}) == {'r2'}
+    # The default cutoff is the average of the model, where every side is
+    # fully present
+    assert compound_probability(universe, model) == set()
+
+
+
+
+def test_orphan_compounds_suggest_the_reactions_that_use_them():
+    reactions = _reactions()
+    universe = ReactionUniverse(reactions)
+    model = {'r_in', 'r1'}
+    # B is used by one model reaction and A by two; A_e is extracellular
+    assert suggest_by_compound(universe, model, max_reactions=1) == {'r2'}
+    assert suggest_by_compound(universe, model, max_reactions=2) == {'r2', 'r3'}
@@ -0,0 +1,68 @@
+import os
+import time
+import pytest
+PyFBA = pytest.importorskip('PyFBA')
+from suggestion_cache import SuggestionCache, suggestion_key
+
+
+
+
+def _inputs(tmp_path):
+    close_roles = tmp_path / 'close.roles'
+    close_roles.write_text('role A\n')
+    genus_roles = tmp_path / 'genus.roles'
+    genus_roles.write_text('role B\n')
+    a = PyFBA.metabolism.Compound('A', 'c')
+    biomass = PyFBA.metabolism.Reaction('biomass')
+    biomass.add_left_compounds({a})
+    biomass.set_left_compound_abundance(a, 2)
+    media = {PyFBA.metabolism.Compound('A', 'e'),
+             PyFBA.metabolism.Compound('B', 'e')}
+    return media, biomass, str(close_roles), str(genus_roles)
+
+
+
+
+def test_key_does_not_depend_on_order_or_file_location(tmp_path):
+    media, biomass, close_roles, genus_roles = _inputs(tmp_path)
+    key = suggestion_key({'rxn1', 'rxn2'}, {'role A'}, media, biomass,
+                         close_roles, genus_roles)
+    moved = tmp_path / 'moved.roles'
+    moved.write_text(open(close_roles).read())
+    assert suggestion_key(['rxn2', 'rxn1'], ['role A'], list(media)[::-1],
+                          biomass, str(moved), genus_roles) == key
+
+
+
+
+def test_key_changes_with_the_inputs(tmp_path):
+    media, biomass, close_roles, genus_roles = _inputs(tmp_path)
+    key = suggestion_key({'rxn1'}, {'role A'}, media, biomass, close_roles,
+                         genus_roles)
+    assert suggestion_key({'rxn1', 'rxn2'}, {'role A'}, media, biomass,
+                          close_roles, genus_roles) != key
+    assert suggestion_key({'rxn1'}, {'role A'}, media, biomass, close_roles,
+                          genus_roles, minimal_stages=True) != key
+    # Give the file a new modification time, so its hash is not reused
+    time.sleep(0.01)
+    with open(genus_roles, 'w') as fout:
+        fout.write('role C\n')
+    assert suggestion_key({'rxn1'}, {'role A'}, media, biomass, close_roles,
+                          genus_roles) != key
+
+
+
+
+def test_least_recently_used_entries_are_evicted(tmp_path):
+    cache = SuggestionCache(cache_dir=str(tmp_path), max_bytes=1 << 20)
+    cache.put('old', ({'rxn1'}, {'role A'}, {'rxn1': 'genus'}))
+    cache.put('new', ({'rxn2'}, set(), {}))
+    assert cache.get('old') == ({'rxn1'}, {'role A'}, {'rxn1': 'genus'})
+    assert cache.get('missing') is None
+
+    # 'new' was used least recently, so it goes first
+    entry = os.path.join(cache.path, 'new.pickle')
+    os.utime(entry, (0, 0))
+    cache.max_bytes = os.path.getsize(os.path.join(cache.path, 'old.pickle'))
+    cache.evict()
+    assert cache.get('new') is None and cache.get('old') is not None
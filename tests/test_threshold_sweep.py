@@ -0,0 +1,58 @@
+import pytest
+pytest.importorskip('PyFBA')
+from threshold_sweep import ReactionFrequencyTable, SweepRule, media_count,\
+    sweep_rules
+
+
+
+
+def _table():
+    table = ReactionFrequencyTable()
+    table.add('m1', {'rxn1', 'rxn2', 'tr1'})
+    table.add('m2', {'rxn1', 'tr1', 'tr2'})
+    table.add('m3', {'rxn1', 'rxn2'})
+    return table
+
+
+
+
+def test_readding_a_medium_replaces_its_column():
+    table = _table()
+    table.add('m1', {'rxn3'})
+    assert table.media == ['m2', 'm3', 'm1']
+    assert table.matrix.shape == (len(table.reaction_ids), 3)
+    counts = dict(zip(table.reaction_ids, table.counts()))
+    assert counts == {'rxn1': 2, 'rxn2': 1, 'tr1': 1, 'tr2': 1, 'rxn3': 1}
+
+
+
+
+@pytest.mark.parametrize('threshold, n_media, expected', [
+    # A fraction means more than that fraction of the media
+    (0.5, 10, 6),
+    (0.5, 9, 5),
+    (0.29, 100, 30),
+    (0.1, 30, 4),
+    # Otherwise it is the number of media itself
+    (2, 10, 2),
+    (1, 10, 1)])
+def test_media_count(threshold, n_media, expected):
+    assert media_count(threshold, n_media) == expected
+
+
+
+
+def test_transport_rules_at_or_above_the_threshold_are_dropped():
+    rules = sweep_rules([3, 1], [None, 1, 3])
+    assert rules == [SweepRule(3, 1), SweepRule(3, None), SweepRule(1, None)]
+
+
+
+
+@pytest.mark.parametrize('rule, expected', [
+    (SweepRule(3, None), {'rxn1'}),
+    (SweepRule(2, None), {'rxn1', 'rxn2', 'tr1'}),
+    (SweepRule(3, 1), {'rxn1', 'tr1', 'tr2'}),
+    (SweepRule(1, None), {'rxn1', 'rxn2', 'tr1', 'tr2'})])
+def test_rules_select_reactions_by_frequency(rule, expected):
+    assert _table().reactions(rule, transport={'tr1', 'tr2'}) == expected
@@ -0,0 +1,58 @@
+import pytest
+from worker_pool import run_tasks
+
+
+_state = {}
+
+
+
+
+def _init(offset):
+    _state['offset'] = offset
+
+
+
+
+def _add(task):
+    if task < 0:
+        raise ValueError(task)
+    return task + _state['offset']
+
+
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_results_follow_the_tasks(processes):
+    results = run_tasks(_add, range(10), _init, (100,), processes=processes)
+    assert list(results) == list(range(100, 110))
+
+
+
+
+def test_unordered_results_cover_every_task():
+    results = run_tasks(_add, range(10), _init, (1,), processes=2,
+                        ordered=False)
+    assert sorted(results) == list(range(1, 11))
+
+
+
+
+@pytest.mark.parametrize('processes', [1, 2])
+def test_task_errors_reach_the_caller(processes):
+    with pytest.raises(ValueError):
+        list(run_tasks(_add, [1, -1, 2], _init, (0,), processes=processes))
+
+
+
+
+def test_finalizer_releases_the_state_in_process():
+    list(run_tasks(_add, [1], _init, (0,), finalizer=_state.clear))
+    assert _state == {}
+
+
+
+
+def test_closing_early_stops_the_pool():
+    results = run_tasks(_add, range(100), _init, (0,), processes=2)
+    assert next(results) == 0
+    results.close()
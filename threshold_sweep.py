@@ -0,0 +1,458 @@
+from __future__ import print_function
+import argparse
+import collections
+import itertools
+import multiprocessing
+import os
+import pickle
+import sys
+import numpy as np
+import scipy.sparse
+import model_seed_cache
+from batch_growth_prediction import score_predictions
+from gapfill_journal import GapfillJournal
+from incremental_fba import IncrementalFBA
+from lp_backends import DEFAULT_BACKEND, parse_backend
+from shared_universe import publish_reaction_universe
+from sparse_stoichiometry import get_reaction_universe
+from worker_pool import run_tasks
+sys.path.insert(0, "/Users/Taylor/gapfilling_metabolic_networks/PyFBA/")
+import PyFBA
+
+
+# A rule for assembling a model from the gap-filling solutions:
+#   min_media            reactions added on at least this many media are included
+#   transport_min_media  transport reactions added on at least this many media
+#                        are also included (None for no transport rule)
+SweepRule = collections.namedtuple('SweepRule', ['min_media', 'transport_min_media'])
+
+# Per-process FBA model and the reactions switched off for each rule,
+# populated once in each worker by _init_worker()
+_worker_state = {}
+
+
+
+
+class ReactionFrequencyTable(object):
+    """
+    Which reactions were added in gap-filling on which media: a reaction by
+    medium incidence matrix built from the per-media gap-filling solutions.
+
+    Solutions are added one medium at a time, so a journal or a directory of
+    solutions can be streamed into the table.  Adding a medium again
+    replaces its earlier solution.
+    """
+
+    def __init__(self):
+        self.reaction_ids = []
+        self.index = {}
+        self.columns = collections.OrderedDict()
+        self._matrix = None
+
+    def add(self, media_condition, added_reactions):
+        """
+        Add the reactions added in gap-filling on one media condition.
+
+        :param media_condition: The media condition
+        :type media_condition: string
+        :param added_reactions: The set of reactions added in gap-filling
+        :type added_reactions: set
+        """
+        rows = []
+        for rxn in added_reactions:
+            if rxn not in self.index:
+                self.index[rxn] = len(self.reaction_ids)
+                self.reaction_ids.append(rxn)
+            rows.append(self.index[rxn])
+        self.columns.pop(media_condition, None)
+        self.columns[media_condition] = np.array(sorted(rows), dtype=np.int64)
+        self._matrix = None
+
+    @property
+    def media(self):
+        return list(self.columns)
+
+    @property
+    def matrix(self):
+        """
+        The reaction by medium matrix, 1 where a reaction was added on a
+        medium.
+
+        :rtype: scipy.sparse.csc_matrix
+        """
+        if self._matrix is None:
+            columns = list(self.columns.values())
+            indptr = np.zeros(len(columns) + 1, dtype=np.int64)
+            indptr[1:] = np.cumsum([len(c) for c in columns])
+            indices = np.concatenate(columns) if columns else\
+                np.zeros(0, dtype=np.int64)
+            self._matrix = scipy.sparse.csc_matrix(
+                (np.ones(len(indices)), indices, indptr),
+                shape=(len(self.reaction_ids), len(columns)))
+        return self._matrix
+
+    def counts(self):
+        """
+        The number of media each reaction was added on.
+
+        :return: An array of counts in the order of reaction_ids
+        :rtype: numpy.ndarray
+        """
+        return np.asarray(self.matrix.sum(axis=1)).ravel().astype(np.int64)
+
+    def reactions(self, rule, transport=frozenset()):
+        """
+        The gap-filled reactions a rule includes.
+
+        :param rule: The rule
+        :type rule: SweepRule
+        :param transport: The ids of the transport reactions
+        :type transport: set
+        :return: The set of reaction ids
+        :rtype: set
+        """
+        counts = self.counts()
+        selected = set(self.reaction_ids[i] for i in
+                       np.flatnonzero(counts >= rule.min_media))
+        if rule.transport_min_media is not None:
+            selected.update(self.reaction_ids[i] for i in
+                            np.flatnonzero(counts >= rule.transport_min_media)
+                            if self.reaction_ids[i] in transport)
+        return selected
+
+    @classmethod
+    def from_journal(cls, path):
+        """
+        Read the solutions from a gap-filling journal.
+
+        :param path: Filepath of the journal
+        :type path: string
+        :rtype: ReactionFrequencyTable
+        """
+        table = cls()
+        for media_condition, added_reactions, fluxes in GapfillJournal(path).entries():
+            table.add(media_condition, added_reactions)
+        return table
+
+    @classmethod
+    def from_directory(cls, path):
+        """
+        Read the solutions from a directory of gapfill_reactions_<media>.txt
+        files, one reaction per line.
+
+        :param path: The directory of solutions
+        :type path: string
+        :rtype: ReactionFrequencyTable
+        """
+        table = cls()
+        for filename in sorted(os.listdir(path)):
+            if not (filename.startswith('gapfill_reactions_') and
+                    filename.endswith('.txt')):
+                continue
+            with open(os.path.join(path, filename), 'r') as fin:
+                added_reactions = set(line.strip() for line in fin if line.strip())
+            table.add(filename[len('gapfill_reactions_'):-len('.txt')],
+                      added_reactions)
+        return table
+
+
+
+
+def media_count(threshold, n_media):
+    """
+    Convert a threshold to a number of media.  A threshold below 1 is a
+    fraction, and reactions added on more than that fraction of the media
+    are included; otherwise it is the number of media itself.
+
+    :param threshold: The threshold
+    :type threshold: float
+    :param n_media: The number of media in the frequency table
+    :type n_media: int
+    :rtype: int
+    """
+    if threshold < 1:
+        # Round off the float error first, so 0.29 of 100 media is 29
+        # rather than 28.999... and more than that is 30
+        return int(np.floor(round(threshold * n_media, 9))) + 1
+    return int(threshold)
+
+
+
+
+def sweep_rules(min_media, transport_min_media=(None,)):
+    """
+    The grid of rules.  Transport rules that would not add anything beyond
+    the frequency threshold are left out.
+
+    :param min_media: The frequency thresholds, as numbers of media
+    :type min_media: list
+    :param transport_min_media: The transport thresholds, as numbers of
+        media, with None for no transport rule
+    :type transport_min_media: list
+    :return: The rules, most frequent first
+    :rtype: list
+    """
+    rules = set()
+    for m, t in itertools.product(min_media, transport_min_media):
+        if t is not None and t >= m:
+            t = None
+        rules.add(SweepRule(m, t))
+    return sorted(rules, key=lambda r: (-r.min_media, -(r.transport_min_media or 0)))
+
+
+
+
+def _init_worker(compounds, reactions, reactions_to_run, disabled,
+                 biomass_equation, media_dir, universe=None, backend=None):
+    """
+    Build the FBA model for the union of the models once in a worker
+    process, and keep the reactions each rule switches off.  Without a
+    reactions dictionary the model is built from the universe alone.
+    """
+    if universe is None:
+        universe = get_reaction_universe(reactions)
+    fba = IncrementalFBA(compounds, reactions, set(), biomass_equation,
+                         universe=universe, backend=backend,
+                         n_reactions=len(reactions_to_run))
+    fba.add_reactions(reactions_to_run)
+    _worker_state['fba'] = fba
+    _worker_state['disabled'] = disabled
+    _worker_state['media_dir'] = media_dir
+
+
+
+
+def _close_worker():
+    """
+    Free the FBA model of an inline run.
+    """
+    _worker_state.pop('fba').close()
+    _worker_state.clear()
+
+
+
+
+def _sweep_worker(media_condition):
+    """
+    Predict growth on a single media condition for every rule, switching
+    reactions off and on in the worker's model instead of rebuilding it.
+    """
+    media = PyFBA.parse.read_media_file(_worker_state['media_dir'] +
+                                        media_condition + '.txt')
+    fba = _worker_state['fba']
+    fba.set_media(media)
+    growth = []
+    for disabled in _worker_state['disabled']:
+        fba.enable_reactions(fba.disabled - disabled)
+        fba.disable_reactions(disabled - fba.disabled)
+        status, value, grows = fba.solve()
+        growth.append(int(grows))
+    return media_condition, growth
+
+
+
+
+def sweep_growth(compounds, reactions, base_reactions, table, rules,
+                 biomass_equation, exp_growth_results, media_dir, processes=1,
+                 backend=None):
+    """
+    Assemble a model for each rule and score its growth predictions against
+    the phenotype data, all in one run.
+
+    One FBA model is built for the union of the models (once per worker
+    process when more than one process is used).  For each media condition
+    the models are solved in turn by switching off the gap-filled reactions
+    a rule leaves out, so the matrix is shared and each solve is warm
+    started from the previous one.  The rules are most frequent first, so
+    consecutive models differ by few reactions.
+
+    :param compounds: The dictionary of compounds from the Model SEED database
+    :type compounds: dict
+    :param reactions: The dictionary of reactions from the Model SEED database
+    :type reactions: dict
+    :param base_reactions: The reactions in every model, e.g. the draft model
+        and the reactions gap-filled on rich media
+    :type base_reactions: set
+    :param table: The gap-filling solutions
+    :type table: ReactionFrequencyTable
+    :param rules: The rules to assemble models with
+    :type rules: list
+    :param biomass_equation: The biomass equation as a Reaction object
+    :type biomass_equation: metabolism.Reaction object
+    :param exp_growth_results: A dictionary of media condition to observed
+        growth (1 or 0)
+    :type exp_growth_results: dict
+    :param media_dir: Directory containing the PyFBA media files
+    :type media_dir: string
+    :param processes: Number of worker processes
+    :type processes: int
+    :param backend: The LP backend, by name or as a (name, options) pair
+        (see lp_backends.make_backend())
+    :type backend: string or tuple
+    :return: A list of (rule, number of reactions, score) tuples in the
+        order of the rules, where the score is from score_predictions()
+    :rtype: list
+    """
+    transport = set(r for r in table.reaction_ids
+                    if r in reactions and reactions[r].is_transport)
+    models = [set(base_reactions) | table.reactions(rule, transport)
+              for rule in rules]
+    reactions_to_run = set().union(*models) if models else set(base_reactions)
+    disabled = [reactions_to_run - model for model in models]
+
+    media_conditions = sorted(exp_growth_results)
+    if processes is None:
+        processes = multiprocessing.cpu_count()
+    processes = max(1, min(processes, len(media_conditions)))
+
+    chunksize = max(1, len(media_conditions) // (4 * processes))
+    if processes == 1:
+        results = list(run_tasks(_sweep_worker, media_conditions, _init_worker,
+                                 (compounds, reactions, reactions_to_run,
+                                  disabled, biomass_equation, media_dir, None,
+                                  backend),
+                                 finalizer=_close_worker))
+    else:
+        with publish_reaction_universe(get_reaction_universe(reactions)) as shared:
+            results = list(run_tasks(_sweep_worker, media_conditions, _init_worker,
+                                     (None, None, reactions_to_run, disabled,
+                                      biomass_equation, media_dir, shared,
+                                      backend),
+                                     processes, chunksize))
+
+    sweep = []
+    for i, rule in enumerate(rules):
+        fba_growth_results = dict((m, growth[i]) for m, growth in results)
+        sweep.append((rule, len(models[i]),
+                      score_predictions(fba_growth_results, exp_growth_results)))
+    return sweep
+
+
+
+
+def write_sweep(sweep, path):
+    """
+    Write the accuracy of each rule to a tab-separated file.
+
+    :param sweep: The results of sweep_growth()
+    :type sweep: list
+    :param path: Filepath to write to
+    :type path: string
+    """
+    with open(path, 'w') as fout:
+        fout.write("MIN_MEDIA\tTRANSPORT_MIN_MEDIA\tREACTIONS\tTP\tTN\tFP\tFN\t"
+                   "ACCURACY\n")
+        for rule, n_reactions, results in sweep:
+            fout.write("{}\t{}\t{}\t{}\t{}\t{}\t{}\t{:.4f}\n".format(
+                rule.min_media,
+                '' if rule.transport_min_media is None else rule.transport_min_media,
+                n_reactions, len(results['tp']), len(results['tn']),
+                len(results['fp']), len(results['fn']), accuracy(results)))
+
+
+
+
+def accuracy(results):
+    """
+    The fraction of predictions that agree with the phenotype data.
+
+    :param results: The results of score_predictions()
+    :type results: dict
+    :rtype: float
+    """
+    total = sum(len(v) for v in results.values())
+    if not total:
+        return 0.0
+    return float(len(results['tp']) + len(results['tn'])) / total
+
+
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Assemble models from the '
+                                     'gap-filling solutions on many media with a '
+                                     'grid of frequency thresholds and score each '
+                                     'against phenotypic growth data')
+    parser.add_argument('-s', '--solutions',
+                        default='citrobacter_gapfilling_4/min_media_gapfill_journal.jsonl',
+                        help='Gap-filling journal, or directory of '
+                        'gapfill_reactions_<media>.txt files')
+    parser.add_argument('-b', '--base', nargs='+',
+                        default=['/Users/Taylor/anthill_backup/backup_archive/'
+                                 'citrobacter_gapfilling_4/citrobacter_draft_reactions.p',
+                                 '/Users/Taylor/anthill_backup/backup_archive/'
+                                 'citrobacter_gapfilling_4/ArgonneLB_added_reactions.p'],
+                        help='Pickled sets of reactions that are in every model')
+    parser.add_argument('-g', '--growth',
+                        default='/Users/Taylor/Desktop/c.sedlakii_growth.txt',
+                        help='Phenotypic growth data, a tab-separated file of '
+                        'media condition and growth (1 or 0) with a header line')
+    parser.add_argument('-m', '--media-dir',
+                        default='/Users/Taylor/gapfilling_metabolic_networks/PyFBA/media/',
+                        help='Directory containing the media files')
+    parser.add_argument('-t', '--thresholds', type=float, nargs='+',
+                        default=[0.5, 0.25, 0.1, 0.05, 2, 1],
+                        help='Frequency thresholds: a fraction of the media '
+                        '(reactions added on more than it are included) or a '
+                        'number of media (default: 0.5 0.25 0.1 0.05 2 1)')
+    parser.add_argument('--transport', type=int, nargs='*', default=[1],
+                        help='Also try each threshold with the transport '
+                        'reactions added on at least this many media (default: 1)')
+    parser.add_argument('-p', '--processes', type=int, default=1,
+                        help='Number of worker processes (default: 1)')
+    parser.add_argument('-o', '--output', default=None,
+                        help='Write the accuracy of each rule to this file')
+    parser.add_argument('--backend', type=parse_backend, default=DEFAULT_BACKEND,
+                        help='LP backend and options, e.g. highs:threads=2, or '
+                        'auto for the fastest backend calibrated by '
+                        'benchmark_gapfill.py --calibrate '
+                        '(default: {})'.format(DEFAULT_BACKEND))
+    args = parser.parse_args()
+
+    # Load the model seed database
+    compounds, reactions, enzymes =\
+        model_seed_cache.compounds_reactions_enzymes('gramnegative')
+    biomass_equation = PyFBA.metabolism.biomass_equation('gramnegative')
+
+    # Stream the gap-filling solutions into the frequency table
+    if os.path.isdir(args.solutions):
+        table = ReactionFrequencyTable.from_directory(args.solutions)
+    else:
+        table = ReactionFrequencyTable.from_journal(args.solutions)
+    n_media = len(table.media)
+    print("{} reactions were added in gap-filling on {} media".format(
+        len(table.reaction_ids), n_media))
+
+    base_reactions = set()
+    for path in args.base:
+        base_reactions.update(pickle.load(open(path, 'rb')))
+
+    # Load the experimental phenotypic growth data
+    exp_growth_results = {}
+    with open(args.growth, 'r') as fin:
+        for i, line in enumerate(fin):
+            if i == 0:
+                continue
+            condition, result = line.strip().split('\t')
+            exp_growth_results[condition] = int(result)
+
+    rules = sweep_rules(sorted(set(media_count(t, n_media) for t in args.thresholds)),
+                        [None] + args.transport)
+    sweep = sweep_growth(compounds, reactions, base_reactions, table, rules,
+                         biomass_equation, exp_growth_results,
+                         args.media_dir.rstrip('/') + '/',
+                         processes=args.processes, backend=args.backend)
+
+    print("\nMIN MEDIA\tTRANSPORT\tREACTIONS\tTP\tTN\tFP\tFN\tACCURACY")
+    for rule, n_reactions, results in sweep:
+        print("{}\t\t{}\t\t{}\t\t{}\t{}\t{}\t{}\t{:.1f} %".format(
+            rule.min_media,
+            '-' if rule.transport_min_media is None else rule.transport_min_media,
+            n_reactions, len(results['tp']), len(results['tn']),
+            len(results['fp']), len(results['fn']), 100 * accuracy(results)))
+    if args.output:
+        write_sweep(sweep, args.output)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+from __future__ import print_function
+import multiprocessing
+
+
+
+
+def run_tasks(function, tasks, initializer, initargs, processes=1, chunksize=1,
+              ordered=True, finalizer=None):
+    """
+    Run a function on each task in worker processes that are set up once by
+    an initializer, yielding the results as they are ready.
+
+    Each worker module keeps its per-process state (the Model SEED
+    database, an FBA model, ...) in a module-level dictionary filled by its
+    initializer, and the function reads it from there.  With one process
+    the initializer and the function run in this process, and the
+    finalizer, if there is one, is called afterwards to release the state.
+    With more processes the pool is terminated if anything goes wrong,
+    including the caller not reading all of the results.
+
+    :param function: The function called with each task
+    :type function: function
+    :param tasks: The tasks
+    :type tasks: iterable
+    :param initializer: The function that sets up a worker
+    :type initializer: function
+    :param initargs: The arguments of the initializer
+    :type initargs: tuple
+    :param processes: Number of worker processes
+    :type processes: int
+    :param chunksize: Number of tasks sent to a worker at a time
+    :type chunksize: int
+    :param ordered: Yield the results in the order of the tasks rather than
+        as they finish
+    :type ordered: bool
+    :param finalizer: Function called with no arguments once the tasks
+        have run in this process
+    :type finalizer: function
+    :return: The results of the function
+    :rtype: generator
+    """
+    if processes == 1:
+        initializer(*initargs)
+        try:
+            for task in tasks:
+                yield function(task)
+        finally:
+            if finalizer is not None:
+                finalizer()
+        return
+
+    pool = multiprocessing.Pool(processes, initializer=initializer,
+                                initargs=initargs)
+    finished = False
+    try:
+        if ordered:
+            results = pool.imap(function, tasks, chunksize)
+        else:
+            results = pool.imap_unordered(function, tasks, chunksize)
+        for result in results:
+            yield result
+        finished = True
+    finally:
+        # Anything that stops the results being read, including an error in
+        # a task or the generator being closed early, terminates the pool
+        if finished:
+            pool.close()
+        else:
+            pool.terminate()
+        pool.join()